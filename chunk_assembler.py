@@ -0,0 +1,245 @@
+# chunk_assembler.py
+"""
+分片直写组装器 - 下载端将解密后的分片直接写入最终文件的对应偏移
+
+首个非末尾分片到达时得知分片大小，随即按 total_chunks × chunk_size 预分配文件；
+每个分片写入偏移 (idx-1) × chunk_size，完成情况记录在位图中。全部到达后截断到
+实际长度并原子替换到目标路径，省去临时分片目录和合并阶段，每个字节只落盘一次。
+
+可变大小的分片（文件名携带字节偏移与文件大小）由 RangeAssembler 处理：按文件大小
+预分配，分片写入自身偏移，已覆盖的字节区间合并记录，覆盖整个文件时视为到齐。
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+
+def _write_at(fd: int, offset: int, data: bytes, io_lock: threading.Lock):
+    """按偏移写入；支持 pwrite 的平台并发写，否则以锁保护 seek+write"""
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    with io_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+def _open_part(part_path: str, preallocate_size: int) -> int:
+    os.makedirs(os.path.dirname(part_path) or '.', exist_ok=True)
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    fd = os.open(part_path, flags, 0o644)
+    os.ftruncate(fd, preallocate_size)
+    return fd
+
+
+def _remove_part(part_path: str):
+    try:
+        os.remove(part_path)
+    except OSError:
+        pass
+
+
+class ChunkAssembler:
+    """单个上传(upload_id)的分片组装器，线程安全"""
+
+    def __init__(self, part_path: str, total_chunks: int):
+        self.part_path = part_path
+        self.total_chunks = total_chunks
+        self.chunk_size: Optional[int] = None
+        self.last_chunk_len: Optional[int] = None
+        self.bitmap = bytearray(total_chunks)
+        self.received_count = 0
+        self.lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        # 锁外进行中的写入数；finalize/abort 等待其归零后才关闭文件
+        self._writes = 0
+        self._idle = threading.Condition(self.lock)
+        self._closed = False
+        # 分片大小未知时先到达的末尾分片暂存于内存（不超过一个分片大小）
+        self._pending_last: Optional[bytes] = None
+
+    def has_chunk(self, chunk_index: int) -> bool:
+        with self.lock:
+            return bool(self.bitmap[chunk_index - 1])
+
+    @property
+    def is_complete(self) -> bool:
+        return self.received_count == self.total_chunks
+
+    def _open(self, preallocate_size: int):
+        self._fd = _open_part(self.part_path, preallocate_size)
+
+    def _write_at(self, fd: int, offset: int, data: bytes):
+        _write_at(fd, offset, data, self._io_lock)
+
+    def _end_write(self):
+        with self.lock:
+            self._writes -= 1
+            self._idle.notify_all()
+
+    def write_chunk(self, chunk_index: int, data: bytes) -> bool:
+        """写入一个分片；返回 True 表示本次写入使全部分片到齐（仅返回一次）"""
+        is_last = chunk_index == self.total_chunks
+        with self.lock:
+            if self._closed or self.bitmap[chunk_index - 1]:
+                return False
+
+            if self.chunk_size is None:
+                if is_last and self.total_chunks > 1:
+                    self._pending_last = data
+                    self.last_chunk_len = len(data)
+                    return self._mark_received(chunk_index)
+                self.chunk_size = len(data)
+                self._open(self.chunk_size * self.total_chunks)
+            elif not is_last and len(data) != self.chunk_size:
+                raise ValueError(f"分片 {chunk_index} 大小异常: {len(data)} != {self.chunk_size}")
+
+            pending_last = self._pending_last
+            self._pending_last = None
+            fd = self._fd
+            self._writes += 1
+
+        # 实际写盘在组装器锁外进行，不同分片可并发写入
+        try:
+            if pending_last is not None:
+                self._write_at(fd, (self.total_chunks - 1) * self.chunk_size, pending_last)
+            self._write_at(fd, (chunk_index - 1) * self.chunk_size, data)
+        finally:
+            self._end_write()
+
+        with self.lock:
+            if is_last:
+                self.last_chunk_len = len(data)
+            return self._mark_received(chunk_index)
+
+    def _mark_received(self, chunk_index: int) -> bool:
+        if self.bitmap[chunk_index - 1]:
+            return False
+        self.bitmap[chunk_index - 1] = 1
+        self.received_count += 1
+        return self.is_complete
+
+    def finalize(self, final_path: str) -> int:
+        """等待进行中的写入结束后截断到实际长度并移动到最终路径，返回文件大小"""
+        with self.lock:
+            self._closed = True
+            self._idle.wait_for(lambda: self._writes == 0)
+            if self._fd is None:
+                raise ValueError("组装器已关闭")
+            total_size = (self.total_chunks - 1) * self.chunk_size + self.last_chunk_len
+            os.ftruncate(self._fd, total_size)
+            os.close(self._fd)
+            self._fd = None
+        os.replace(self.part_path, final_path)
+        return total_size
+
+    def abort(self):
+        """等待进行中的写入结束后放弃组装并删除部分文件"""
+        with self.lock:
+            self._closed = True
+            self._idle.wait_for(lambda: self._writes == 0)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        _remove_part(self.part_path)
+
+    @property
+    def progress(self) -> str:
+        return f"{self.received_count}/{self.total_chunks}"
+
+
+class RangeAssembler:
+    """可变大小分片的组装器：按字节偏移写入，以已覆盖区间判断是否到齐，线程安全
+
+    发送端续传时可能以不同大小重新切分同一区间，分片之间允许重叠（内容相同）。
+    """
+
+    def __init__(self, part_path: str, file_size: int):
+        self.part_path = part_path
+        self.file_size = file_size
+        self.received_count = 0
+        self.covered_bytes = 0
+        self.lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._covered: List[List[int]] = []   # 已写入的区间 [start, end)，升序且互不相邻
+        self._completed = False
+        self._closed = False
+        self._writes = 0
+        self._idle = threading.Condition(self.lock)
+        self._fd: Optional[int] = _open_part(part_path, file_size)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.covered_bytes == self.file_size
+
+    @property
+    def progress(self) -> str:
+        return f"{self.covered_bytes / self.file_size:.0%}" if self.file_size else "100%"
+
+    def _cover(self, start: int, end: int):
+        merged = []
+        for interval in self._covered:
+            if interval[1] < start or interval[0] > end:
+                merged.append(interval)
+            else:
+                start, end = min(start, interval[0]), max(end, interval[1])
+        merged.append([start, end])
+        merged.sort()
+        self._covered = merged
+        self.covered_bytes = sum(e - s for s, e in merged)
+
+    def write_range(self, offset: int, data: bytes) -> bool:
+        """写入一个分片；返回 True 表示本次写入使整个文件到齐（仅返回一次）"""
+        if offset < 0 or offset + len(data) > self.file_size:
+            raise ValueError(f"分片区间越界: {offset}+{len(data)} > {self.file_size}")
+        with self.lock:
+            # 已到齐或已关闭：重复/重叠的分片无需再写
+            if self._closed or self._fd is None or self._completed:
+                return False
+            fd = self._fd
+            self._writes += 1
+        try:
+            _write_at(fd, offset, data, self._io_lock)
+        finally:
+            with self.lock:
+                self._writes -= 1
+                self._idle.notify_all()
+        with self.lock:
+            if self._completed:
+                return False
+            self.received_count += 1
+            self._cover(offset, offset + len(data))
+            if self.is_complete and not self._completed:
+                self._completed = True
+                return True
+            return False
+
+    def finalize(self, final_path: str) -> int:
+        """等待进行中的写入结束后关闭并移动到最终路径，返回文件大小"""
+        with self.lock:
+            self._closed = True
+            self._idle.wait_for(lambda: self._writes == 0)
+            if self._fd is None:
+                raise ValueError("组装器已关闭")
+            os.close(self._fd)
+            self._fd = None
+        os.replace(self.part_path, final_path)
+        return self.file_size
+
+    def abort(self):
+        """等待进行中的写入结束后放弃组装并删除部分文件"""
+        with self.lock:
+            self._closed = True
+            self._idle.wait_for(lambda: self._writes == 0)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        _remove_part(self.part_path)
@@ -0,0 +1,118 @@
+# chunk_sizing.py
+"""
+自适应分片大小 - 按实测吞吐与失败率在上传过程中调整分片大小
+
+固定分片大小在不同链路上各有代价：分片过小时每片一次请求的固定开销占比高，
+分片过大时链路不稳定导致一次失败要重传整片。控制器记录每个分片的上传耗时与成败：
+- 成功：以吞吐的滑动平均估算"目标耗时内可传完的字节数"作为下一片大小，单次最多放大一倍
+- 失败：分片大小减半，失败率偏高时暂停放大
+大小始终限制在 [chunk_size_min_mb, chunk_size_max_mb] 内并按 64KB 对齐。
+每次调整都会通过 on_decision 回调输出原因，便于按日志调优。
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+ALIGNMENT = 64 * 1024
+# 吞吐与失败率的滑动平均权重
+EWMA_WEIGHT = 0.3
+# 失败率高于该值时不再放大分片
+MAX_GROWTH_ERROR_RATE = 0.2
+
+
+@dataclass
+class ChunkSizingSettings:
+    """自适应分片参数（来自 config.ini）"""
+    enabled: bool = True
+    min_bytes: int = 512 * 1024
+    max_bytes: int = 3 * 1024 * 1024
+    initial_bytes: int = 3 * 1024 * 1024
+    target_seconds: float = 4.0       # 单个分片期望的上传耗时
+    max_retries: int = 3              # 同一字节区间的最大重试次数
+
+    @classmethod
+    def from_config(cls, config, chunk_size_bytes: int) -> 'ChunkSizingSettings':
+        """chunk_size_mb 作为初始大小；未配置上限时以它为上限（服务器单次上传限制通常按它设置）"""
+        section = config['DEFAULT']
+        try:
+            enabled = section.get('adaptive_chunk_size', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+            min_bytes = int(float(section.get('chunk_size_min_mb', 0.5)) * 1024 * 1024)
+            max_mb = section.get('chunk_size_max_mb', '')
+            max_bytes = int(float(max_mb) * 1024 * 1024) if str(max_mb).strip() else chunk_size_bytes
+            target_seconds = float(section.get('chunk_target_seconds', 4))
+            max_retries = int(section.get('chunk_max_retries', 3))
+        except (TypeError, ValueError):
+            return cls(initial_bytes=chunk_size_bytes, max_bytes=chunk_size_bytes)
+        min_bytes = max(ALIGNMENT, min_bytes)
+        max_bytes = max(min_bytes, max_bytes)
+        return cls(enabled, min_bytes, max_bytes, min(max(chunk_size_bytes, min_bytes), max_bytes),
+                   max(0.5, target_seconds), max(0, max_retries))
+
+
+def _format_size(size: int) -> str:
+    return f"{size / 1024 ** 2:.2f}MB" if size >= 1024 ** 2 else f"{size / 1024:.0f}KB"
+
+
+class ChunkSizeController:
+    """单次传输的分片大小控制器（线程安全，多个上传线程共同反馈）"""
+
+    def __init__(self, settings: Optional[ChunkSizingSettings] = None,
+                 on_decision: Optional[Callable[[str], None]] = None):
+        self.settings = settings or ChunkSizingSettings()
+        self.on_decision = on_decision
+        self.lock = threading.Lock()
+        self._size = self._clamp(self.settings.initial_bytes)
+        self._throughput: Optional[float] = None   # 字节/秒
+        self._error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+
+    def _clamp(self, size: float) -> int:
+        size = int(size) // ALIGNMENT * ALIGNMENT
+        return max(self.settings.min_bytes, min(self.settings.max_bytes, size))
+
+    def next_size(self) -> int:
+        """下一个分片的大小；未启用自适应时固定为初始大小"""
+        with self.lock:
+            return self._size
+
+    @property
+    def throughput(self) -> Optional[float]:
+        with self.lock:
+            return self._throughput
+
+    def record(self, length: int, seconds: float, ok: bool):
+        """反馈一个分片的上传结果并据此调整下一片大小"""
+        with self.lock:
+            self.samples += 1
+            self._error_rate = (1 - EWMA_WEIGHT) * self._error_rate + EWMA_WEIGHT * (0.0 if ok else 1.0)
+            if ok and seconds > 0:
+                rate = length / seconds
+                self._throughput = rate if self._throughput is None else (
+                    (1 - EWMA_WEIGHT) * self._throughput + EWMA_WEIGHT * rate)
+            if not ok:
+                self.failures += 1
+            if not self.settings.enabled:
+                return
+
+            old_size = self._size
+            if not ok:
+                new_size = self._clamp(old_size / 2)
+                reason = "上传失败"
+            elif self._throughput is None:
+                return
+            else:
+                ideal = self._throughput * self.settings.target_seconds
+                if self._error_rate > MAX_GROWTH_ERROR_RATE:
+                    ideal = min(ideal, old_size)
+                new_size = self._clamp(min(ideal, old_size * 2))
+                reason = "吞吐变化" if new_size != old_size else ""
+            self._size = new_size
+            message = None
+            if new_size != old_size:
+                message = (f"分片大小 {_format_size(old_size)} → {_format_size(new_size)} ({reason}, "
+                           f"本片 {_format_size(length)}/{seconds:.2f}s, "
+                           f"吞吐 {(self._throughput or 0) / 1024 ** 2:.2f}MB/s, 失败率 {self._error_rate:.0%})")
+        if message and self.on_decision:
+            self.on_decision(message)
@@ -0,0 +1,182 @@
+# clipboard_backend.py
+"""
+剪切板后端 - 统一剪切板读写接口，并提供廉价的"是否变化"探测
+
+监听线程每次轮询只调用 change_token()（Windows 下为剪切板序列号，不复制内容），
+序列号变化后才读取文本/文件列表，大段剪切板内容每次变化只读取一次。
+
+- Win32ClipboardBackend: GetClipboardSequenceNumber 探测，支持文本与文件(CF_HDROP)
+- PyperclipBackend: 跨平台文本读写，无变化探测能力，每次轮询都需读取内容
+- FakeClipboardBackend: 内存剪切板，供 Linux 下测试监听逻辑
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Hashable, List, Optional
+
+# 剪切板操作库（均为可选依赖，缺失时退化到可用的后端）
+try:
+    import pyperclip
+    PYPERCLIP_AVAILABLE = True
+except ImportError:
+    PYPERCLIP_AVAILABLE = False
+
+try:
+    import win32clipboard
+    import win32con
+    WIN32_AVAILABLE = True
+except ImportError:
+    WIN32_AVAILABLE = False
+
+
+class ClipboardBackend(ABC):
+    """剪切板后端接口"""
+
+    # 是否支持文件剪切板
+    supports_files = False
+
+    def change_token(self) -> Optional[Hashable]:
+        """廉价的变化标识：内容变化时标识随之改变；返回 None 表示不支持探测"""
+        return None
+
+    @abstractmethod
+    def get_text(self) -> str:
+        ...
+
+    @abstractmethod
+    def set_text(self, text: str):
+        ...
+
+    def get_file_paths(self) -> List[str]:
+        return []
+
+
+class PyperclipBackend(ClipboardBackend):
+    """pyperclip 文本剪切板（跨平台）"""
+
+    def get_text(self) -> str:
+        return pyperclip.paste() or ''
+
+    def set_text(self, text: str):
+        pyperclip.copy(text)
+
+
+class Win32ClipboardBackend(ClipboardBackend):
+    """Windows 剪切板：序列号探测 + 文本/文件读取"""
+
+    supports_files = True
+
+    def change_token(self) -> Optional[Hashable]:
+        # 序列号由系统在每次剪切板内容变化时递增，无需打开剪切板
+        return win32clipboard.GetClipboardSequenceNumber()
+
+    def get_text(self) -> str:
+        if PYPERCLIP_AVAILABLE:
+            return pyperclip.paste() or ''
+        win32clipboard.OpenClipboard()
+        try:
+            if win32clipboard.IsClipboardFormatAvailable(win32con.CF_UNICODETEXT):
+                return win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT) or ''
+            return ''
+        finally:
+            win32clipboard.CloseClipboard()
+
+    def set_text(self, text: str):
+        if PYPERCLIP_AVAILABLE:
+            pyperclip.copy(text)
+            return
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardText(text, win32con.CF_UNICODETEXT)
+        finally:
+            win32clipboard.CloseClipboard()
+
+    def get_file_paths(self) -> List[str]:
+        win32clipboard.OpenClipboard()
+        try:
+            if win32clipboard.IsClipboardFormatAvailable(win32con.CF_HDROP):
+                paths = win32clipboard.GetClipboardData(win32con.CF_HDROP)
+                return list(paths) if paths else []
+            return []
+        finally:
+            win32clipboard.CloseClipboard()
+
+
+class FakeClipboardBackend(ClipboardBackend):
+    """内存剪切板（测试用）：每次写入序列号加一，并统计内容读取次数"""
+
+    supports_files = True
+
+    def __init__(self, text: str = '', file_paths: Optional[List[str]] = None):
+        self.lock = threading.Lock()
+        self._text = text
+        self._file_paths = list(file_paths or [])
+        self.sequence = 0
+        self.read_count = 0
+
+    def change_token(self) -> Optional[Hashable]:
+        with self.lock:
+            return self.sequence
+
+    def get_text(self) -> str:
+        with self.lock:
+            self.read_count += 1
+            return self._text
+
+    def set_text(self, text: str):
+        with self.lock:
+            self._text = text
+            self._file_paths = []
+            self.sequence += 1
+
+    def get_file_paths(self) -> List[str]:
+        with self.lock:
+            self.read_count += 1
+            return list(self._file_paths)
+
+    def set_file_paths(self, file_paths: List[str]):
+        with self.lock:
+            self._file_paths = list(file_paths)
+            self._text = ''
+            self.sequence += 1
+
+
+class ClipboardChangeProbe:
+    """剪切板变化探测：记住上次的变化标识，标识不变时跳过内容读取"""
+
+    def __init__(self, backend: ClipboardBackend):
+        self.backend = backend
+        self._last_token = None
+        self._primed = False
+
+    def has_changed(self) -> bool:
+        """自上次调用以来剪切板是否可能变化；后端不支持探测时总是返回 True"""
+        token = self.backend.change_token()
+        if token is None:
+            return True
+        if self._primed and token == self._last_token:
+            return False
+        self._last_token = token
+        self._primed = True
+        return True
+
+    def reset(self):
+        """下一次 has_changed() 视为已变化（重新开始监听时调用）"""
+        self._primed = False
+
+
+def create_clipboard_backend(config=None) -> ClipboardBackend:
+    """按配置 clipboard_backend(auto/win32/pyperclip/fake) 创建后端；auto 优先使用 Win32"""
+    name = 'auto'
+    if config is not None:
+        name = config['DEFAULT'].get('clipboard_backend', 'auto').strip().lower()
+
+    if name == 'fake':
+        return FakeClipboardBackend()
+    if name in ('auto', 'win32') and WIN32_AVAILABLE:
+        return Win32ClipboardBackend()
+    if PYPERCLIP_AVAILABLE:
+        return PyperclipBackend()
+    print("警告: 未找到可用的剪切板库，使用内存剪切板")
+    return FakeClipboardBackend()
@@ -0,0 +1,122 @@
+# clipboard_guard.py
+"""
+剪切板循环防护的基础结构 - 固定内存、常数时间检查
+
+- RecentlySeen: 最近出现过的键（内容摘要/文件路径），按插入顺序淘汰并带有效期
+- TokenBucket: 令牌桶限速，替代逐条记录时间戳的滑动窗口
+- ContentHasher: 分段计算文本摘要，内容未变化时直接返回上次结果
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class RecentlySeen:
+    """有界的"最近出现过"集合：超出容量淘汰最早加入的键，超过有效期的键视为未出现"""
+
+    def __init__(self, max_entries: int = 50, ttl_seconds: Optional[float] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def _expire(self, now: float):
+        if self.ttl_seconds is None:
+            return
+        cutoff = now - self.ttl_seconds
+        # 按加入时间有序，只需从最早的一端弹出
+        while self._entries:
+            key, added_at = next(iter(self._entries.items()))
+            if added_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire(time.time())
+        return key in self._entries
+
+    def add(self, key: Hashable):
+        """加入（或刷新）一个键，超出容量时淘汰最早的键"""
+        now = time.time()
+        self._expire(now)
+        self._entries[key] = now
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        self._expire(time.time())
+        return len(self._entries)
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每秒补充 refill_rate 个令牌"""
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = max(1.0, float(capacity))
+        self.refill_rate = refill_rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, max_events: int) -> 'TokenBucket':
+        """每分钟最多 max_events 次，允许一次性突发到上限"""
+        return cls(max_events, max_events / 60.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """有足够令牌时扣除并返回 True，否则返回 False（不扣除）"""
+        self._refill()
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    @property
+    def used(self) -> int:
+        """尚未恢复的令牌数，近似为最近一分钟内的事件数"""
+        return round(self.capacity - self.available)
+
+    def reset(self):
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+
+class ContentHasher:
+    """文本摘要：分段编码后增量哈希，避免为大段文本一次性生成完整字节副本；同一内容只计算一次"""
+
+    SLICE_CHARS = 256 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._last_text: Optional[str] = None
+        self._last_digest: Optional[str] = None
+
+    def digest(self, text: str) -> str:
+        with self.lock:
+            if self._last_text is not None and (text is self._last_text or text == self._last_text):
+                return self._last_digest
+
+        hasher = hashlib.blake2b(digest_size=16)
+        for start in range(0, len(text), self.SLICE_CHARS):
+            hasher.update(text[start:start + self.SLICE_CHARS].encode('utf-8', 'surrogatepass'))
+        digest = hasher.hexdigest()
+
+        with self.lock:
+            self._last_text = text
+            self._last_digest = digest
+        return digest
@@ -1,34 +1,228 @@
-# config_manager.py (v1.1 - 懒加载版)
+# config_manager.py (v1.2 - 懒加载 + 配置快照版)
 
 import configparser
 import json
 import time
+import atexit
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from collections.abc import Mapping
+from types import MappingProxyType
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import os # Added for BOM detection
+import urllib.parse
+
+class ConfigSection(Mapping):
+    """
+    只读配置节：键不区分大小写（与 ConfigParser 一致），附带类型化读取方法。
+    """
+    def __init__(self, values):
+        self._values = MappingProxyType({key.lower(): value for key, value in values.items()})
+
+    def __getitem__(self, key):
+        return self._values[key.lower()]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and key.lower() in self._values
+
+    def get(self, key, default=None):
+        return self._values.get(key.lower(), default)
+
+    def get_str(self, key, default=''):
+        value = self.get(key)
+        return default if value is None else value
+
+    def get_int(self, key, default=0):
+        try:
+            return int(self._values[key.lower()])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_float(self, key, default=0.0):
+        try:
+            return float(self._values[key.lower()])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        if value is None:
+            return default
+        lowered = value.strip().lower()
+        if lowered in ('1', 'true', 'yes', 'on'):
+            return True
+        if lowered in ('0', 'false', 'no', 'off'):
+            return False
+        return default
+
+
+class ServerEndpoints:
+    """
+    由配置快照一次性构建的服务器端点与请求头，供各请求直接复用，避免每次请求重新拼接字符串和字典。
+    请求头为只读映射；需要附加字段时以 dict(headers, ...) 派生新字典。
+    """
+    USER_AGENT = 'Mozilla/5.0'
+    UPLOAD_ACCEPT = 'application/json, text/javascript, */*; q=0.01'
+
+    def __init__(self, cookie, upload_url, query_url, base_download_url, delete_url_template):
+        self.cookie = cookie
+        self.upload_url = upload_url
+        self.query_url = query_url
+        self.base_download_url = base_download_url
+        self.delete_url_template = delete_url_template
+        # 删除地址模板预先拆分为前后缀，只含 {file_id} 占位符时直接拼接
+        prefix, placeholder, suffix = delete_url_template.partition('{file_id}')
+        self._delete_parts = (prefix, suffix) if placeholder and '{' not in prefix + suffix else None
+
+        self.auth_headers = MappingProxyType({'Cookie': cookie})
+        self.request_headers = MappingProxyType({'Cookie': cookie, 'User-Agent': self.USER_AGENT})
+        self.upload_headers = MappingProxyType({
+            'Accept': self.UPLOAD_ACCEPT,
+            'Cookie': cookie,
+            'User-Agent': self.USER_AGENT
+        })
+
+    @classmethod
+    def from_config(cls, config):
+        section = config['DEFAULT']
+        return cls(
+            cookie=section.get('COOKIE', ''),
+            upload_url=section.get('UPLOAD_URL', ''),
+            query_url=section.get('QUERY_URL', ''),
+            base_download_url=section.get('BASE_DOWNLOAD_URL', ''),
+            delete_url_template=section.get('DELETE_URL_TEMPLATE', '')
+        )
+
+    def download_url(self, file_url):
+        return self.base_download_url + file_url
+
+    def delete_url(self, file_id):
+        if self._delete_parts is not None:
+            return f"{self._delete_parts[0]}{file_id}{self._delete_parts[1]}"
+        return self.delete_url_template.format(file_id=file_id)
+
+    def with_cookie(self, cookie):
+        """同一组端点换用新Cookie（Cookie热更新时使用）"""
+        return ServerEndpoints(cookie, self.upload_url, self.query_url,
+                               self.base_download_url, self.delete_url_template)
+
+    def with_origin(self, origin):
+        """将全部端点的协议和主机替换为 origin（如 http://127.0.0.1:8000），用于指向本地测试服务器"""
+        target = urllib.parse.urlsplit(origin)
+
+        def rebase(url):
+            return urllib.parse.urlsplit(url)._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+
+        return ServerEndpoints(self.cookie, rebase(self.upload_url), rebase(self.query_url),
+                               rebase(self.base_download_url), rebase(self.delete_url_template))
+
+
+def endpoints_of(config):
+    """获取配置对应的端点：配置快照上已预先构建，普通 ConfigParser 则即时构建"""
+    endpoints = getattr(config, 'endpoints', None)
+    return endpoints if endpoints is not None else ServerEndpoints.from_config(config)
+
+
+class ConfigSnapshot(Mapping):
+    """
+    不可变的配置快照：加载时一次解析完毕，读取路径上没有文件I/O和ConfigParser复制。
+    用法与 ConfigParser 相同（config['DEFAULT'].get(...)），并提供针对DEFAULT节的类型化读取；
+    endpoints 为随快照一起构建的 ServerEndpoints，快照替换时端点随之原子替换。
+    """
+    def __init__(self, parser, mtime=None, size=None):
+        sections = {'DEFAULT': ConfigSection(parser.defaults())}
+        for name in parser.sections():
+            sections[name] = ConfigSection(parser[name])
+        self._sections = MappingProxyType(sections)
+        self.mtime = mtime
+        self.size = size
+        self.loaded_at = time.time()
+        self.endpoints = ServerEndpoints.from_config(self)
+        # server_origin 可把全部端点指向另一台服务器（如本地测试服务）
+        origin = self.defaults.get('server_origin')
+        if origin:
+            self.endpoints = self.endpoints.with_origin(origin)
+
+    def __getitem__(self, name):
+        return self._sections[name]
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __len__(self):
+        return len(self._sections)
+
+    @property
+    def defaults(self):
+        return self._sections['DEFAULT']
+
+    def get_str(self, key, default=''):
+        return self.defaults.get_str(key, default)
+
+    def get_int(self, key, default=0):
+        return self.defaults.get_int(key, default)
+
+    def get_float(self, key, default=0.0):
+        return self.defaults.get_float(key, default)
+
+    def get_bool(self, key, default=False):
+        return self.defaults.get_bool(key, default)
+
 
 class ConfigManager:
     """
     修改：__init__不再立即加载配置，实现"懒加载"，避免在主线程中产生I/O阻塞。
+    get_config 返回内存中的不可变快照，仅在文件 mtime/大小变化时重新解析。
+    set_cookie 只在内存中原子替换快照并通知订阅者，写盘由防抖定时器在后台合并完成。
     """
+    DEFAULT_PERSIST_DEBOUNCE_SECONDS = 2.0
+
     def __init__(self, config_file='config.ini'):
         self.config_file = config_file
         # 禁用插值功能，避免百分号编码问题
         self.config = configparser.ConfigParser(interpolation=None)
         self.lock = threading.Lock()
+        self._snapshot = None
+        # Cookie热更新：尚未写盘的Cookie、防抖写盘定时器、变更订阅者
+        self._pending_cookie = None
+        self._persist_timer = None
+        self._atexit_registered = False
+        self._listeners = []
         # --- 核心修改：移除这里的 self.load_config() 调用 ---
 
+    def _file_signature(self):
+        """配置文件的 (mtime, 大小)，文件不存在时为 (None, None)"""
+        try:
+            stat = os.stat(self.config_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None, None
+
+    def _reload_locked(self):
+        """重新解析配置文件并替换快照（调用方持有锁）"""
+        # 重新创建config对象，确保禁用插值
+        self.config = configparser.ConfigParser(interpolation=None)
+        
+        # 检查并处理BOM问题
+        self._ensure_config_file_valid()
+        
+        self.config.read(self.config_file, encoding='utf-8')
+        # 尚未写盘的Cookie优先于文件中的旧值，外部编辑配置文件不会丢失刚同步的Cookie
+        if self._pending_cookie is not None:
+            self.config['DEFAULT']['COOKIE'] = self._pending_cookie
+        mtime, size = self._file_signature()
+        self._snapshot = ConfigSnapshot(self.config, mtime, size)
+        return self._snapshot
+
     def load_config(self):
-        """从磁盘加载最新的配置。"""
+        """从磁盘加载最新的配置，返回配置快照。"""
         with self.lock:
-            # 重新创建config对象，确保禁用插值
-            self.config = configparser.ConfigParser(interpolation=None)
-            
-            # 检查并处理BOM问题
-            self._ensure_config_file_valid()
-            
-            self.config.read(self.config_file, encoding='utf-8')
-            return self.config
+            return self._reload_locked()
     
     def _ensure_config_file_valid(self):
         """确保配置文件格式有效，处理BOM等问题"""
@@ -55,41 +249,89 @@ class ConfigManager:
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 配置文件修复异常: {e}")
     
     def get_config(self):
-        """获取当前内存中的配置的一个安全副本。"""
+        """获取当前配置快照；文件未变化时直接返回内存中的快照（只读，可跨线程共享）。"""
+        snapshot = self._snapshot
+        if snapshot is not None and (snapshot.mtime, snapshot.size) == self._file_signature():
+            return snapshot
         with self.lock:
-            # 创建新的config对象，禁用插值功能
-            config_copy = configparser.ConfigParser(interpolation=None)
-            
-            # 确保配置文件有效
-            self._ensure_config_file_valid()
-            
-            config_copy.read_dict(self.config)
-            return config_copy
+            snapshot = self._snapshot
+            if snapshot is None or (snapshot.mtime, snapshot.size) != self._file_signature():
+                snapshot = self._reload_locked()
+            return snapshot
+
+    def add_listener(self, callback):
+        """订阅Cookie变更：callback(新配置快照) 在替换快照后立即调用"""
+        with self.lock:
+            self._listeners.append(callback)
 
     def set_cookie(self, cookie_value):
-        """线程安全地更新配置文件中的Cookie值。"""
+        """线程安全地热更新Cookie：内存快照立即生效并通知订阅者，写盘延后合并。"""
         try:
+            # 安全处理Cookie字符串，避免字符串插值语法错误
+            safe_cookie = self._sanitize_cookie(cookie_value)
             with self.lock:
-                # 重新加载配置，确保使用最新的
-                self.config = configparser.ConfigParser(interpolation=None)
+                current = self._snapshot if self._snapshot is not None else self._reload_locked()
+                if current['DEFAULT'].get('COOKIE') == safe_cookie:
+                    # 油猴脚本会重复推送相同Cookie，无变化时不替换快照也不写盘
+                    return True
                 
-                # 确保配置文件有效
-                self._ensure_config_file_valid()
-                
-                self.config.read(self.config_file, encoding='utf-8')
-                # 安全处理Cookie字符串，避免字符串插值语法错误
-                safe_cookie = self._sanitize_cookie(cookie_value)
                 self.config['DEFAULT']['COOKIE'] = safe_cookie
+                # 快照沿用当前文件签名：写盘前 get_config 继续返回内存中的新快照
+                snapshot = ConfigSnapshot(self.config, current.mtime, current.size)
+                self._snapshot = snapshot
+                self._pending_cookie = safe_cookie
+                self._schedule_persist_locked(snapshot.get_float(
+                    'cookie_persist_debounce_seconds', self.DEFAULT_PERSIST_DEBOUNCE_SECONDS))
+                listeners = list(self._listeners)
+            
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Cookie updated in memory, persisting to {self.config_file} shortly.")
+            for callback in listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Cookie listener error: {e}")
+            return True
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Error updating Cookie: {e}")
+            return False
+
+    def _schedule_persist_locked(self, delay):
+        """（重新）启动防抖写盘定时器，连续更新只写最后一次（调用方持有锁）"""
+        if self._persist_timer is not None:
+            self._persist_timer.cancel()
+        self._persist_timer = threading.Timer(delay, self.flush)
+        self._persist_timer.daemon = True
+        self._persist_timer.start()
+        if not self._atexit_registered:
+            # 进程退出前写入尚未落盘的Cookie
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def flush(self):
+        """将尚未写盘的Cookie写入配置文件"""
+        try:
+            with self.lock:
+                if self._pending_cookie is None:
+                    return
+                self._persist_timer = None
+                
+                # 重新读取文件，保留其他进程或用户对配置文件的修改
+                parser = configparser.ConfigParser(interpolation=None)
+                self._ensure_config_file_valid()
+                parser.read(self.config_file, encoding='utf-8')
+                parser['DEFAULT']['COOKIE'] = self._pending_cookie
                 
                 # 写入配置文件时确保不产生BOM
-                with open(self.config_file, 'w', encoding='utf-8-sig') as configfile:
-                    self.config.write(configfile)
+                with open(self.config_file, 'w', encoding='utf-8') as configfile:
+                    parser.write(configfile)
                 
-                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Cookie in {self.config_file} updated successfully.")
-                return True
+                self._pending_cookie = None
+                self.config = parser
+                mtime, size = self._file_signature()
+                self._snapshot = ConfigSnapshot(parser, mtime, size)
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Cookie in {self.config_file} updated successfully.")
         except Exception as e:
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Error updating Cookie: {e}")
-            return False
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Error persisting Cookie: {e}")
     
     def _sanitize_cookie(self, cookie_string):
         """安全处理Cookie字符串，处理特殊字符和编码问题"""
@@ -118,7 +360,6 @@ class ConfigManager:
             # 如果处理失败，返回安全的默认值
             return ""
 
-# ... (CookieUpdateHandler 和 run_cookie_server 保持不变) ...
 class CookieUpdateHandler(BaseHTTPRequestHandler):
     config_manager_instance = None
     
@@ -176,6 +417,8 @@ def run_cookie_server(config_manager, port=28570):
     class HandlerWithManager(CookieUpdateHandler): 
         config_manager_instance = config_manager
     server_address = ('localhost', port)
-    httpd = HTTPServer(server_address, HandlerWithManager)
+    # 多线程处理请求：浏览器脚本连续推送时互不阻塞
+    httpd = ThreadingHTTPServer(server_address, HandlerWithManager)
+    httpd.daemon_threads = True
     print(f"集成Cookie服务已在 http://localhost:{port} 上启动...")
     httpd.serve_forever()
\ No newline at end of file
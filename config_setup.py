@@ -39,7 +39,49 @@ def create_config():
         'DOWNLOAD_DIR': './downloads/',
         'POLL_INTERVAL_SECONDS': '10',
         'MAX_FILE_SIZE_MB': '6',  # 上传大小上限
-        'CHUNK_SIZE_MB': '3'  # 新增：定义分片大小，应略小于上限
+        'CHUNK_SIZE_MB': '3',  # 新增：定义分片大小，应略小于上限
+        'PAYLOAD_VERSION': '2',  # 载荷格式：2=二进制信封，1=旧版Fernet+JSON
+        'STREAM_SEGMENT_KB': '1024',  # 流式加密段大小，决定大文件上传时的内存上限
+        'UPLOAD_MAX_IN_FLIGHT_CHUNKS': '4',  # 分片流水线同时在途的最大分片数
+        'ENCRYPT_WORKERS': '2',  # 分片加密线程数
+        'UPLOAD_PIPELINE_MEMORY_MB': '32',  # 分片流水线内存上限
+        'HTTP_RETRIES': '3',  # 幂等请求（查询/下载/删除）失败重试次数
+        'HTTP_BACKOFF_SECONDS': '0.5',  # 重试退避基数（指数增长）
+        'UPLOAD_STATE_DIR': './upload_state/',  # 断点续传清单目录
+        'RESUME_MANIFEST_TTL_HOURS': '24',  # 续传清单有效期
+        'DOWNLOAD_SPOOL_MEMORY_MB': '4',  # 下载缓冲内存上限(MB)，超出后落盘
+        'BURST_POLL_INTERVAL_SECONDS': '0.5',  # 发现新上传后的快速轮询间隔
+        'BURST_WINDOW_SECONDS': '5',  # 快速轮询持续时间
+        'CHANGE_NOTIFY_PORT': '0',  # 本地变更提示服务端口，0为不启用
+        'COOKIE_PERSIST_DEBOUNCE_SECONDS': '2',  # Cookie同步后延迟合并写盘的时间
+        'AUTH_WAIT_TIMEOUT_SECONDS': '600',  # 登录失效后等待Cookie刷新的最长时间
+        'DEDUP_MAX_ENTRIES': '1000',  # 上传去重索引最多保留的条目数
+        'DEDUP_TTL_HOURS': '24',  # 上传去重记录有效期，过期后相同内容可再次上传
+        'CLIPBOARD_BACKEND': 'auto',  # 剪切板后端：auto/win32/pyperclip/fake(内存剪切板，测试用)
+        'CLIPBOARD_DEBOUNCE_SECONDS': '0.4',  # 剪切板连续变化的去抖窗口，窗口内只上传最后一次
+        'UPLOAD_TASK_WORKERS': '3',  # 同时进行的大文件上传数（分片并发由 TRANSFER_BULK_WORKERS 限制）
+        'UPLOAD_TASK_QUEUE_LIMIT': '16',  # 上传任务排队上限，超出后剪切板变化合并等待
+        'UI_LOG_MAX_LINES': '500',  # 界面活动日志保留的行数
+        'LOG_DIR': './logs/',  # 完整日志文件目录，留空则不写文件
+        'LOG_FILE_MAX_MB': '5',  # 单个日志文件大小上限，超出后轮转
+        'LOG_FILE_BACKUP_COUNT': '3',  # 保留的轮转日志文件数
+        'COMPRESSION': 'auto',  # 加密前压缩：auto(即zlib)/zlib/lzma/zstd/off；zstd 需两端都安装 zstandard
+        'COMPRESSION_MIN_RATIO': '0.9',  # 采样压缩后体积超过原始体积的该比例时不压缩
+        'BUNDLE_SMALL_FILES': 'true',  # 多个小文件打包为一个载荷上传（仅v2载荷）
+        'BUNDLE_MAX_MB': '4',  # 单个打包载荷的大小上限
+        'BUNDLE_MAX_FILES': '200',  # 单个打包载荷的文件数上限
+        'DELTA_TRANSFER': 'false',  # 增量传输：下载端发布文件签名，上传端只发送变化的块（两端都需开启）
+        'DELTA_MIN_MB': '8',  # 参与增量传输的最小文件大小
+        'DELTA_BLOCK_KB': '64',  # 签名分块大小
+        'DELTA_MAX_PATCH_RATIO': '0.5',  # 需发送的字节超过文件大小的该比例时改为完整上传
+        'ADAPTIVE_CHUNK_SIZE': 'true',  # 按实测吞吐与失败率调整分片大小（分片名携带字节偏移，需新版下载端；PAYLOAD_VERSION=1 时不生效）
+        'CHUNK_SIZE_MIN_MB': '0.5',  # 自适应分片大小下限
+        'CHUNK_SIZE_MAX_MB': '3',  # 自适应分片大小上限，不应超过服务器单次上传限制
+        'CHUNK_TARGET_SECONDS': '4',  # 单个分片期望的上传耗时
+        'CHUNK_MAX_RETRIES': '3',  # 同一区间上传失败后按更小分片重试的次数
+        'TRANSFER_INTERACTIVE_WORKERS': '2',  # 剪切板文本/单个载荷的并发数（独立名额，不受大文件影响）
+        'TRANSFER_SMALL_WORKERS': '2',  # 小文件、打包载荷及删除/合并等短任务的并发数
+        'TRANSFER_BULK_WORKERS': '3'  # 大文件分片的总并发数，多个大文件按上传轮转
 
     }
     
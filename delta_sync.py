@@ -0,0 +1,382 @@
+# delta_sync.py
+"""
+增量传输 - 只上传相对下载端已有版本发生变化的块（rsync 式）
+
+1. 下载端保存一个大文件后，计算其分块签名（滚动弱校验 + 强摘要），
+   加密后以 delta_sig_*.encrypted 上传到服务器
+2. 上传端上传同名大文件前取回签名（取回后删除服务器上的签名文件），在新文件上滚动匹配，
+   只把未命中的字节与"复制第N块"指令组成补丁，作为带 DELTA 标志的v2载荷上传
+3. 下载端校验基准文件的 SHA-256 与补丁记录一致后重建新文件，校验新文件的 SHA-256 后替换
+
+签名格式: magic 'UDCS'(4) | 版本(1) | 块大小(4) | 文件大小(8) | SHA-256(32) | 块数(4) | [弱校验(4) | 强摘要(16)]...
+补丁格式: magic 'UDCP'(4) | 版本(1) | 块大小(4) | 基准大小(8) | 基准SHA-256(32) | 目标大小(8) | 目标SHA-256(32)
+          | 指令... | 结束(0)；指令 COPY(1) = 起始块(4) + 块数(4)，DATA(2) = 长度(4) + 字节
+只有完整块参与匹配，文件末尾不足一块的部分作为字节发送。
+"""
+
+import os
+import mmap
+import json
+import base64
+import struct
+import hashlib
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from file_fingerprint import get_default_fingerprinter
+from network_utils import decrypt_and_parse_payload, delete_server_file, download_to_spool
+
+SIGNATURE_MAGIC = b'UDCS'
+PATCH_MAGIC = b'UDCP'
+DELTA_VERSION = 1
+SIGNATURE_PREFIX = 'delta_sig_'
+
+_SIGNATURE_HEADER = struct.Struct('>4sBIQ32sI')
+_SIGNATURE_ENTRY = struct.Struct('>I16s')
+_PATCH_HEADER = struct.Struct('>4sBIQ32sQ32s')
+_OP_END = 0
+_OP_COPY = 1
+_OP_DATA = 2
+_COPY_ARGS = struct.Struct('>II')
+_DATA_LEN = struct.Struct('>I')
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class DeltaSettings:
+    """增量传输参数（默认关闭，两端都需开启）"""
+    enabled: bool = False
+    min_bytes: int = 8 * 1024 * 1024
+    block_size: int = 64 * 1024
+    max_patch_ratio: float = 0.5
+
+    @classmethod
+    def from_config(cls, config) -> 'DeltaSettings':
+        section = config['DEFAULT']
+        try:
+            enabled = section.get('delta_transfer', 'false').strip().lower() in ('1', 'true', 'yes', 'on')
+            min_bytes = int(float(section.get('delta_min_mb', 8)) * 1024 * 1024)
+            block_size = int(section.get('delta_block_kb', 64)) * 1024
+            max_patch_ratio = float(section.get('delta_max_patch_ratio', 0.5))
+        except (TypeError, ValueError):
+            return cls()
+        return cls(enabled, min_bytes, max(4 * 1024, block_size), max_patch_ratio)
+
+    def applies_to(self, file_size: int) -> bool:
+        return self.enabled and file_size >= self.min_bytes
+
+
+def weak_checksum(block) -> tuple:
+    """rsync 弱校验的两个分量 (a, b)，均取模 2^16；可在窗口滑动一个字节时O(1)更新"""
+    return sum(block) & 0xffff, sum(itertools.accumulate(block)) & 0xffff
+
+
+def strong_digest(block) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+@dataclass
+class Signature:
+    """一个文件版本的分块签名"""
+    block_size: int
+    file_size: int
+    file_sha256: bytes
+    weak: List[int] = field(default_factory=list)
+    strong: List[bytes] = field(default_factory=list)
+
+    def to_bytes(self) -> bytes:
+        parts = [_SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, DELTA_VERSION, self.block_size, self.file_size,
+                                        self.file_sha256, len(self.weak))]
+        parts.extend(_SIGNATURE_ENTRY.pack(w, s) for w, s in zip(self.weak, self.strong))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Signature':
+        if len(data) < _SIGNATURE_HEADER.size:
+            raise ValueError("签名数据不完整")
+        magic, version, block_size, file_size, file_sha256, count = _SIGNATURE_HEADER.unpack_from(data)
+        if magic != SIGNATURE_MAGIC or version != DELTA_VERSION:
+            raise ValueError("不是受支持的签名数据")
+        if len(data) != _SIGNATURE_HEADER.size + count * _SIGNATURE_ENTRY.size:
+            raise ValueError("签名数据长度不匹配")
+        signature = cls(block_size, file_size, file_sha256)
+        for weak, strong in _SIGNATURE_ENTRY.iter_unpack(data[_SIGNATURE_HEADER.size:]):
+            signature.weak.append(weak)
+            signature.strong.append(strong)
+        return signature
+
+
+def compute_signature(file_path: str, block_size: int) -> Signature:
+    """顺序读取一遍文件，计算完整块的签名与整个文件的 SHA-256"""
+    file_hash = hashlib.sha256()
+    signature = Signature(block_size, os.path.getsize(file_path), b'')
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+            if len(block) == block_size:
+                a, b = weak_checksum(block)
+                signature.weak.append((b << 16) | a)
+                signature.strong.append(strong_digest(block))
+    signature.file_sha256 = file_hash.digest()
+    return signature
+
+
+class _PatchWriter:
+    """补丁指令累积：相邻的复制合并为一条，字节数据按原样追加"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self._copy_start = None
+        self._copy_count = 0
+
+    def _flush_copy(self):
+        if self._copy_count:
+            self.parts.append(bytes((_OP_COPY,)) + _COPY_ARGS.pack(self._copy_start, self._copy_count))
+            self._copy_start, self._copy_count = None, 0
+
+    def copy(self, block_index: int):
+        if self._copy_count and block_index == self._copy_start + self._copy_count:
+            self._copy_count += 1
+            return
+        self._flush_copy()
+        self._copy_start, self._copy_count = block_index, 1
+
+    def data(self, payload):
+        if not payload:
+            return
+        self._flush_copy()
+        self.parts.append(bytes((_OP_DATA,)) + _DATA_LEN.pack(len(payload)))
+        self.parts.append(bytes(payload))
+
+    def finish(self) -> bytes:
+        self._flush_copy()
+        self.parts.append(bytes((_OP_END,)))
+        return b''.join(self.parts)
+
+
+def compute_delta(file_path: str, signature: Signature, target_sha256: Optional[str] = None,
+                  max_patch_ratio: float = 0.5, max_patch_bytes: Optional[int] = None) -> Optional[bytes]:
+    """
+    在新文件上滚动匹配签名中的块，返回补丁字节。
+    需要直接发送的字节超过文件大小的 max_patch_ratio 或 max_patch_bytes 时提前放弃并返回 None（改为完整上传）。
+    """
+    block_size = signature.block_size
+    file_size = os.path.getsize(file_path)
+    if target_sha256 is None:
+        target_sha256 = get_default_fingerprinter().sha256(file_path)
+    max_literal = int(file_size * max_patch_ratio)
+    if max_patch_bytes is not None:
+        max_literal = min(max_literal, max_patch_bytes)
+
+    weak_index: Dict[int, List[int]] = {}
+    for index, weak in enumerate(signature.weak):
+        weak_index.setdefault(weak, []).append(index)
+
+    writer = _PatchWriter()
+    writer.parts.append(_PATCH_HEADER.pack(PATCH_MAGIC, DELTA_VERSION, block_size, signature.file_size,
+                                           signature.file_sha256, file_size, bytes.fromhex(target_sha256)))
+    if file_size == 0:
+        return writer.finish()
+
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        literal_start = 0
+        literal_total = 0
+        position = 0
+        a = b = 0
+        if file_size >= block_size:
+            a, b = weak_checksum(data[0:block_size])
+        while position + block_size <= file_size:
+            candidates = weak_index.get((b << 16) | a)
+            if candidates:
+                strong = strong_digest(data[position:position + block_size])
+                match = next((i for i in candidates if signature.strong[i] == strong), None)
+                if match is not None:
+                    literal_total += position - literal_start
+                    writer.data(data[literal_start:position])
+                    writer.copy(match)
+                    position += block_size
+                    literal_start = position
+                    if position + block_size <= file_size:
+                        a, b = weak_checksum(data[position:position + block_size])
+                    continue
+            # 未命中：窗口右移一个字节
+            if position + block_size < file_size:
+                out_byte, in_byte = data[position], data[position + block_size]
+                a = (a - out_byte + in_byte) & 0xffff
+                b = (b - block_size * out_byte + a) & 0xffff
+            position += 1
+            if literal_total + position - literal_start > max_literal:
+                return None
+        literal_total += file_size - literal_start
+        if literal_total > max_literal:
+            return None
+        writer.data(data[literal_start:file_size])
+    return writer.finish()
+
+
+def _file_sha256(file_path: str) -> bytes:
+    return bytes.fromhex(get_default_fingerprinter().sha256(file_path))
+
+
+def apply_patch(patch: bytes, base_path: str, dest_path: str) -> int:
+    """
+    以 base_path 为基准应用补丁，结果写入 dest_path（可与 base_path 相同），返回新文件大小。
+    基准文件与补丁记录不一致、或重建结果的 SHA-256 不符时抛出 ValueError，目标文件保持不变。
+    """
+    if len(patch) < _PATCH_HEADER.size:
+        raise ValueError("补丁数据不完整")
+    magic, version, block_size, base_len, base_sha256, target_len, target_sha256 = _PATCH_HEADER.unpack_from(patch)
+    if magic != PATCH_MAGIC or version != DELTA_VERSION:
+        raise ValueError("不是受支持的补丁数据")
+    if not os.path.exists(base_path):
+        raise ValueError(f"缺少增量基准文件: {os.path.basename(base_path)}")
+    if os.path.getsize(base_path) != base_len or _file_sha256(base_path) != base_sha256:
+        raise ValueError(f"增量基准文件已变化: {os.path.basename(base_path)}")
+
+    part_path = dest_path + '.delta.part'
+    target_hash = hashlib.sha256()
+    written = 0
+    view = memoryview(patch)
+    offset = _PATCH_HEADER.size
+    try:
+        with open(base_path, 'rb') as base, open(part_path, 'wb') as out:
+            while True:
+                if offset >= len(view):
+                    raise ValueError("补丁被截断")
+                op = view[offset]
+                offset += 1
+                if op == _OP_END:
+                    break
+                if op == _OP_COPY:
+                    start, count = _COPY_ARGS.unpack_from(view, offset)
+                    offset += _COPY_ARGS.size
+                    if (start + count) * block_size > base_len:
+                        raise ValueError("补丁引用的块超出基准文件")
+                    base.seek(start * block_size)
+                    remaining = count * block_size
+                    while remaining > 0:
+                        block = base.read(min(READ_BLOCK_SIZE, remaining))
+                        out.write(block)
+                        target_hash.update(block)
+                        remaining -= len(block)
+                        written += len(block)
+                elif op == _OP_DATA:
+                    (length,) = _DATA_LEN.unpack_from(view, offset)
+                    offset += _DATA_LEN.size
+                    block = view[offset:offset + length]
+                    if len(block) != length:
+                        raise ValueError("补丁被截断")
+                    offset += length
+                    out.write(block)
+                    target_hash.update(block)
+                    written += length
+                else:
+                    raise ValueError(f"未知的补丁指令: {op}")
+                if written > target_len:
+                    raise ValueError("补丁重建结果超出声明大小")
+        if written != target_len or target_hash.digest() != target_sha256:
+            raise ValueError("增量重建结果校验失败")
+        os.replace(part_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def signature_upload_name() -> str:
+    """签名载荷在服务器上的文件名（下载端的常规处理流程不会下载此类文件）"""
+    return f"{SIGNATURE_PREFIX}{base64.urlsafe_b64encode(os.urandom(6)).decode()}.encrypted"
+
+
+class SignatureStore:
+    """上传端保存的下载端签名（每个文件名保留最新一份，按文件名摘要存储在状态目录）"""
+
+    def __init__(self, state_dir: str = './upload_state/'):
+        self.state_dir = os.path.join(state_dir, 'delta_signatures')
+        self.lock = threading.Lock()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config) -> 'SignatureStore':
+        return cls(config['DEFAULT'].get('upload_state_dir', './upload_state/'))
+
+    def _path(self, filename: str) -> str:
+        key = hashlib.sha256(filename.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.state_dir, f"{key}.sig")
+
+    def put(self, filename: str, signature_bytes: bytes):
+        Signature.from_bytes(signature_bytes)  # 校验格式，损坏的签名不落盘
+        path = self._path(filename)
+        with self.lock:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(signature_bytes)
+            os.replace(path + '.tmp', path)
+
+    def get(self, filename: str) -> Optional[Signature]:
+        try:
+            with open(self._path(filename), 'rb') as f:
+                return Signature.from_bytes(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def discard(self, filename: str):
+        """补丁已发送后，下载端的文件版本随之改变，旧签名不再可用"""
+        with self.lock:
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                pass
+
+
+def fetch_signatures(store: SignatureStore, config, password, status_queue, transport) -> int:
+    """
+    查询服务器列表，取回下载端发布的签名并保存，成功保存后删除服务器上的签名文件。
+    无法解密的签名（可能属于其他用户）保留在服务器上。返回取回的签名数。
+    """
+    endpoints = config.endpoints
+    response = transport.post(endpoints.query_url, idempotent=True, headers=endpoints.auth_headers, timeout=30,
+                              check_auth=True, expect_json=False)
+    response.raise_for_status()
+    data = json.loads(response.content)
+    transport.check_auth_payload(data, endpoints.query_url)
+    items = data.get("items", []) if data.get("success") else []
+
+    fetched = 0
+    for item in items:
+        if not item.get('name', '').startswith(SIGNATURE_PREFIX):
+            continue
+        status_code, spool = download_to_spool(endpoints.download_url(item['fileUrl']),
+                                               headers=endpoints.auth_headers, timeout=60, transport=transport)
+        if spool is None:
+            continue
+        try:
+            with spool:
+                spool.seek(0)
+                payload = decrypt_and_parse_payload(spool.read(), password)
+            store.put(payload['filename'], payload['content'])
+        except Exception:
+            continue
+        fetched += 1
+        delete_server_file(item['id'], config, status_queue, transport)
+    return fetched
+
+
+def build_delta_patch(store: SignatureStore, settings: DeltaSettings, file_path: str,
+                      file_sha256: Optional[str] = None, max_patch_bytes: Optional[int] = None) -> Optional[bytes]:
+    """
+    上传端：有下载端签名且变化不大时返回补丁，否则返回 None（应完整上传）。
+    补丁作为单个载荷上传，超过 max_patch_bytes（通常为分片大小）时同样放弃。
+    """
+    signature = store.get(os.path.basename(file_path))
+    if signature is None:
+        return None
+    patch = compute_delta(file_path, signature, file_sha256, settings.max_patch_ratio, max_patch_bytes)
+    if patch is None or (max_patch_bytes is not None and len(patch) > max_patch_bytes):
+        return None
+    return patch
@@ -4,21 +4,15 @@
 import os
 import sys
 import time
-import base64
-import re
-import shutil
-import requests
 import pyperclip
 import threading
 import queue
 import keyring
 import asyncio
-import concurrent.futures
 from datetime import datetime, timedelta
 from tkinter import messagebox
 import tkinter as tk
 from typing import Optional, Dict, Any, Tuple
-from collections import deque # Added for clipboard protection
 
 try:
     import customtkinter as ctk
@@ -31,7 +25,17 @@ except ImportError:
 import urllib.parse
 
 from config_manager import ConfigManager, run_cookie_server
-from network_utils import decrypt_and_parse_payload, delete_server_file
+from network_utils import (delete_server_file, download_to_spool, encrypt_payload_bytes, is_binary_payload,
+                           is_text_upload_name, iter_decrypted_payload, upload_data, AuthExpiredError, HttpTransport,
+                           DEFAULT_SPOOL_MEMORY, PAYLOAD_UPLOAD_PREFIX)
+from chunk_assembler import ChunkAssembler, RangeAssembler
+from file_bundle import unpack_bundle
+from delta_sync import DeltaSettings, apply_patch, compute_signature, signature_upload_name
+from listing_watcher import (AdaptivePollSchedule, ChangeNotifier, ListingChangeDetector, ListingDelta,
+                             UploadBatchPlanner, create_notifier, item_upload_id, parse_chunk_name)
+from transfer_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SMALL, TransferScheduler
+from clipboard_guard import TokenBucket
+from log_view import ActivityLog
 
 
 def safe_operation(operation_name="操作"):
@@ -105,6 +109,8 @@ class SplashScreen:
 
 # --- 主应用类 (修正版) ---
 class DownloaderApp:
+    USER_AGENT = 'UpAndDown2-Client/5.9'
+
     def __init__(self, root):
         # 立即输出版本标识
         print("🔍 DEBUG: external_client.py 修改版本 - 2024-08-22")
@@ -117,26 +123,31 @@ class DownloaderApp:
         self.temp_chunk_dir = os.path.join(self.download_dir, "temp_chunks")
         
         # 分片下载状态跟踪（防止重复下载）
-        self.downloaded_chunks = {}  # {upload_id: set(chunk_indices)}
+        self.downloaded_chunks = {}  # {upload_id: set(分片序号或字节偏移)}
         self.completed_uploads = set()  # 已完成合并的upload_id集合
+        self.assemblers = {}  # {upload_id: ChunkAssembler/RangeAssembler} 分片直写组装器
         self.chunks_lock = threading.Lock()  # 分片状态锁
         
         # 缓存初始化期间的日志消息
         self.init_log_cache = []
         self.ui_created = False
+        # 活动日志：界面保留固定行数，完整历史写入 logs/downloader.log
+        self.activity_log = ActivityLog('downloader')
+        # 增量传输：保存大文件后发布分块签名，供上传端只发送变化的块
+        self.delta_settings = DeltaSettings()
         
-        # 智能轮询配置
-        self.base_poll_interval = 5  # 基础间隔5秒
-        self.current_poll_interval = 5  # 当前动态间隔
-        self.max_poll_interval = 60  # 最大间隔60秒
-        self.chunk_poll_interval = 1  # 分片传输时的快速轮询间隔（1秒）
+        # 智能轮询配置：间隔策略见 AdaptivePollSchedule，列表未变化时跳过解析
+        self.poll_schedule = AdaptivePollSchedule()
+        self.listing_detector = ListingChangeDetector()
+        self.batch_planner = UploadBatchPlanner()  # 按 upload_id 分组派发，最早未完成的上传优先
+        self.notifier = ChangeNotifier()  # 外部"新条目"提示，缺省不启用
+        self.poll_wakeup = threading.Event()  # 提示或停止信号提前唤醒轮询线程
         self.is_chunked_transfer = False  # 是否正在进行分片传输
-        self.poll_increase_factor = 1.5  # 间隔递增因子
-        self.consecutive_empty_polls = 0  # 连续空轮询计数
         self.auto_stop_minutes = 10  # 10分钟无文件自动停止
         
         # 文件过滤配置
         self.min_file_size = 100  # 最小文件大小（字节）
+        self.spool_memory = DEFAULT_SPOOL_MEMORY  # 下载缓冲的内存上限，超出后落盘
         self.auto_delete_invalid = True  # 自动删除无效文件
         
         # 初始化设计系统颜色（默认值，会在setup_styles中更新）
@@ -150,9 +161,12 @@ class DownloaderApp:
         }
         
         # 性能优化配置
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="DownloaderWorker")
-        self.session = requests.Session()  # 复用连接
-        self.session.headers.update({'User-Agent': 'UpAndDown2-Client/5.9'})
+        # 传输调度：剪切板载荷 > 删除/合并等短任务 > 大文件分片，各类别独立并发上限，
+        # 分片再多也不会让新复制的文本排队；多个大文件的分片按 upload_id 轮转下载
+        self.executor = TransferScheduler(name="DownloaderWorker")
+        # 共享连接池（复用连接，幂等请求自动退避重试），初始化时按配置重建
+        self.transport = HttpTransport(pool_size=8, user_agent=self.USER_AGENT)
+        self.session = self.transport.session
         
         # 性能统计
         self.stats = {
@@ -171,7 +185,7 @@ class DownloaderApp:
             'clipboard_change_count': 0,   # 剪切板变化计数
             'min_interval_seconds': 0.5,   # 最小间隔0.5秒（降低限制）
             'max_changes_per_minute': 30,  # 每分钟最大30次变化（提高限制）
-            'change_timestamps': deque(maxlen=60),  # 变化时间戳记录
+            'rate_limiter': TokenBucket.per_minute(30),  # 变化频率令牌桶
             'is_self_operation': False,    # 是否是自己操作
             'self_operation_content': '',  # 自己操作的内容
             'self_operation_expire_time': 0,  # 自己操作的过期时间
@@ -183,8 +197,6 @@ class DownloaderApp:
         self.monitor_thread = None
         self.status_queue = queue.Queue()
         self.download_count = 0
-        self.merge_locks = {}
-        self.locks_lock = threading.Lock()
         self.last_file_found_time = None
         self.root.geometry("1000x800")
         self.root.minsize(900, 700)
@@ -210,33 +222,40 @@ class DownloaderApp:
 
             self.status_queue.put(('log', ('正在加载配置文件...', 'info')))
             config = self.config_manager.load_config()
+            self.activity_log.configure(config)
             
             # 强制调试信息
             self.status_queue.put(('log', ('🔍 配置对象获取成功，开始读取参数...', 'info')))
             
             self.download_dir = config['DEFAULT'].get('download_dir', './downloads/')
+            
+            # 按配置重建传输层：连接池覆盖全部下载线程及其删除请求
+            self.transport.close()
+            self.transport = HttpTransport.from_config(config, pool_size=8, user_agent=self.USER_AGENT)
+            self.session = self.transport.session
+            self.executor.configure(config)
             self.temp_chunk_dir = os.path.join(self.download_dir, "temp_chunks")
             
             # 加载智能轮询配置
-            self.base_poll_interval = int(config['DEFAULT'].get('base_poll_interval', 5))
-            self.current_poll_interval = self.base_poll_interval
-            self.max_poll_interval = int(config['DEFAULT'].get('max_poll_interval', 60))
-            self.chunk_poll_interval = int(config['DEFAULT'].get('chunk_poll_interval_seconds', 1))
-            self.poll_increase_factor = float(config['DEFAULT'].get('poll_increase_factor', 1.5))
-            self.auto_stop_minutes = int(config['DEFAULT'].get('auto_stop_minutes', 10))
+            self.poll_schedule = AdaptivePollSchedule.from_config(config)
+            self.notifier = create_notifier(config)
+            self.auto_stop_minutes = config.get_int('auto_stop_minutes', 10)
             
             self.status_queue.put(('log', ('🔍 轮询配置读取完成...', 'info')))
             
             # 加载文件过滤配置
-            self.min_file_size = int(config['DEFAULT'].get('min_file_size', 100))
-            self.auto_delete_invalid = config['DEFAULT'].get('auto_delete_invalid', 'True').lower() == 'true'
+            self.min_file_size = config.get_int('min_file_size', 100)
+            self.spool_memory = int(config.get_float('download_spool_memory_mb', 4) * 1024 * 1024)
+            self.auto_delete_invalid = config.get_bool('auto_delete_invalid', True)
+            self.delta_settings = DeltaSettings.from_config(config)
             
             # 从配置文件更新剪切板保护参数
-            self.clipboard_protection['min_interval_seconds'] = float(config['DEFAULT'].get('clipboard_min_interval_seconds', 0.5))
-            self.clipboard_protection['max_changes_per_minute'] = int(config['DEFAULT'].get('clipboard_max_changes_per_minute', 30))
+            self.clipboard_protection['min_interval_seconds'] = config.get_float('clipboard_min_interval_seconds', 0.5)
+            self.clipboard_protection['max_changes_per_minute'] = config.get_int('clipboard_max_changes_per_minute', 30)
+            self.clipboard_protection['rate_limiter'] = TokenBucket.per_minute(self.clipboard_protection['max_changes_per_minute'])
             
             # 记录智能轮询配置
-            self.status_queue.put(('log', (f'智能轮询配置加载: 基础间隔={self.base_poll_interval}s, 分片间隔={self.chunk_poll_interval}s, 最大间隔={self.max_poll_interval}s, 递增因子={self.poll_increase_factor}, 自动停止={self.auto_stop_minutes}分钟', 'info')))
+            self.status_queue.put(('log', (f'智能轮询配置加载: 基础间隔={self.poll_schedule.base_interval}s, 分片间隔={self.poll_schedule.chunk_interval}s, 突发间隔={self.poll_schedule.burst_interval}s, 最大间隔={self.poll_schedule.max_interval}s, 递增因子={self.poll_schedule.increase_factor}, 自动停止={self.auto_stop_minutes}分钟', 'info')))
             self.status_queue.put(('log', (f'文件过滤配置加载: 最小文件大小={self.min_file_size}字节, 自动删除无效文件={self.auto_delete_invalid}', 'info')))
             self.status_queue.put(('log', (f'剪切板保护配置: 最小间隔={self.clipboard_protection["min_interval_seconds"]}s, 最大变化={self.clipboard_protection["max_changes_per_minute"]}次/分钟', 'info')))
             
@@ -246,6 +265,7 @@ class DownloaderApp:
             self.status_queue.put(('log', ('正在启动内部Cookie服务...', 'info')))
             cookie_thread = threading.Thread(target=run_cookie_server, args=(self.config_manager,), daemon=True)
             cookie_thread.start()
+            self.config_manager.add_listener(self._on_cookie_updated)
 
             self.status_queue.put(('init_success', '初始化成功，应用准备就绪。'))
         except Exception as e:
@@ -332,6 +352,23 @@ class DownloaderApp:
                         self.stop_button.config(state='disabled', text="⏸️  停止监控")
                         self.status_label.config(text="状态: 已停止")
                         
+                elif msg_type == 'auth_waiting':
+                    # 登录失效，等待浏览器同步新Cookie
+                    if CTK_AVAILABLE:
+                        self.status_label.configure(text="状态: 等待登录（请在浏览器中重新登录）", text_color=self.colors['warning'])
+                        self.status_indicator.configure(fg_color=self.colors['warning_light'])
+                        self.header_status.configure(text="等待登录", text_color=self.colors['warning'])
+                    else:
+                        self.status_label.config(text="状态: 等待登录（请在浏览器中重新登录）")
+                
+                elif msg_type == 'auth_restored':
+                    if CTK_AVAILABLE:
+                        self.status_label.configure(text="状态: 智能监控中...", text_color=self.colors['success'])
+                        self.status_indicator.configure(fg_color=self.colors['success_light'])
+                        self.header_status.configure(text="监控中", text_color=self.colors['success'])
+                    else:
+                        self.status_label.config(text="状态: 智能监控中...")
+                    
                 elif msg_type == 'monitoring_failed':
                     # 监控启动失败的UI更新
                     if CTK_AVAILABLE:
@@ -346,6 +383,7 @@ class DownloaderApp:
                         self.status_label.config(text="状态: 启动失败")
         except queue.Empty:
             pass
+        self.activity_log.flush()
         self.root.after(100, self.process_queue)
 
     def on_closing(self):
@@ -353,6 +391,8 @@ class DownloaderApp:
         if messagebox.askokcancel("退出", "确定要退出程序吗?"):
             # 停止监控
             self.is_monitoring.clear()
+            self.poll_wakeup.set()
+            self.notifier.stop()
             
             # 等待线程池关闭
             try:
@@ -363,11 +403,13 @@ class DownloaderApp:
             
             # 关闭网络会话
             try:
-                self.session.close()
+                self.transport.close()
                 self.status_queue.put(('log', ("✅ 网络会话已关闭", 'info')))
             except Exception as e:
                 self.status_queue.put(('log', (f"⚠️ 会话关闭异常: {e}", 'warning')))
             
+            self.activity_log.close()
+            
             # 安全销毁窗口
             try:
                 self.root.destroy()
@@ -422,6 +464,7 @@ class DownloaderApp:
             self.create_modern_widgets()
         else:
             self.create_classic_widgets()
+        self.activity_log.attach(self.log_area)
     
     def create_modern_widgets(self):
         # LocalSend风格的现代化界面
@@ -677,22 +720,8 @@ class DownloaderApp:
             'network': '#06b6d4'
         }
         
-        if CTK_AVAILABLE and hasattr(self.log_area, 'configure'):
-            # CustomTkinter TextBox
-            self.log_area.configure(state='normal')
-            
-            # 添加带颜色的日志条目
-            log_line = f"[{timestamp}] {icons.get(msg_type, '💬')} {message}\n"
-            self.log_area.insert(tk.END, log_line)
-            
-            self.log_area.configure(state='disabled')
-            self.log_area.see(tk.END)
-        else:
-            # 经典ScrolledText
-            self.log_area.config(state='normal')
-            self.log_area.insert(tk.END, f"[{timestamp}] {icons.get(msg_type, '💬')} {message}\n")
-            self.log_area.config(state='disabled')
-            self.log_area.see(tk.END)
+        # 放入日志缓冲，process_queue 每个周期批量刷新到界面
+        self.activity_log.append(f"[{timestamp}] {icons.get(msg_type, '💬')} {message}", msg_type)
 
     def start_monitoring(self):
         """启动监控 - 毫秒级响应优化"""
@@ -718,13 +747,21 @@ class DownloaderApp:
     def _start_monitoring_async(self):
         """异步启动监控逻辑"""
         try:
-            # 重置轮询状态
-            self.current_poll_interval = self.base_poll_interval
-            self.consecutive_empty_polls = 0
+            # 重置轮询状态；变更检测一并清空，启动后的首次查询完整处理现有条目
+            self.poll_schedule.reset()
+            self.listing_detector.reset()
+            self.batch_planner.reset()
+            self.poll_wakeup.clear()
             self.last_file_found_time = time.time()
             
             self.is_monitoring.set()
             
+            # 启动外部提示服务（端口占用等失败不影响轮询）
+            try:
+                self.notifier.start(self._on_change_hint)
+            except OSError as e:
+                self.status_queue.put(('log', (f"⚠️ 变更提示服务启动失败，仅使用轮询: {e}", 'warning')))
+            
             # 更新UI状态
             self.status_queue.put(('monitoring_started', None))
             
@@ -732,7 +769,7 @@ class DownloaderApp:
             self.monitor_thread = threading.Thread(target=self.monitor_files_worker, daemon=True)
             self.monitor_thread.start()
             
-            self.status_queue.put(('log', (f"🚀 智能监控已启动，初始间隔: {self.base_poll_interval}s", 'success')))
+            self.status_queue.put(('log', (f"🚀 智能监控已启动，初始间隔: {self.poll_schedule.base_interval}s", 'success')))
             
         except Exception as e:
             self.status_queue.put(('log', (f"❌ 启动监控失败: {e}", 'error')))
@@ -761,6 +798,8 @@ class DownloaderApp:
         """异步停止监控逻辑"""
         try:
             self.is_monitoring.clear()
+            self.poll_wakeup.set()
+            self.notifier.stop()
             
             # 等待监控线程结束（最多3秒）
             if self.monitor_thread and self.monitor_thread.is_alive():
@@ -801,73 +840,68 @@ class DownloaderApp:
         self.executor.submit(open_folder_async)
 
     def clear_log(self):
-        if CTK_AVAILABLE and hasattr(self.log_area, 'configure'):
-            # CustomTkinter TextBox
-            self.log_area.configure(state='normal')
-            self.log_area.delete('1.0', tk.END)
-            self.log_area.configure(state='disabled')
-        else:
-            # 经典ScrolledText
-            self.log_area.config(state='normal')
-            self.log_area.delete('1.0', tk.END)
-            self.log_area.config(state='disabled')
+        # 只清空界面，完整历史仍保留在日志文件中
+        self.activity_log.clear()
+
+    def _on_cookie_updated(self, snapshot):
+        """Cookie热更新：解除"等待登录"状态并重放挂起的请求，下一次轮询立即使用新Cookie"""
+        was_waiting = self.transport.auth_gate.waiting_for_auth
+        self.transport.auth_gate.refresh(snapshot)
+        if was_waiting and self.is_monitoring.is_set():
+            self.status_queue.put(('auth_restored', None))
+        self.status_queue.put(('log', ("🍪 Cookie已同步，立即重新查询", 'info')))
+        if self.is_monitoring.is_set():
+            self.poll_wakeup.set()
+
+    def _on_change_hint(self, hint):
+        """外部提示有新条目：进入突发快速轮询并立即唤醒轮询线程"""
+        self.poll_schedule.start_burst()
+        self.poll_wakeup.set()
 
     def monitor_files_worker(self):
-        """智能轮询工作线程 - 动态间隔，自适应停止"""
+        """智能轮询工作线程 - 变更检测，自适应间隔，自适应停止"""
         auto_stop_seconds = self.auto_stop_minutes * 60
+        schedule = self.poll_schedule
         
-        self.status_queue.put(('log', (f"智能轮询已启动，基础间隔: {self.base_poll_interval}s，最大间隔: {self.max_poll_interval}s", 'info')))
+        self.status_queue.put(('log', (f"智能轮询已启动，基础间隔: {schedule.base_interval}s，最大间隔: {schedule.max_interval}s", 'info')))
         
         while self.is_monitoring.is_set():
-            # 执行文件检查
-            files_found = self.process_files()
+            # 先清除唤醒标志再查询：查询期间到达的提示保留到下面的等待，立即触发下一轮
+            self.poll_wakeup.clear()
+            delta = self.process_files()
             
             if not self.is_monitoring.is_set():
                 break
-                
-            # 根据检查结果调整轮询间隔
-            if files_found:
-                # 发现文件，检查是否是分片传输
-                self.consecutive_empty_polls = 0
+            
+            if self.transport.auth_gate.waiting_for_auth:
+                # 等待登录：不计空轮询、不退避，Cookie刷新时立即被唤醒；超时后再探测一次
+                self.poll_wakeup.wait(schedule.max_interval)
+                continue
+            
+            if delta.new_items:
                 self.last_file_found_time = time.time()
-                
-                if self.is_chunked_transfer:
-                    # 分片传输中，使用快速轮询
-                    self.current_poll_interval = self.chunk_poll_interval
-                    self.status_queue.put(('log', (f"发现文件，分片传输快速轮询: {self.current_poll_interval}s", 'success')))
-                else:
-                    # 普通文件，使用基础间隔
-                    self.current_poll_interval = self.base_poll_interval
-                    self.status_queue.put(('log', (f"发现文件，轮询间隔重置为 {self.current_poll_interval}s", 'success')))
-            else:
-                # 未发现文件，检查分片传输是否完成
-                if self.is_chunked_transfer:
-                    # 检查是否还有未完成的分片传输
-                    with self.chunks_lock:
-                        has_active_chunks = any(
-                            upload_id not in self.completed_uploads 
-                            for upload_id in self.downloaded_chunks
-                        )
-                        
-                    if not has_active_chunks:
-                        # 所有分片传输已完成，恢复普通轮询
-                        self.is_chunked_transfer = False
-                        self.current_poll_interval = self.base_poll_interval
-                        self.status_queue.put(('log', (f"分片传输完成，恢复正常轮询: {self.current_poll_interval}s", 'info')))
-                
-                # 未发现文件，增加轮询间隔（仅限非分片传输）
-                if not self.is_chunked_transfer:
-                    self.consecutive_empty_polls += 1
+            elif self.is_chunked_transfer:
+                # 未发现新条目，检查是否还有未完成的分片传输
+                with self.chunks_lock:
+                    has_active_chunks = any(
+                        upload_id not in self.completed_uploads 
+                        for upload_id in self.downloaded_chunks
+                    )
                     
-                    # 每3次空轮询增加一次间隔
-                    if self.consecutive_empty_polls % 3 == 0:
-                        old_interval = self.current_poll_interval
-                        self.current_poll_interval = min(
-                            self.current_poll_interval * self.poll_increase_factor,
-                            self.max_poll_interval
-                        )
-                        if old_interval != self.current_poll_interval:
-                            self.status_queue.put(('log', (f"连续 {self.consecutive_empty_polls} 次空轮询，间隔调整为 {self.current_poll_interval:.1f}s", 'info')))
+                if not has_active_chunks:
+                    # 所有分片传输已完成，恢复普通轮询
+                    self.is_chunked_transfer = False
+                    self.status_queue.put(('log', ("分片传输完成，恢复正常轮询", 'info')))
+            
+            # 根据检查结果调整轮询间隔
+            old_interval = schedule.current_interval
+            interval = schedule.on_poll(delta, self.is_chunked_transfer)
+            if delta.new_upload_ids:
+                self.status_queue.put(('log', (f"发现新上传 {len(delta.new_upload_ids)} 个，快速轮询: {interval}s", 'success')))
+            elif delta.new_items:
+                self.status_queue.put(('log', (f"发现 {len(delta.new_items)} 个新条目，轮询间隔: {interval}s", 'success')))
+            elif interval > old_interval:
+                self.status_queue.put(('log', (f"连续 {schedule.consecutive_empty_polls} 次空轮询，间隔调整为 {interval:.1f}s", 'info')))
             
             # 检查自动停止条件
             if self.last_file_found_time and (time.time() - self.last_file_found_time > auto_stop_seconds):
@@ -875,23 +909,25 @@ class DownloaderApp:
                 self.stop_monitoring()
                 break
             
-            # 等待下次轮询（可中断）
-            wait_start = time.time()
-            while self.is_monitoring.is_set() and (time.time() - wait_start < self.current_poll_interval):
-                time.sleep(0.1)  # 短暂睡眠，每100ms检查一次停止信号
+            # 等待下次轮询；外部提示或停止信号会提前唤醒
+            self.poll_wakeup.wait(interval)
         
         self.status_queue.put(('log', ("智能轮询线程已安全退出", 'info')))
 
     def process_files(self):
-        """处理文件检查，返回是否找到文件 - 带性能监控"""
+        """查询文件列表并派发新条目，返回 ListingDelta - 带性能监控"""
         start_time = time.time()
         config = self.config_manager.get_config()
         
         try:
-            # 使用会话复用连接
-            headers = {'Cookie': config['DEFAULT']['COOKIE']}
-            response = self.session.post(config['DEFAULT']['QUERY_URL'], headers=headers, timeout=30)
-            response.raise_for_status()
+            # 使用共享传输层复用连接；查询为幂等请求，失败时退避重试
+            endpoints = config.endpoints
+            headers = endpoints.auth_headers
+            query_headers = dict(headers, **self.listing_detector.request_headers())
+            was_waiting = self.transport.auth_gate.waiting_for_auth
+            # 响应体的登录检查推迟到变更检测决定解析之后，列表未变化时整轮不做JSON解析
+            response = self.transport.post(endpoints.query_url, idempotent=True, headers=query_headers, timeout=30,
+                                           check_auth=True, expect_json=False)
             
             # 计算响应时间
             response_time_ms = (time.time() - start_time) * 1000
@@ -903,39 +939,60 @@ class DownloaderApp:
             else:
                 self.stats['average_response_time'] = (self.stats['average_response_time'] + response_time_ms) / 2
             
-            data = response.json()
-            items = data.get("items", [])
+            # 列表未变化时不解析；变化时只派发新出现的条目，已派发的条目不会重复下载
+            delta = self.listing_detector.observe(
+                response, check_payload=lambda data: self.transport.check_auth_payload(data, endpoints.query_url))
+            if not delta.changed:
+                # 与上次通过登录检查的列表相同，登录有效
+                self.transport.auth_gate.mark_ok()
+            if was_waiting and not self.transport.auth_gate.waiting_for_auth:
+                # 等待超时后的探测查询成功：登录其实有效（例如之前只是网关错误），恢复正常状态
+                self.status_queue.put(('auth_restored', None))
             
-            if not data.get("success") or not items:
-                return False  # 未找到文件
+            if not delta.new_items:
+                return delta
             
-            # 处理找到的文件
+            # 按 upload_id 分组并过滤已完成的上传/已下载的分片，整轮只持锁一次
+            with self.chunks_lock:
+                batches = self.batch_planner.plan(delta, self.completed_uploads, self.downloaded_chunks)
+            
+            # 按上传批量派发，最早出现且未完成的上传排在执行队列前面
             files_processed = 0
-            for item in items:
+            for batch in batches:
                 if not self.is_monitoring.is_set():
                     break
-                if item['name'].startswith("chunk_"):
-                    self.handle_chunk(item, config, headers)
-                    files_processed += 1
-                elif item['name'].startswith("clipboard_payload_"):
-                    self.handle_single_file(item, config, headers)
-                    files_processed += 1
+                if batch.is_chunked:
+                    self.is_chunked_transfer = True
+                    self.status_queue.put(('log', (f"📦 派发上传 {batch.upload_id}: {len(batch.items)} 个分片 (已完成 {batch.received_chunks}/{batch.total_chunks or '?'})", 'info')))
+                    for item in batch.items:
+                        self.handle_chunk(item, config, headers)
+                    files_processed += len(batch.items)
+                else:
+                    for item in batch.items:
+                        if item['name'].startswith(PAYLOAD_UPLOAD_PREFIX):
+                            self.handle_single_file(item, config, headers)
+                            files_processed += 1
             
             if files_processed > 0:
                 self.stats['total_downloads'] += files_processed
             
-            return files_processed > 0  # 返回是否处理了文件
+            return delta
             
+        except AuthExpiredError:
+            self.status_queue.put(('auth_waiting', None))
+            self.status_queue.put(('log', ("🔐 登录已失效，等待浏览器同步新Cookie后自动恢复", 'warning')))
+            return ListingDelta(changed=False)
         except Exception as e:
             self.stats['error_count'] += 1
             error_msg = f"🌐 网络请求失败 [响应时间: {(time.time() - start_time)*1000:.1f}ms]: {e}"
             self.status_queue.put(('log', (error_msg, 'error')))
-            return False  # 错误时返回未找到文件
+            return ListingDelta(changed=False)  # 错误时视为无变化
 
     def handle_single_file(self, item, config, headers):
         """处理单个文件 - 异步优化版本"""
-        # 异步执行文件下载和处理
-        self.executor.submit(self._handle_single_file_async, item, config, headers)
+        # 剪切板文本按交互类别执行，小文件/打包/增量补丁按小文件类别；二者都不排在大文件分片之后
+        priority = PRIORITY_INTERACTIVE if is_text_upload_name(item['name']) else PRIORITY_SMALL
+        self.executor.submit(self._handle_single_file_async, item, config, headers, priority=priority)
     
     @safe_operation("文件处理")
     def _handle_single_file_async(self, item, config, headers):
@@ -945,86 +1002,36 @@ class DownloaderApp:
             # 添加调试信息
             self.status_queue.put(('log', (f"🔍 开始处理文件: {item.get('name', 'unknown')} (ID: {item.get('id', 'unknown')})", 'info')))
             
-            dl_url = config['DEFAULT']['BASE_DOWNLOAD_URL'] + item['fileUrl']
+            dl_url = config.endpoints.download_url(item['fileUrl'])
             self.status_queue.put(('log', (f"🔗 下载URL: {dl_url}", 'info')))
             
-            # 使用会话进行下载
-            dl_response = self.session.get(dl_url, headers=headers, timeout=120)
-            if dl_response.status_code != 200: 
-                self.status_queue.put(('log', (f"❌ 下载失败，HTTP状态码: {dl_response.status_code}", 'error')))
+            # 流式下载到临时缓冲（小载荷留在内存，大载荷落盘），不在内存中保留完整响应体
+            status_code, spool = download_to_spool(dl_url, headers=headers, timeout=120, transport=self.transport,
+                                                   spool_dir=self.temp_chunk_dir, max_memory=self.spool_memory)
+            if spool is None:
+                self.status_queue.put(('log', (f"❌ 下载失败，HTTP状态码: {status_code}", 'error')))
+                self.listing_detector.forget(item['id'])
                 return
-                
-            self.status_queue.put(('log', (f"📥 下载成功，文件大小: {len(dl_response.content)} 字节", 'info')))
             
-            # 智能文件过滤：跳过明显不是我们系统的文件
-            if len(dl_response.content) < self.min_file_size:  # 文件太小，可能不是加密文件
-                self.status_queue.put(('log', (f"⚠️ 跳过小文件: {item.get('name', 'unknown')} ({len(dl_response.content)} 字节 < {self.min_file_size} 字节)", 'warning')))
-                # 安全修复：不删除服务器上的小文件，可能是其他用户的合法文件
-                self.status_queue.put(('log', (f"💡 提示: 服务器小文件已保留，可能是其他用户的文件", 'info')))
-                return
-                
-            # 解密和解析
-            try:
-                payload = decrypt_and_parse_payload(dl_response.content, self.password)
-                content = base64.b64decode(payload['content_base64'])
-                self.status_queue.put(('log', (f"🔓 解密成功，载荷大小: {len(content)} 字节", 'info')))
-            except Exception as decrypt_error:
-                error_detail = str(decrypt_error) if decrypt_error else "未知解密错误"
-                self.status_queue.put(('log', (f"❌ 解密失败: {error_detail}", 'error')))
-                
-                # 记录文件信息用于调试
-                file_info = f"文件名: {item.get('name', 'unknown')}, 大小: {len(dl_response.content)} 字节"
-                self.status_queue.put(('log', (f"🔍 解密失败的文件信息: {file_info}", 'warning')))
-                
-                # 安全修复：只删除本地下载的文件，不删除服务器文件
-                # 因为可能是其他人上传的文件，删除服务器文件会影响其他用户
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        self.status_queue.put(('log', (f"🗑️ 已删除本地解密失败的文件: {item.get('name', 'unknown')}", 'info')))
-                    except Exception as e:
-                        self.status_queue.put(('log', (f"⚠️ 删除本地文件失败: {str(e)}", 'warning')))
-                
-                self.status_queue.put(('log', (f"💡 提示: 服务器文件已保留，可能是其他用户的文件", 'info')))
-                
-                # 不抛出异常，直接返回，避免后续处理
-                return
+            with spool:
+                saved = self._save_single_payload(item, spool, start_time)
             
-            download_time_ms = (time.time() - start_time) * 1000
-            
-            if payload.get('is_from_text', False):
-                # 文本内容复制到剪切板
-                text_content = content.decode('utf-8')
-                if self._is_clipboard_change_safe(text_content):
-                    self._safe_copy_to_clipboard(text_content, f"文本内容 '{payload['filename']}'")
-                else:
-                    self.status_queue.put(('log', (f"📝 文本内容 '{payload['filename']}' 已下载，但剪切板变化过于频繁，跳过复制 [{download_time_ms:.1f}ms]", 'warning')))
-            else:
-                # 文件保存
-                save_path = os.path.join(self.download_dir, payload['filename'])
-                with open(save_path, 'wb') as f:
-                    f.write(content)
-                
-                # 安全复制文件路径到剪切板
-                file_path = os.path.abspath(save_path)
-                if self._is_clipboard_change_safe(file_path):
-                    self._safe_copy_to_clipboard(file_path, f"文件路径 '{payload['filename']}'")
-                else:
-                    self.status_queue.put(('log', (f"📁 文件 '{payload['filename']}' 已下载，但剪切板变化过于频繁，跳过复制 [{download_time_ms:.1f}ms]", 'warning')))
+            if saved:
+                # 更新统计
+                self.download_count += 1
+                self.stats['total_downloads'] += 1
+                self.status_queue.put(('update_count', ''))
                 
-                file_size_kb = len(content) / 1024
-                self.status_queue.put(('log', (f"📁 文件 '{payload['filename']}' 已下载 [{file_size_kb:.1f}KB, {download_time_ms:.1f}ms]", 'success')))
-            
-            # 更新统计
-            self.download_count += 1
-            self.stats['total_downloads'] += 1
-            self.status_queue.put(('update_count', ''))
-            
-            # 异步删除服务器文件
-            self.executor.submit(delete_server_file, item['id'], config, self.status_queue)
+                # 异步删除服务器文件
+                self.executor.submit(delete_server_file, item['id'], config, self.status_queue, self.transport)
             
+        except AuthExpiredError:
+            # 登录失效：条目移出已知集合，Cookie刷新后的轮询会重新派发
+            self.listing_detector.forget(item.get('id'))
+            self.status_queue.put(('log', (f"🔐 登录已失效，{item.get('name', 'unknown')} 将在Cookie刷新后重新下载", 'warning')))
         except Exception as e:
             self.stats['error_count'] += 1
+            self.listing_detector.forget(item.get('id'))
             error_msg = f"❌ 处理单个文件失败: {str(e)}"
             if hasattr(e, '__traceback__'):
                 import traceback
@@ -1041,10 +1048,108 @@ class DownloaderApp:
                 error_msg += f"\n   详细错误: {tb_info.split('File')[0].strip()}"
             self.status_queue.put(('log', (error_msg, 'error')))
 
+    def _save_single_payload(self, item, spool, start_time):
+        """从下载缓冲流式解密并保存单个载荷；成功返回 True，被过滤或解密失败返回 False"""
+        downloaded_size = spool.tell()
+        self.status_queue.put(('log', (f"📥 下载成功，文件大小: {downloaded_size} 字节", 'info')))
+        
+        # 智能文件过滤：跳过明显不是我们系统的文件
+        # v2二进制信封有固定魔数，短文本载荷可能小于阈值，不参与此过滤
+        if downloaded_size < self.min_file_size:
+            spool.seek(0)
+            if not is_binary_payload(spool.read(4)):  # 文件太小，可能不是加密文件
+                self.status_queue.put(('log', (f"⚠️ 跳过小文件: {item.get('name', 'unknown')} ({downloaded_size} 字节 < {self.min_file_size} 字节)", 'warning')))
+                # 安全修复：不删除服务器上的小文件，可能是其他用户的合法文件
+                self.status_queue.put(('log', (f"💡 提示: 服务器小文件已保留，可能是其他用户的文件", 'info')))
+                return False
+        
+        # 流式解密：文件载荷逐段写入临时文件，全部认证通过后才替换到目标路径
+        part_path = None
+        try:
+            payload, plain_blocks = iter_decrypted_payload(spool, self.password)
+            if payload['is_from_text']:
+                content = b''.join(plain_blocks)
+            elif payload['is_bundle']:
+                # 小文件打包：一次解密，按顺序写出包内全部文件
+                saved_paths = unpack_bundle(plain_blocks, self.download_dir)
+            elif payload['is_delta']:
+                # 增量补丁：以下载目录中的同名旧版本为基准重建，校验通过后替换
+                save_path = os.path.join(self.download_dir, os.path.basename(payload['filename']))
+                patch = b''.join(plain_blocks)
+                try:
+                    rebuilt_size = apply_patch(patch, save_path, save_path)
+                except ValueError as patch_error:
+                    # 本地基准与上传端所用签名不一致：补丁已确认是本系统的载荷但无法再使用，从服务器删除；
+                    # 重新发布当前版本的签名（基准缺失时不发布），上传端再次发送该文件时按新签名计算补丁或完整上传
+                    self.status_queue.put(('log', (f"❌ 增量重建失败: {patch_error}，已删除服务器上的补丁，需由上传端重新发送 '{payload['filename']}'", 'error')))
+                    self.executor.submit(delete_server_file, item['id'], self.config_manager.get_config(),
+                                         self.status_queue, self.transport)
+                    self.executor.submit(self._publish_signature, save_path, priority=PRIORITY_BULK, group=save_path)
+                    return False
+                self.status_queue.put(('log', (f"🧩 增量重建完成: '{payload['filename']}' [补丁 {payload['content_len'] / 1024:.1f}KB → 文件 {rebuilt_size / 1024 ** 2:.2f}MB]", 'success')))
+            else:
+                save_path = os.path.join(self.download_dir, payload['filename'])
+                part_path = save_path + '.part'
+                with open(part_path, 'wb') as f:
+                    for block in plain_blocks:
+                        f.write(block)
+                os.replace(part_path, save_path)
+                part_path = None
+            self.status_queue.put(('log', (f"🔓 解密成功 (v{payload['version']})，载荷大小: {payload['content_len']} 字节", 'info')))
+        except Exception as decrypt_error:
+            error_detail = str(decrypt_error) if decrypt_error else "未知解密错误"
+            self.status_queue.put(('log', (f"❌ 解密失败: {error_detail}", 'error')))
+            
+            # 记录文件信息用于调试
+            file_info = f"文件名: {item.get('name', 'unknown')}, 大小: {downloaded_size} 字节"
+            self.status_queue.put(('log', (f"🔍 解密失败的文件信息: {file_info}", 'warning')))
+            
+            # 安全修复：只删除本地未完成的文件，不删除服务器文件
+            # 因为可能是其他人上传的文件，删除服务器文件会影响其他用户
+            if part_path and os.path.exists(part_path):
+                try:
+                    os.remove(part_path)
+                    self.status_queue.put(('log', (f"🗑️ 已删除本地解密失败的文件: {item.get('name', 'unknown')}", 'info')))
+                except Exception as e:
+                    self.status_queue.put(('log', (f"⚠️ 删除本地文件失败: {str(e)}", 'warning')))
+            
+            self.status_queue.put(('log', (f"💡 提示: 服务器文件已保留，可能是其他用户的文件", 'info')))
+            return False
+        
+        download_time_ms = (time.time() - start_time) * 1000
+        
+        if payload['is_bundle']:
+            # 包内全部文件路径合并为一次剪切板复制
+            paths_text = '\n'.join(os.path.abspath(path) for path in saved_paths)
+            if self._is_clipboard_change_safe(paths_text):
+                self._safe_copy_to_clipboard(paths_text, f"{len(saved_paths)} 个文件路径")
+            total_kb = payload['content_len'] / 1024
+            self.status_queue.put(('log', (f"📦 打包载荷已解包: {len(saved_paths)} 个文件 [{total_kb:.1f}KB, {download_time_ms:.1f}ms]", 'success')))
+        elif payload['is_from_text']:
+            # 文本内容复制到剪切板
+            text_content = content.decode('utf-8')
+            if self._is_clipboard_change_safe(text_content):
+                self._safe_copy_to_clipboard(text_content, f"文本内容 '{payload['filename']}'")
+            else:
+                self.status_queue.put(('log', (f"📝 文本内容 '{payload['filename']}' 已下载，但剪切板变化过于频繁，跳过复制 [{download_time_ms:.1f}ms]", 'warning')))
+        else:
+            # 安全复制文件路径到剪切板
+            file_path = os.path.abspath(save_path)
+            if self._is_clipboard_change_safe(file_path):
+                self._safe_copy_to_clipboard(file_path, f"文件路径 '{payload['filename']}'")
+            else:
+                self.status_queue.put(('log', (f"📁 文件 '{payload['filename']}' 已下载，但剪切板变化过于频繁，跳过复制 [{download_time_ms:.1f}ms]", 'warning')))
+            
+            file_size_kb = payload['content_len'] / 1024
+            self.status_queue.put(('log', (f"📁 文件 '{payload['filename']}' 已下载 [{file_size_kb:.1f}KB, {download_time_ms:.1f}ms]", 'success')))
+            self.executor.submit(self._publish_signature, save_path, priority=PRIORITY_BULK, group=save_path)
+        return True
+
     def handle_chunk(self, item, config, headers):
         """处理分片文件 - 异步优化版本"""
-        # 异步执行分片下载和处理
-        self.executor.submit(self._handle_chunk_async, item, config, headers)
+        # 分片按 upload_id 分组轮转，多个大文件同时下载时交替推进
+        self.executor.submit(self._handle_chunk_async, item, config, headers,
+                             priority=PRIORITY_BULK, group=item_upload_id(item))
     
     @safe_operation("分片处理")
     def _handle_chunk_async(self, item, config, headers):
@@ -1052,113 +1157,85 @@ class DownloaderApp:
         start_time = time.time()
         try:
             file_id, file_name = item['id'], item['name']
-            match = re.match(r"chunk_([^_]+)_(\d+)_(\d+)_(.+)\.encrypted", file_name)
-            if not match: 
+            parsed = parse_chunk_name(file_name)
+            if not parsed: 
                 return
                 
-            upload_id, chunk_index_str, total_chunks_str, encoded_filename = match.groups()
-            original_filename = urllib.parse.unquote(encoded_filename)
-            chunk_index, total_chunks = int(chunk_index_str), int(total_chunks_str)
-            
-            # 检查是否已完成合并，避免重复下载
-            with self.chunks_lock:
-                if upload_id in self.completed_uploads:
-                    self.status_queue.put(('log', (f"ℹ️ 跳过已完成的上传: {original_filename}", 'info')))
-                    return
-                
-                # 检查该分片是否已下载
-                if upload_id not in self.downloaded_chunks:
-                    self.downloaded_chunks[upload_id] = set()
-                    
-                if chunk_index in self.downloaded_chunks[upload_id]:
-                    self.status_queue.put(('log', (f"ℹ️ 跳过已下载的分片 {chunk_index}/{total_chunks} for {original_filename}", 'info')))
-                    return
-            
-            # 标记正在进行分片传输，启用快速轮询
-            self.is_chunked_transfer = True
-            
-            self.status_queue.put(('log', (f"📦 下载分片 {chunk_index}/{total_chunks} for {original_filename}", 'info')))
-            
-            # 使用会话下载分片
-            dl_url = config['DEFAULT']['BASE_DOWNLOAD_URL'] + item['fileUrl']
-            dl_response = self.session.get(dl_url, headers=headers, timeout=300)
-            if dl_response.status_code != 200: 
+            upload_id, chunk_key, total_chunks = parsed.upload_id, parsed.key, parsed.total_chunks
+            original_filename = urllib.parse.unquote(parsed.encoded_filename)
+            # 可变分片以字节偏移标识，固定分片以序号标识
+            chunk_label = f"@{parsed.offset}" if parsed.is_range else f"{chunk_key}/{total_chunks}"
+            
+            # 已完成的上传与已下载的分片在派发前由 UploadBatchPlanner 统一过滤，
+            # 重复写入同一分片时组装器位图直接忽略，这里无需再逐片持锁检查
+            # 流式下载分片到临时缓冲，逐段解密后拼成分片明文（大小受分片大小约束）
+            dl_url = config.endpoints.download_url(item['fileUrl'])
+            status_code, spool = download_to_spool(dl_url, headers=headers, timeout=300, transport=self.transport,
+                                                   spool_dir=self.temp_chunk_dir, max_memory=self.spool_memory)
+            if spool is None: 
+                self.listing_detector.forget(file_id)
                 return
                 
             # 解密分片内容
-            try:
-                payload = decrypt_and_parse_payload(dl_response.content, self.password)
-                chunk_content = base64.b64decode(payload['content_base64'])
-            except Exception as decrypt_error:
-                error_detail = str(decrypt_error) if decrypt_error else "未知解密错误"
-                self.status_queue.put(('log', (f"❌ 分片解密失败: {error_detail}", 'error')))
-                
-                # 记录分片信息
-                chunk_info = f"分片 {chunk_index}/{total_chunks}, 文件名: {original_filename}, 大小: {len(dl_response.content)} 字节"
-                self.status_queue.put(('log', (f"🔍 解密失败的分片信息: {chunk_info}", 'warning')))
-                
-                # 安全修复：只删除本地临时文件，不删除服务器文件
-                # 因为可能是其他人上传的文件，删除服务器文件会影响其他用户
-                if os.path.exists(chunk_path):
-                    try:
-                        os.remove(chunk_path)
-                        self.status_queue.put(('log', (f"🗑️ 已删除本地解密失败的分片: {chunk_index}/{total_chunks}", 'info')))
-                    except Exception as e:
-                        self.status_queue.put(('log', (f"⚠️ 删除本地分片失败: {str(e)}", 'warning')))
-                
-                self.status_queue.put(('log', (f"💡 提示: 服务器分片已保留，可能是其他用户的文件", 'info')))
-                
-                # 删除已下载的分片文件并退出
-                self._cleanup_temp_chunks(file_id)
-                return
+            with spool:
+                downloaded_size = spool.tell()
+                try:
+                    _, plain_blocks = iter_decrypted_payload(spool, self.password)
+                    chunk_content = b''.join(plain_blocks)
+                except Exception as decrypt_error:
+                    error_detail = str(decrypt_error) if decrypt_error else "未知解密错误"
+                    self.status_queue.put(('log', (f"❌ 分片解密失败: {error_detail}", 'error')))
+                    
+                    # 记录分片信息
+                    chunk_info = f"分片 {chunk_label}, 文件名: {original_filename}, 大小: {downloaded_size} 字节"
+                    self.status_queue.put(('log', (f"🔍 解密失败的分片信息: {chunk_info}", 'warning')))
+                    
+                    # 安全修复：不删除服务器文件，因为可能是其他人上传的文件
+                    # 解密失败的分片不会写入组装文件，组装器中对应位置保持未完成
+                    self.status_queue.put(('log', (f"💡 提示: 服务器分片已保留，可能是其他用户的文件", 'info')))
+                    return
             
             download_time_ms = (time.time() - start_time) * 1000
             chunk_size_kb = len(chunk_content) / 1024
             
-            # 保存分片文件
-            upload_temp_dir = os.path.join(self.temp_chunk_dir, upload_id)
-            if not os.path.exists(upload_temp_dir):
-                try:
-                    os.makedirs(upload_temp_dir)
-                except FileExistsError:
-                    pass
+            # 直接写入组装文件的对应偏移，无需临时分片文件与合并阶段
+            with self.chunks_lock:
+                assembler = self.assemblers.get(upload_id)
+                if assembler is None:
+                    part_path = os.path.join(self.temp_chunk_dir, f"{upload_id}.part")
+                    if parsed.is_range:
+                        assembler = RangeAssembler(part_path, parsed.file_size)
+                    else:
+                        assembler = ChunkAssembler(part_path, total_chunks)
+                    self.assemblers[upload_id] = assembler
             
-            chunk_file_path = os.path.join(upload_temp_dir, f"{chunk_index:03d}.chunk")
-            with open(chunk_file_path, 'wb') as f:
-                f.write(chunk_content)
+            if parsed.is_range:
+                all_received = assembler.write_range(parsed.offset, chunk_content)
+            else:
+                all_received = assembler.write_chunk(chunk_key, chunk_content)
             
             # 更新分片下载状态
             with self.chunks_lock:
-                self.downloaded_chunks[upload_id].add(chunk_index)
-                downloaded_count = len(self.downloaded_chunks[upload_id])
+                self.downloaded_chunks.setdefault(upload_id, set()).add(chunk_key)
+                if all_received:
+                    # 标记为已完成，防止重复处理
+                    self.completed_uploads.add(upload_id)
             
-            self.status_queue.put(('log', (f"✅ 分片 {chunk_index}/{total_chunks} 已保存 [{chunk_size_kb:.1f}KB, {download_time_ms:.1f}ms] ({downloaded_count}/{total_chunks})", 'success')))
+            self.status_queue.put(('log', (f"✅ 分片 {chunk_label} 已写入 [{chunk_size_kb:.1f}KB, {download_time_ms:.1f}ms] ({assembler.progress})", 'success')))
             
             # 异步删除服务器文件
-            self.executor.submit(delete_server_file, file_id, config, self.status_queue)
-            
-            # 检查是否可以合并文件（使用锁保证线程安全）
-            with self.locks_lock:
-                if upload_id not in self.merge_locks:
-                    self.merge_locks[upload_id] = threading.Lock()
-                merge_lock = self.merge_locks[upload_id]
+            self.executor.submit(delete_server_file, file_id, config, self.status_queue, self.transport)
             
-            with merge_lock:
-                # 再次检查是否已完成合并，防止重复合并
-                with self.chunks_lock:
-                    if upload_id in self.completed_uploads:
-                        return
-                    
-                    # 检查是否所有分片都已下载
-                    if len(self.downloaded_chunks[upload_id]) == total_chunks:
-                        # 标记为已完成，防止重复处理
-                        self.completed_uploads.add(upload_id)
-                        
-                        # 异步合并文件
-                        self.executor.submit(self._merge_chunks_async, upload_id, total_chunks, original_filename)
+            # write_chunk 仅在最后一个分片到达时返回 True 一次，无需额外的合并锁
+            if all_received:
+                self.executor.submit(self._merge_chunks_async, upload_id, assembler.received_count, original_filename)
                     
+        except AuthExpiredError:
+            self.listing_detector.forget(item.get('id'))
+            self.status_queue.put(('log', (f"🔐 登录已失效，分片 {item.get('name', 'unknown')} 将在Cookie刷新后重新下载", 'warning')))
         except Exception as e:
             self.stats['error_count'] += 1
+            self.listing_detector.forget(item.get('id'))
             error_msg = f"❌ 处理分片失败: {str(e)}"
             if hasattr(e, '__traceback__'):
                 import traceback
@@ -1168,39 +1245,18 @@ class DownloaderApp:
 
     @safe_operation("文件合并")
     def _merge_chunks_async(self, upload_id, total_chunks, original_filename):
-        """异步合并分片文件"""
+        """完成分片组装：截断组装文件并移动到下载目录"""
         start_time = time.time()
-        self.status_queue.put(('log', (f"🔄 开始合并分片: {original_filename} ({total_chunks} 个分片)", 'info')))
-        
-        upload_temp_dir = os.path.join(self.temp_chunk_dir, upload_id)
         final_path = os.path.join(self.download_dir, original_filename)
         
+        with self.chunks_lock:
+            assembler = self.assemblers.get(upload_id)
+        if assembler is None:
+            self.status_queue.put(('log', (f"⚠️ 合并任务已由其他线程完成: {original_filename}", 'warning')))
+            return
+        
         try:
-            # 短暂等待确保所有分片都已写入完成
-            time.sleep(0.1)
-            
-            if not os.path.isdir(upload_temp_dir):
-                self.status_queue.put(('log', (f"⚠️ 合并任务已由其他线程完成: {original_filename}", 'warning')))
-                return
-            
-            total_size = 0
-            # 高效的文件合并
-            with open(final_path, 'wb') as final_file:
-                for i in range(total_chunks):
-                    chunk_index = i + 1
-                    chunk_file_path = os.path.join(upload_temp_dir, f"{chunk_index:03d}.chunk")
-                    
-                    if not os.path.exists(chunk_file_path):
-                        raise FileNotFoundError(f"分片文件缺失: {chunk_file_path}")
-                    
-                    # 分块读取以节省内存
-                    with open(chunk_file_path, 'rb') as chunk_file:
-                        while True:
-                            chunk_data = chunk_file.read(8192)  # 8KB块
-                            if not chunk_data:
-                                break
-                            final_file.write(chunk_data)
-                            total_size += len(chunk_data)
+            total_size = assembler.finalize(final_path)
             
             # 安全复制路径到剪切板
             file_path = os.path.abspath(final_path)
@@ -1212,7 +1268,8 @@ class DownloaderApp:
             merge_time_ms = (time.time() - start_time) * 1000
             file_size_mb = total_size / (1024 * 1024)
             
-            self.status_queue.put(('log', (f"🎉 文件合并成功: '{original_filename}' [{file_size_mb:.2f}MB, {merge_time_ms:.1f}ms]", 'success')))
+            self.status_queue.put(('log', (f"🎉 文件合并成功: '{original_filename}' ({total_chunks} 个分片) [{file_size_mb:.2f}MB, {merge_time_ms:.1f}ms]", 'success')))
+            self.executor.submit(self._publish_signature, final_path, priority=PRIORITY_BULK, group=final_path)
             
             # 更新统计
             self.download_count += 1
@@ -1221,6 +1278,7 @@ class DownloaderApp:
             
         except Exception as e:
             self.stats['error_count'] += 1
+            assembler.abort()
             error_msg = f"❌ 合并文件失败: {str(e)}"
             if hasattr(e, '__traceback__'):
                 import traceback
@@ -1228,21 +1286,32 @@ class DownloaderApp:
                 error_msg += f"\n   详细错误: {tb_info.split('File')[0].strip()}"
             self.status_queue.put(('log', (error_msg, 'error')))
         finally:
-            # 清理临时文件夹
-            if os.path.exists(upload_temp_dir):
-                try:
-                    shutil.rmtree(upload_temp_dir, ignore_errors=True)
-                except Exception as e:
-                    self.status_queue.put(('log', (f"⚠️ 清理临时文件失败: {e}", 'warning')))
-            
             # 清理状态跟踪信息
             with self.chunks_lock:
                 self.downloaded_chunks.pop(upload_id, None)
+                self.assemblers.pop(upload_id, None)
                 # completed_uploads 保留，用于防止重复下载
-            
-            # 清理锁
-            with self.locks_lock:
-                self.merge_locks.pop(upload_id, None)
+
+    def _publish_signature(self, file_path):
+        """增量传输开启时，为下载目录中的大文件发布分块签名（上传端取回后即从服务器删除）"""
+        try:
+            if not os.path.exists(file_path) or not self.delta_settings.applies_to(os.path.getsize(file_path)):
+                return
+            signature = compute_signature(file_path, self.delta_settings.block_size)
+            file_name = os.path.basename(file_path)
+            encrypted_payload = encrypt_payload_bytes(signature.to_bytes(), self.password, file_name)
+            upload_queue = queue.Queue()
+            if upload_data(encrypted_payload, self.config_manager.get_config(), upload_queue,
+                           custom_filename=signature_upload_name(), transport=self.transport):
+                self.status_queue.put(('log', (f"🧾 已发布增量签名: '{file_name}' ({len(signature.weak)} 块)", 'info')))
+            else:
+                while not upload_queue.empty():
+                    msg_type, message = upload_queue.get_nowait()
+                    self.status_queue.put(('log', (f"增量签名发布失败: {message}", 'warning')))
+        except AuthExpiredError:
+            self.status_queue.put(('log', ("🔐 登录已失效，本次增量签名未发布", 'warning')))
+        except Exception as e:
+            self.status_queue.put(('log', (f"⚠️ 发布增量签名失败: {e}", 'warning')))
 
     def merge_chunks(self, upload_id, total_chunks, original_filename):
         """保持向后兼容的合并方法"""
@@ -1293,7 +1362,7 @@ class DownloaderApp:
             self.status_queue.put(('log', (f'DEBUG 空闲检查：{idle_seconds:.1f}s (阈值: {self.clipboard_protection["idle_reset_minutes"] * 60}s)', 'debug')))
             if idle_seconds > (self.clipboard_protection['idle_reset_minutes'] * 60):
                 # 长时间无活动，重置保护状态
-                self.clipboard_protection['change_timestamps'].clear()
+                self.clipboard_protection['rate_limiter'].reset()
                 self.clipboard_protection['clipboard_change_count'] = 0
                 self.clipboard_protection['last_clipboard_content'] = ''  # 清理内容缓存
                 self.status_queue.put(('log', ('INFO 剪切板保护状态已重置（长时间无活动）', 'info')))
@@ -1306,32 +1375,13 @@ class DownloaderApp:
                 self.status_queue.put(('log', (f'WARNING 剪切板操作间隔过短 ({time_diff:.1f}s < {self.clipboard_protection["min_interval_seconds"]}s)', 'debug')))
                 return False
             
-            # 清理超过1分钟的时间戳（在检查前先清理）
-            cutoff_time = current_time - 60
-            old_count = len(self.clipboard_protection['change_timestamps'])
-            while (self.clipboard_protection['change_timestamps'] and 
-                   self.clipboard_protection['change_timestamps'][0] < cutoff_time):
-                self.clipboard_protection['change_timestamps'].popleft()
-            new_count = len(self.clipboard_protection['change_timestamps'])
-            
-            if old_count != new_count:
-                self.status_queue.put(('log', (f'DEBUG 清理过期时间戳：{old_count} -> {new_count}', 'debug')))
-            
-            # 检查每分钟变化次数（在添加新时间戳前检查）
-            changes_this_minute = len(self.clipboard_protection['change_timestamps'])
-            self.status_queue.put(('log', (f'DEBUG 频率检查：{changes_this_minute}/{self.clipboard_protection["max_changes_per_minute"]} 次/分钟', 'debug')))
-            
-            if changes_this_minute >= self.clipboard_protection['max_changes_per_minute']:
-                self.status_queue.put(('log', (f'WARNING 剪切板变化过于频繁 ({changes_this_minute}/{self.clipboard_protection["max_changes_per_minute"]} 次/分钟)，已启用防护模式', 'warning')))
-                # 添加调试信息
-                if self.clipboard_protection['change_timestamps']:
-                    oldest = self.clipboard_protection['change_timestamps'][0]
-                    newest = self.clipboard_protection['change_timestamps'][-1] if len(self.clipboard_protection['change_timestamps']) > 1 else oldest
-                    self.status_queue.put(('log', (f'DEBUG 调试：时间戳范围 {oldest:.1f} - {newest:.1f}，当前时间 {current_time:.1f}', 'debug')))
-                return False
+            # 检查每分钟变化次数（令牌桶，无可用令牌即超出频率）
+            rate_limiter = self.clipboard_protection['rate_limiter']
+            self.status_queue.put(('log', (f'DEBUG 频率检查：可用令牌 {rate_limiter.available:.1f}/{rate_limiter.capacity:.0f}', 'debug')))
             
-            # 频率检查通过后，添加时间戳
-            self.clipboard_protection['change_timestamps'].append(current_time)
+            if not rate_limiter.try_acquire():
+                self.status_queue.put(('log', (f'WARNING 剪切板变化过于频繁 (超过 {self.clipboard_protection["max_changes_per_minute"]} 次/分钟)，已启用防护模式', 'warning')))
+                return False
             
             self.status_queue.put(('log', ('SUCCESS 剪切板安全检查通过，允许复制', 'debug')))
             
@@ -1370,7 +1420,7 @@ class DownloaderApp:
     def _get_clipboard_protection_status(self) -> str:
         """获取剪切板防护状态信息"""
         with self.clipboard_protection['operation_lock']:
-            changes_last_minute = len(self.clipboard_protection['change_timestamps'])
+            changes_last_minute = self.clipboard_protection['rate_limiter'].used
             last_change_ago = time.time() - self.clipboard_protection['last_clipboard_time']
             
             return (f"防护状态: 变化{changes_last_minute}/分钟, "
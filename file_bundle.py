@@ -0,0 +1,220 @@
+# file_bundle.py
+"""
+小文件打包 - 多个小文件合并为一个加密载荷上传，下载端一次解包
+
+每个文件单独上传需要一次加密、一次 multipart 请求、一个服务器列表条目、一次下载和一次删除；
+打包后这些开销按包计算。是否打包由 SmartFileAnalyzer.suggest_batch_size 决定（>1 即可打包），
+单包受 bundle_max_mb / bundle_max_files 限制。
+
+容器格式（作为v2载荷的明文，载荷头部带 BUNDLE 标志）：
+    magic 'UDCB'(4) | 版本(1) | 文件数(4) | 索引[文件名长度(2) | 大小(8) | 文件名(UTF-8)]... | 各文件内容依次拼接
+索引在前，解包时可边解密边按顺序写出每个文件。
+"""
+
+import os
+import struct
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+BUNDLE_MAGIC = b'UDCB'
+BUNDLE_VERSION = 1
+_BUNDLE_HEADER = struct.Struct('>4sBI')
+_BUNDLE_ENTRY = struct.Struct('>HQ')
+
+
+@dataclass
+class BundleSettings:
+    """打包参数"""
+    enabled: bool = True
+    max_bytes: int = 4 * 1024 * 1024
+    max_files: int = 200
+
+    @classmethod
+    def from_config(cls, config) -> 'BundleSettings':
+        section = config['DEFAULT']
+        try:
+            enabled = section.get('bundle_small_files', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+            max_bytes = int(float(section.get('bundle_max_mb', 4)) * 1024 * 1024)
+            max_files = int(section.get('bundle_max_files', 200))
+        except (TypeError, ValueError):
+            return cls()
+        return cls(enabled, max(64 * 1024, max_bytes), max(2, max_files))
+
+
+def _name_key(name: str) -> str:
+    # 接收端可能是不区分大小写的文件系统，按小写比较重名
+    return name.casefold()
+
+
+def _check_unique_names(names: Iterable[str]):
+    seen = set()
+    for name in names:
+        key = _name_key(name)
+        if key in seen:
+            raise ValueError(f"打包载荷中存在重名文件: {name!r}")
+        seen.add(key)
+
+
+def _default_batchable(file_size: int) -> bool:
+    """使用 SmartFileAnalyzer 的批量建议（延迟导入，避免与服务层循环依赖）"""
+    try:
+        from services.smart_assistant import get_default_file_analyzer
+    except ImportError:
+        return False
+    return get_default_file_analyzer().suggest_batch_size(file_size) > 1
+
+
+def plan_bundles(file_paths: Iterable[str], settings: BundleSettings,
+                 is_batchable: Optional[Callable[[int], bool]] = None) -> Tuple[List[List[str]], List[str]]:
+    """
+    按顺序把可打包的小文件分组，返回 (包列表, 单独上传的文件列表)。
+    只剩一个文件的包没有收益，退回单独上传；与当前包内文件重名（基本名）的文件也单独上传。
+    """
+    is_batchable = is_batchable or _default_batchable
+    bundles: List[List[str]] = []
+    singles: List[str] = []
+    current: List[str] = []
+    current_names = set()
+    current_bytes = 0
+
+    def close_current():
+        nonlocal current, current_names, current_bytes
+        if len(current) > 1:
+            bundles.append(current)
+        else:
+            singles.extend(current)
+        current, current_names, current_bytes = [], set(), 0
+
+    for path in file_paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            singles.append(path)
+            continue
+        if not settings.enabled or size > settings.max_bytes or not is_batchable(size):
+            singles.append(path)
+            continue
+        name_key = _name_key(os.path.basename(path))
+        if name_key in current_names:
+            singles.append(path)
+            continue
+        if current and (current_bytes + size > settings.max_bytes or len(current) >= settings.max_files):
+            close_current()
+        current.append(path)
+        current_names.add(name_key)
+        current_bytes += size
+    close_current()
+    return bundles, singles
+
+
+def bundle_name(file_count: int) -> str:
+    """包在载荷头部中的名称（只用于日志显示）"""
+    return f"bundle_{file_count}_files.udcb"
+
+
+def pack_bundle(entries: Sequence[Tuple[str, bytes]]) -> bytes:
+    """把 (文件名, 内容) 列表打包为容器字节；文件名不能重复"""
+    _check_unique_names(name for name, _ in entries)
+    parts = [_BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries))]
+    for name, content in entries:
+        name_bytes = name.encode('utf-8')
+        parts.append(_BUNDLE_ENTRY.pack(len(name_bytes), len(content)))
+        parts.append(name_bytes)
+    parts.extend(content for _, content in entries)
+    return b''.join(parts)
+
+
+def pack_files(file_paths: Sequence[str]) -> bytes:
+    """读取文件并打包，包内文件名为各文件的基本名（基本名重复时抛出 ValueError）"""
+    entries = []
+    for path in file_paths:
+        with open(path, 'rb') as f:
+            entries.append((os.path.basename(path), f.read()))
+    return pack_bundle(entries)
+
+
+class _BlockReader:
+    """把明文块迭代器包装为按长度读取的接口"""
+
+    def __init__(self, blocks: Iterable[bytes]):
+        self._blocks = iter(blocks)
+        self._buffer = b''
+
+    def read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                raise ValueError("打包载荷被截断")
+            self._buffer += block
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def iter_exact(self, size: int) -> Iterator[bytes]:
+        """按块产出恰好 size 字节，不把整个文件拼接到内存"""
+        remaining = size
+        while remaining > 0:
+            if not self._buffer:
+                block = next(self._blocks, None)
+                if block is None:
+                    raise ValueError("打包载荷被截断")
+                self._buffer = block
+            piece, self._buffer = self._buffer[:remaining], self._buffer[remaining:]
+            remaining -= len(piece)
+            yield piece
+
+    def drain(self):
+        """读完剩余块（驱动载荷的长度与认证检查），存在多余数据时报错"""
+        if self._buffer or any(self._blocks):
+            raise ValueError("打包载荷末尾存在多余数据")
+
+
+def _safe_name(name: str) -> str:
+    # 只取基本名，防止包内文件名携带目录穿越
+    name = os.path.basename(name.replace('\\', '/'))
+    if name in ('', '.', '..'):
+        raise ValueError(f"打包载荷中的文件名无效: {name!r}")
+    return name
+
+
+def unpack_bundle(blocks: Iterable[bytes], dest_dir: str) -> List[str]:
+    """
+    从明文块流式解包到 dest_dir，返回写出的文件路径。
+    各文件先写入 .part，整个载荷认证通过后才统一改名；失败时删除已写出的临时文件。
+    """
+    reader = _BlockReader(blocks)
+    magic, version, count = _BUNDLE_HEADER.unpack(reader.read_exact(_BUNDLE_HEADER.size))
+    if magic != BUNDLE_MAGIC:
+        raise ValueError("不是打包载荷")
+    if version != BUNDLE_VERSION:
+        raise ValueError(f"不支持的打包格式版本: {version}")
+
+    index = []
+    for _ in range(count):
+        name_len, size = _BUNDLE_ENTRY.unpack(reader.read_exact(_BUNDLE_ENTRY.size))
+        index.append((_safe_name(reader.read_exact(name_len).decode('utf-8')), size))
+    # 重名会让后写的 .part 覆盖先写的，须在写出任何文件之前拒绝
+    _check_unique_names(name for name, _ in index)
+
+    written = []
+    try:
+        for name, size in index:
+            part_path = os.path.join(dest_dir, name) + '.part'
+            written.append(part_path)
+            with open(part_path, 'wb') as f:
+                for piece in reader.iter_exact(size):
+                    f.write(piece)
+        reader.drain()
+    except BaseException:
+        for part_path in written:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+        raise
+
+    saved = []
+    for part_path in written:
+        save_path = part_path[:-len('.part')]
+        os.replace(part_path, save_path)
+        saved.append(save_path)
+    return saved
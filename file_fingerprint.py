@@ -0,0 +1,158 @@
+# file_fingerprint.py
+"""
+文件指纹服务 - 以 (路径, 大小, 修改时间) 记忆哈希结果，未变化的文件不再重复读取
+
+- quick(): 快速预筛指纹，由文件大小与首/中/尾采样块计算，读取量与文件大小无关；
+  指纹不同即可断定内容不同，相同时再以 sha256() 确认
+- sha256(): 完整内容 SHA-256，用于上传去重与断点续传清单
+- prefetch(): 在线程池中并行计算一批文件的指纹，结果写入记忆缓存
+"""
+
+import os
+import hashlib
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# 可选的更快的非加密哈希，仅用于快速预筛
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+SAMPLE_BLOCK_SIZE = 64 * 1024
+FULL_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _new_quick_hasher():
+    return xxhash.xxh3_128() if XXHASH_AVAILABLE else hashlib.blake2b(digest_size=16)
+
+
+class FileFingerprinter:
+    """带记忆缓存的文件指纹计算（线程安全）"""
+
+    def __init__(self, max_entries: int = 4096, workers: Optional[int] = None,
+                 sample_size: int = SAMPLE_BLOCK_SIZE):
+        self.max_entries = max_entries
+        self.sample_size = sample_size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.lock = threading.Lock()
+        # (绝对路径, 大小, 修改时间ns) -> {'quick': ..., 'sha256': ...}
+        self._memo: "OrderedDict[tuple, Dict[str, str]]" = OrderedDict()
+        self._path_keys: Dict[str, tuple] = {}
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _stat_key(file_path: str) -> tuple:
+        st = os.stat(file_path)
+        return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+    def _lookup(self, key: tuple, kind: str) -> Optional[str]:
+        with self.lock:
+            entry = self._memo.get(key)
+            if entry is None or kind not in entry:
+                return None
+            self._memo.move_to_end(key)
+            return entry[kind]
+
+    def _store(self, key: tuple, kind: str, value: str):
+        with self.lock:
+            entry = self._memo.get(key)
+            if entry is None:
+                # 同一路径的旧版本（大小或修改时间已变）不再有效
+                stale_key = self._path_keys.get(key[0])
+                if stale_key is not None:
+                    self._memo.pop(stale_key, None)
+                self._path_keys[key[0]] = key
+                entry = self._memo[key] = {}
+            entry[kind] = value
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                evicted_key, _ = self._memo.popitem(last=False)
+                if self._path_keys.get(evicted_key[0]) == evicted_key:
+                    del self._path_keys[evicted_key[0]]
+
+    def quick(self, file_path: str) -> str:
+        """快速指纹：大小 + 首/中/尾采样块；小文件直接哈希全部内容"""
+        key = self._stat_key(file_path)
+        cached = self._lookup(key, 'quick')
+        if cached is not None:
+            return cached
+
+        size = key[1]
+        hasher = _new_quick_hasher()
+        hasher.update(size.to_bytes(8, 'little'))
+        with open(file_path, 'rb') as f:
+            if size <= self.sample_size * 3:
+                hasher.update(f.read())
+            else:
+                for offset in (0, (size - self.sample_size) // 2, size - self.sample_size):
+                    f.seek(offset)
+                    hasher.update(f.read(self.sample_size))
+        value = f"{size:x}-{hasher.hexdigest()}"
+        self._store(key, 'quick', value)
+        return value
+
+    def sha256(self, file_path: str) -> str:
+        """完整内容 SHA-256（记忆缓存命中时不读文件）"""
+        key = self._stat_key(file_path)
+        cached = self._lookup(key, 'sha256')
+        if cached is not None:
+            return cached
+
+        sha256_hash = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for byte_block in iter(lambda: f.read(FULL_HASH_BLOCK_SIZE), b""):
+                sha256_hash.update(byte_block)
+        value = sha256_hash.hexdigest()
+        self._store(key, 'sha256', value)
+        return value
+
+    def same_content(self, path_a: str, path_b: str) -> bool:
+        """先比较快速指纹，相同时再以 SHA-256 确认"""
+        if self.quick(path_a) != self.quick(path_b):
+            return False
+        return self.sha256(path_a) == self.sha256(path_b)
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="Fingerprint")
+            return self._executor
+
+    def submit(self, file_path: str, full: bool = True) -> concurrent.futures.Future:
+        """在线程池中计算指纹，返回 Future"""
+        return self._get_executor().submit(self.sha256 if full else self.quick, file_path)
+
+    def prefetch(self, file_paths: Iterable[str], full: bool = False) -> Dict[str, Optional[str]]:
+        """并行计算一批文件的指纹并写入缓存，返回 路径 -> 指纹（读取失败为 None）"""
+        futures = {path: self.submit(path, full) for path in file_paths}
+        results = {}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except OSError:
+                results[path] = None
+        return results
+
+    def shutdown(self):
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+_default_fingerprinter = None
+_default_fingerprinter_lock = threading.Lock()
+
+
+def get_default_fingerprinter() -> FileFingerprinter:
+    """获取进程级共享指纹服务，上传、去重与文件分析共用同一份记忆缓存"""
+    global _default_fingerprinter
+    with _default_fingerprinter_lock:
+        if _default_fingerprinter is None:
+            _default_fingerprinter = FileFingerprinter()
+        return _default_fingerprinter
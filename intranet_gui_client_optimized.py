@@ -13,16 +13,12 @@ import threading
 import time
 import queue
 import keyring
-import math
 import base64
-import json
-from collections import deque
 from datetime import datetime, timedelta
 from tkinter import scrolledtext, messagebox, filedialog, ttk
 import tkinter as tk
 import urllib.parse
 from typing import Optional, Dict, Any, Tuple
-import concurrent.futures
 
 # CustomTkinter现代化UI支持（带降级处理）
 try:
@@ -31,21 +27,23 @@ try:
 except ImportError:
     CTK_AVAILABLE = False
 
-# 剪切板操作库
-import pyperclip
-try:
-    import win32clipboard
-    import win32con
-    WIN32_AVAILABLE = True
-except ImportError:
-    WIN32_AVAILABLE = False
-
 from config_manager import ConfigManager, run_cookie_server
-from network_utils import get_encryption_key, upload_data
-from cryptography.fernet import Fernet
-
-# 全局缓存和配置
-UPLOAD_CACHE = deque(maxlen=20)
+from clipboard_backend import ClipboardChangeProbe, create_clipboard_backend
+from upload_scheduler import UploadScheduler
+from transfer_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SMALL, TransferScheduler
+from clipboard_guard import ContentHasher, RecentlySeen, TokenBucket
+from log_view import ActivityLog
+from upload_pipeline import ChunkUploadPipeline, PipelineSettings
+from chunk_sizing import ChunkSizeController, ChunkSizingSettings
+from listing_watcher import range_chunk_name
+from upload_manifest import UploadManifestStore
+from upload_dedup import UploadDedupStore
+from file_fingerprint import get_default_fingerprinter
+from payload_compression import CompressionPolicy
+from file_bundle import BundleSettings, bundle_name, pack_files, plan_bundles
+from delta_sync import DeltaSettings, SignatureStore, build_delta_patch, fetch_signatures
+from network_utils import (encrypt_payload_bytes, get_payload_version, get_segment_size, payload_upload_name, upload_data,
+                           EncryptedFileStream, HttpTransport, DEFAULT_PAYLOAD_VERSION, DEFAULT_SEGMENT_SIZE, PAYLOAD_VERSION_V1)
 
 # 设计系统颜色配置
 COLOR_SCHEME = {
@@ -97,11 +95,6 @@ class OptimizedClipboardUploader:
         self.ui_framework = 'ctk' if CTK_AVAILABLE else 'tkinter'
         self.colors = COLOR_SCHEME['modern'] if CTK_AVAILABLE else COLOR_SCHEME['legacy']
         
-        # 性能优化配置
-        self.executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=3, thread_name_prefix="UploadWorker"
-        )
-        
         # 智能监听配置 - 优化间隔策略
         self.clipboard_monitor_config = {
             'base_interval': 0.5,      # 基础间隔0.5秒
@@ -125,15 +118,15 @@ class OptimizedClipboardUploader:
         self.clipboard_protection = {
             'last_text_content': '',       # 上次文本内容
             'last_text_hash': '',          # 上次文本哈希
-            'last_file_paths': [],         # 上次文件路径
+            'last_file_paths': RecentlySeen(10),  # 最近处理的文件路径
             'last_change_time': 0,         # 上次变化时间
             'min_interval_seconds': 0.5,   # 最小间隔0.5秒（降低限制）
             'max_changes_per_minute': 30,  # 每分钟最大30次变化（提高限制）
-            'change_timestamps': deque(maxlen=60),  # 变化时间戳记录
+            'rate_limiter': TokenBucket.per_minute(30),  # 变化频率令牌桶
             'is_self_operation': False,    # 是否是自己操作
             'operation_lock': threading.Lock(),  # 操作锁
-            'content_blacklist': set(),    # 内容黑名单（最近处理过的）
-            'blacklist_max_size': 50,      # 黑名单最大大小
+            'content_blacklist': RecentlySeen(50, ttl_seconds=2 * 60),  # 内容黑名单（最近处理过的，按加入顺序淘汰）
+            'content_hasher': ContentHasher(),  # 文本摘要（内容未变化时复用）
             'idle_reset_minutes': 2        # 2分钟无活动后重置状态
         }
         
@@ -147,6 +140,13 @@ class OptimizedClipboardUploader:
             'last_activity_time': time.time()
         }
         
+        # 活动日志：界面保留固定行数，完整历史写入 logs/uploader.log
+        self.activity_log = ActivityLog('uploader')
+        
+        # 上传队列状态显示
+        self._scheduler_backpressure = False
+        self._queue_status_text = None
+        
         # 初始化系统
         self._init_configuration()
         self._setup_ui_framework()
@@ -166,16 +166,45 @@ class OptimizedClipboardUploader:
             self.config_manager = ConfigManager()
             # 修复1: 必须先调用load_config()才能读取配置文件
             config = self.config_manager.load_config()
+            self.activity_log.configure(config)
             # 修复2: 使用小写键名匹配配置文件中的实际键名
             self.max_file_size_mb = int(config['DEFAULT'].get('max_file_size_mb', 6))
             self.chunk_size_mb = int(config['DEFAULT'].get('chunk_size_mb', 3)) 
             self.max_file_size_bytes = self.max_file_size_mb * 1024 * 1024
             self.chunk_size_bytes = self.chunk_size_mb * 1024 * 1024
             self.poll_interval = float(config['DEFAULT'].get('poll_interval_seconds', 10))
+            self.payload_version = get_payload_version(config)
+            self.segment_size = get_segment_size(config)
+            # 加密前压缩：按文件类别与采样压缩率决定，已压缩格式直接跳过
+            self.compression_policy = CompressionPolicy.from_config(config)
+            # 小文件打包：多个小文件合并为一个载荷上传
+            self.bundle_settings = BundleSettings.from_config(config)
+            # 增量传输：取回下载端签名，大文件只上传变化的块
+            self.delta_settings = DeltaSettings.from_config(config)
+            self.signature_store = SignatureStore.from_config(config)
+            self.pipeline_settings = PipelineSettings.from_config(config)
+            # 自适应分片：按实测吞吐与失败率在上下限之间调整分片大小
+            self.chunk_sizing = ChunkSizingSettings.from_config(config, self.chunk_size_bytes)
+            # 传输调度：文本 > 小文件 > 大文件分片，各类别独立并发上限，文本不会排在分片之后
+            self.transfer_scheduler = TransferScheduler.from_config(config, name="UploadTransfer")
+            # 共享连接池：覆盖传输调度器各类别的全部并发
+            self.transport = HttpTransport.from_config(
+                config, pool_size=sum(self.transfer_scheduler.limits.values()))
+            self.manifest_store = UploadManifestStore.from_config(config)
+            self.manifest_store.purge_expired()
+            # 持久化去重索引：文本与文件共用，重启后依然跳过已上传的内容
+            self.dedup_store = UploadDedupStore.from_config(config)
+            self.dedup_store.purge_expired()
+            # 剪切板后端：Windows 下以序列号探测变化，可配置为内存剪切板用于测试
+            self.clipboard_backend = create_clipboard_backend(config)
+            # 上传调度：剪切板连续变化去抖合并，上传在有界线程池中执行，监听线程不阻塞
+            self.upload_scheduler = UploadScheduler.from_config(
+                config, on_state=self._on_scheduler_state, transfer=self.transfer_scheduler)
             
             # 从配置文件更新剪切板保护参数
             self.clipboard_protection['min_interval_seconds'] = float(config['DEFAULT'].get('clipboard_min_interval_seconds', 0.5))
             self.clipboard_protection['max_changes_per_minute'] = int(config['DEFAULT'].get('clipboard_max_changes_per_minute', 30))
+            self.clipboard_protection['rate_limiter'] = TokenBucket.per_minute(self.clipboard_protection['max_changes_per_minute'])
             
             self._log_message(f"配置加载成功: 文件限制{self.max_file_size_mb}MB, 分块{self.chunk_size_mb}MB", 'info')
             self._log_message(f"剪切板保护配置: 最小间隔={self.clipboard_protection['min_interval_seconds']}s, 最大变化={self.clipboard_protection['max_changes_per_minute']}次/分钟", 'info')
@@ -186,6 +215,21 @@ class OptimizedClipboardUploader:
             self.max_file_size_bytes = 6 * 1024 * 1024
             self.chunk_size_bytes = 3 * 1024 * 1024 
             self.poll_interval = 10
+            self.payload_version = DEFAULT_PAYLOAD_VERSION
+            self.segment_size = DEFAULT_SEGMENT_SIZE
+            self.compression_policy = CompressionPolicy()
+            self.bundle_settings = BundleSettings()
+            self.delta_settings = DeltaSettings()
+            self.signature_store = None
+            self.pipeline_settings = PipelineSettings()
+            self.chunk_sizing = ChunkSizingSettings()
+            self.transfer_scheduler = TransferScheduler(name="UploadTransfer")
+            self.transport = HttpTransport(pool_size=sum(self.transfer_scheduler.limits.values()))
+            self.manifest_store = UploadManifestStore()
+            self.dedup_store = UploadDedupStore()
+            self.clipboard_backend = create_clipboard_backend()
+            self.upload_scheduler = UploadScheduler(on_state=self._on_scheduler_state,
+                                                    transfer=self.transfer_scheduler)
             print(f"警告: 配置加载失败，使用默认值: {e}")
     
     def _setup_ui_framework(self):
@@ -453,7 +497,7 @@ class OptimizedClipboardUploader:
             self.text_monitor_checkbox.pack(side=tk.LEFT, padx=(0, 20))
             
             # 文件监听复选框
-            if WIN32_AVAILABLE:
+            if self.clipboard_backend.supports_files:
                 self.file_monitor_checkbox = ctk.CTkCheckBox(
                     controls_frame,
                     text="监听剪切板 (文件)",
@@ -470,6 +514,15 @@ class OptimizedClipboardUploader:
             )
             self.monitor_status_label.pack(side=tk.RIGHT)
             
+            # 上传队列状态（背压提示）
+            self.queue_status_label = ctk.CTkLabel(
+                controls_frame,
+                text="队列: 空闲",
+                text_color=self.colors['text_secondary'],
+                font=ctk.CTkFont(size=10)
+            )
+            self.queue_status_label.pack(side=tk.RIGHT, padx=(10, 0))
+            
             # 防护状态显示
             self.protection_status_label = ctk.CTkLabel(
                 controls_frame,
@@ -493,7 +546,7 @@ class OptimizedClipboardUploader:
                 command=self._update_monitoring_state
             ).pack(anchor='w', pady=2)
             
-            if WIN32_AVAILABLE:
+            if self.clipboard_backend.supports_files:
                 ttk.Checkbutton(
                     controls_frame,
                     text="监听剪切板 (文件)",
@@ -507,6 +560,13 @@ class OptimizedClipboardUploader:
                 foreground=self.colors['text_secondary']
             )
             self.monitor_status_label.pack(anchor='w', pady=(5, 0))
+            
+            self.queue_status_label = ttk.Label(
+                controls_frame,
+                text="队列: 空闲",
+                foreground=self.colors['text_secondary']
+            )
+            self.queue_status_label.pack(anchor='w')
     
     def _create_activity_log_area(self):
         """创建活动日志区域 - 约10行左右"""
@@ -546,6 +606,7 @@ class OptimizedClipboardUploader:
             )
             self.log_area.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        self.activity_log.attach(self.log_area)
         self._log_message("日志系统初始化完成", 'success')
     
     def _start_services(self):
@@ -554,8 +615,48 @@ class OptimizedClipboardUploader:
             self.cookie_server_thread = threading.Thread(
                 target=run_cookie_server, args=(self.config_manager,), daemon=True)
             self.cookie_server_thread.start()
+            self.config_manager.add_listener(self._on_cookie_updated)
             self._log_message("Cookie同步服务已启动", 'info')
     
+    def _on_cookie_updated(self, snapshot):
+        """Cookie热更新：解除"等待登录"状态，等待中的上传用新Cookie自动重传"""
+        was_waiting = self.transport.auth_gate.waiting_for_auth
+        self.transport.auth_gate.refresh(snapshot)
+        if was_waiting:
+            self.status_queue.put(('success', "Cookie已刷新，等待中的上传自动继续"))
+        else:
+            self.status_queue.put(('info', "Cookie已同步，后续请求立即生效"))
+    
+    def _on_scheduler_state(self, state):
+        """调度器负载变化（工作线程中调用）：队列已满且有剪切板变化待派发时提示一次"""
+        if state.saturated and state.coalesced_waiting:
+            if not self._scheduler_backpressure:
+                self._scheduler_backpressure = True
+                self.status_queue.put(('warning', f"上传队列繁忙 (运行{state.running}/排队{state.queued})，"
+                                                  f"剪切板变化已合并，空闲后上传最新内容"))
+        elif not state.saturated:
+            self._scheduler_backpressure = False
+    
+    def _update_queue_status(self):
+        """刷新上传队列状态显示（主线程）"""
+        if not hasattr(self, 'queue_status_label'):
+            return
+        state = self.upload_scheduler.state()
+        if state.running or state.queued or state.coalesced_waiting:
+            text = f"队列: 运行{state.running} 排队{state.queued}" + (" (繁忙)" if state.saturated else "")
+        else:
+            text = "队列: 空闲"
+        if text != self._queue_status_text:
+            self._queue_status_text = text
+            color = self.colors['warning'] if state.saturated else self.colors['text_secondary']
+            try:
+                if CTK_AVAILABLE:
+                    self.queue_status_label.configure(text=text, text_color=color)
+                else:
+                    self.queue_status_label.configure(text=text, foreground=color)
+            except Exception:
+                pass
+    
     def _start_queue_processing(self):
         """启动队列处理服务"""
         self._process_status_queue()
@@ -595,7 +696,7 @@ class OptimizedClipboardUploader:
         self._log_message(f"UI框架: {ui_mode}", 'info')
         self._log_message(f"文件限制: {self.max_file_size_mb}MB | 分块大小: {self.chunk_size_mb}MB", 'info')
         
-        if WIN32_AVAILABLE:
+        if self.clipboard_backend.supports_files:
             self._log_message("文件剪切板支持: 可用", 'success')
         else:
             self._log_message("文件剪切板支持: 不可用 (Win32缺失)", 'warning')
@@ -616,25 +717,12 @@ class OptimizedClipboardUploader:
             }
             
             icon = icons.get(msg_type, 'ℹ️')
-            log_line = f"[{timestamp}] {icon} {message}\n"
+            log_line = f"[{timestamp}] {icon} {message}"
             
-            # 更新日志区域
-            if hasattr(self, 'log_area') and self.log_area:
-                try:
-                    self.log_area.config(state='normal')
-                    self.log_area.insert(tk.END, log_line)
-                    
-                    # 保持日志行数限制（最多200行）
-                    lines = self.log_area.get(1.0, tk.END).split('\n')
-                    if len(lines) > 200:
-                        self.log_area.delete(1.0, f"{len(lines)-150}.0")
-                    
-                    self.log_area.config(state='disabled')
-                    self.log_area.see(tk.END)
-                except Exception:
-                    pass
-            else:
-                print(log_line.strip())
+            # 放入日志缓冲（任意线程可调用），由状态队列处理周期批量刷新到界面
+            self.activity_log.append(log_line, msg_type)
+            if not hasattr(self, 'log_area'):
+                print(log_line)
             
             # 更新性能统计
             if msg_type == 'success' and '上传成功' in message:
@@ -657,6 +745,8 @@ class OptimizedClipboardUploader:
                     self._log_message(message, msg_type)
                 except queue.Empty:
                     break
+            self.activity_log.flush()
+            self._update_queue_status()
         except Exception as e:
             print(f"队列处理错误: {e}")
         
@@ -738,35 +828,43 @@ class OptimizedClipboardUploader:
             self._log_message(f"更新监听状态失败: {e}", 'error')
     
     def _intelligent_clipboard_monitor(self):
-        """智能剪切板监听 - 混合策略（操作+变化双重检测）"""
+        """智能剪切板监听 - 混合策略（操作+变化双重检测）
+        
+        每轮先探测剪切板序列号，未变化时不读取内容；变化后文本与文件列表各读取一次。
+        """
         recent_text = ""
         recent_file_paths = []
+        probe = ClipboardChangeProbe(self.clipboard_backend)
         
         self._log_message("智能监听线程已启动", 'monitor')
         
         while self.monitoring_active.is_set():
             try:
                 activity_detected = False
+                changed = probe.has_changed()
                 
                 # 文本监听检测
-                if self.text_monitoring_enabled.get():
+                if changed and self.text_monitoring_enabled.get():
                     try:
-                        current_text = pyperclip.paste().strip()
+                        current_text = self.clipboard_backend.get_text().strip()
                         if current_text and current_text != recent_text:
                             # 检查剪切板变化是否安全
                             if self._is_clipboard_change_safe(current_text, 'text'):
                                 recent_text = current_text
                                 activity_detected = True
                                 self.performance_stats['last_activity_time'] = time.time()
-                                self._process_text_upload(current_text)
+                                # 交给调度器：去抖窗口内的连续复制只上传最后一次
+                                self.upload_scheduler.submit_coalesced(
+                                    [(self._process_text_upload, (current_text,), PRIORITY_INTERACTIVE)])
                             else:
                                 # 记录被防护的内容
                                 self._log_message(f"⚠️ 检测到重复文本内容，已跳过处理 (长度: {len(current_text)})", 'warning')
                     except Exception:
-                        pass
+                        # 剪切板可能正被其他程序占用，下一轮重新读取
+                        probe.reset()
                 
                 # 文件监听检测
-                if self.file_monitoring_enabled.get() and WIN32_AVAILABLE:
+                if changed and self.file_monitoring_enabled.get() and self.clipboard_backend.supports_files:
                     try:
                         current_file_paths = self._get_current_file_paths()
                         if current_file_paths != recent_file_paths:
@@ -782,16 +880,11 @@ class OptimizedClipboardUploader:
                                 recent_file_paths = safe_file_paths
                                 activity_detected = True
                                 self.performance_stats['last_activity_time'] = time.time()
-                                for file_path in safe_file_paths:
-                                    threading.Thread(
-                                        target=self._create_upload_task,
-                                        args=(file_path,),
-                                        daemon=True
-                                    ).start()
+                                self.upload_scheduler.submit_coalesced(self._build_upload_tasks(safe_file_paths))
                             else:
                                 recent_file_paths = current_file_paths  # 更新但不处理
                     except Exception:
-                        pass
+                        probe.reset()
                 
                 # 调整监听间隔
                 self._adjust_monitoring_interval(activity_detected)
@@ -847,20 +940,9 @@ class OptimizedClipboardUploader:
     
     def _get_current_file_paths(self) -> list:
         """获取当前文件剪切板路径列表"""
-        try:
-            if not WIN32_AVAILABLE:
-                return []
-                
-            win32clipboard.OpenClipboard()
-            try:
-                if win32clipboard.IsClipboardFormatAvailable(win32con.CF_HDROP):
-                    paths = win32clipboard.GetClipboardData(win32con.CF_HDROP)
-                    return list(paths) if paths else []
-                return []
-            finally:
-                win32clipboard.CloseClipboard()
-        except Exception:
+        if not self.clipboard_backend.supports_files:
             return []
+        return self.clipboard_backend.get_file_paths()
     
     def _select_files(self):
         """选择文件"""
@@ -900,12 +982,9 @@ class OptimizedClipboardUploader:
             
             self._log_message(f"开始上传 {len(selected_items)} 个文件", 'upload')
             
-            for item_id in selected_items:
-                threading.Thread(
-                    target=self._create_upload_task,
-                    args=(item_id, item_id),
-                    daemon=True
-                ).start()
+            # 列表条目的 iid 即文件路径
+            for fn, args, priority in self._build_upload_tasks(selected_items, from_list=True):
+                self.upload_scheduler.submit(fn, *args, priority=priority)
                 
         except Exception as e:
             self._log_message(f"上传失败: {e}", 'error')
@@ -935,8 +1014,9 @@ class OptimizedClipboardUploader:
     def _process_text_upload(self, text_content):
         """处理文本上传"""
         try:
-            content_hash = hashlib.sha256(text_content.encode('utf-8')).hexdigest()
-            if content_hash in UPLOAD_CACHE:
+            data_bytes = text_content.encode('utf-8')
+            content_hash = hashlib.sha256(data_bytes).hexdigest()
+            if self.dedup_store.contains(content_hash):
                 self._log_message("文本内容未变，跳过", 'info')
                 return
             
@@ -945,18 +1025,91 @@ class OptimizedClipboardUploader:
             # 标记为自身操作，避免循环
             self._mark_self_operation()
             
-            data_bytes = text_content.encode('utf-8')
             encrypted_payload = self._create_and_encrypt_payload(
                 data_bytes, self.password, "clipboard_text.txt", is_from_text=True)
             
             config = self.config_manager.get_config() if self.config_manager else None
-            if config and upload_data(encrypted_payload, config, self.status_queue):
-                UPLOAD_CACHE.append(content_hash)
+            if config and upload_data(encrypted_payload, config, self.status_queue,
+                                      custom_filename=payload_upload_name(is_from_text=True), transport=self.transport):
+                self.dedup_store.record(content_hash, len(data_bytes))
                 self._log_message("文本上传成功", 'success')
             
         except Exception as e:
             self._log_message(f"文本处理失败: {e}", 'error')
     
+    def _build_upload_tasks(self, file_paths, from_list=False):
+        """把一批文件拆分为 (函数, 参数, 优先级) 任务：小文件按建议打包为一个载荷，其余文件逐个上传
+
+        需要分片的大文件为 PRIORITY_BULK，其余为 PRIORITY_SMALL。
+        """
+        if self.payload_version == PAYLOAD_VERSION_V1:
+            bundles, singles = [], list(file_paths)
+        else:
+            bundles, singles = plan_bundles(file_paths, self.bundle_settings)
+        tasks = [(self._create_bundle_task, (bundle_paths, from_list), PRIORITY_SMALL) for bundle_paths in bundles]
+        for path in singles:
+            try:
+                priority = PRIORITY_BULK if os.path.getsize(path) > self.chunk_size_bytes else PRIORITY_SMALL
+            except OSError:
+                priority = PRIORITY_SMALL
+            tasks.append((self._create_upload_task, (path, path if from_list else None), priority))
+        return tasks
+    
+    def _create_bundle_task(self, file_paths, from_list=False):
+        """打包上传一组小文件（from_list 为 True 时同步更新文件列表中的状态）"""
+        try:
+            pending = []
+            for file_path in file_paths:
+                if not os.path.exists(file_path):
+                    self._log_message(f"文件不存在: {file_path}", 'error')
+                    continue
+                file_hash = get_default_fingerprinter().sha256(file_path)
+                if self.dedup_store.contains(file_hash):
+                    if from_list:
+                        self._update_file_status(file_path, '完成')
+                        self.file_completion_queue.put((file_path, time.time()))
+                    self._log_message(f"文件内容未变，跳过: {os.path.basename(file_path)}", 'info')
+                    continue
+                pending.append((file_path, file_hash, os.path.getsize(file_path)))
+            
+            if not pending:
+                return
+            
+            config = self.config_manager.get_config() if self.config_manager else None
+            if not config:
+                return
+            
+            # 标记为自身操作，避免循环
+            self._mark_self_operation()
+            
+            paths = [file_path for file_path, _, _ in pending]
+            if from_list:
+                for file_path in paths:
+                    self._update_file_status(file_path, '打包上传中')
+            self._log_message(f"打包上传 {len(paths)} 个小文件", 'upload')
+            
+            encrypted_payload = encrypt_payload_bytes(
+                pack_files(paths), self.password, bundle_name(len(paths)), version=self.payload_version,
+                compression=self.compression_policy, is_bundle=True)
+            success = upload_data(encrypted_payload, config, self.status_queue, transport=self.transport)
+            
+            for file_path, file_hash, file_size in pending:
+                if success:
+                    self.dedup_store.record(file_hash, file_size)
+                if from_list:
+                    self._update_file_status(file_path, '完成' if success else '失败')
+                    if success:
+                        self.file_completion_queue.put((file_path, time.time()))
+            
+            if success:
+                self.performance_stats['successful_uploads'] += len(pending)
+                self._log_message(f"打包上传成功: {len(pending)} 个文件", 'success')
+            else:
+                self._log_message(f"打包上传失败: {len(pending)} 个文件", 'error')
+                
+        except Exception as e:
+            self._log_message(f"打包上传失败: {e}", 'error')
+    
     def _create_upload_task(self, file_path, item_id=None):
         """创建上传任务"""
         try:
@@ -969,6 +1122,15 @@ class OptimizedClipboardUploader:
                 self._log_message(f"文件过大: {os.path.basename(file_path)}", 'error')
                 return
             
+            # 内容已上传过（含重启前）时跳过，不再重复加密和上传
+            file_hash = get_default_fingerprinter().sha256(file_path)
+            if self.dedup_store.contains(file_hash):
+                if item_id:
+                    self._update_file_status(item_id, '完成')
+                    self.file_completion_queue.put((item_id, time.time()))
+                self._log_message(f"文件内容未变，跳过: {os.path.basename(file_path)}", 'info')
+                return
+            
             # 标记为自身操作，避免循环
             self._mark_self_operation()
             
@@ -976,11 +1138,17 @@ class OptimizedClipboardUploader:
             if item_id:
                 self._update_file_status(item_id, '上传中')
             
-            # 执行上传
-            if file_size > self.chunk_size_bytes:
-                success = self._process_chunk_upload(file_path, item_id)
-            else:
-                success = self._process_single_upload(file_path, item_id)
+            # 执行上传：下载端已有旧版本时优先增量上传，不适用时返回 None 并完整上传
+            success = None
+            if self.delta_settings.applies_to(file_size) and self.payload_version != PAYLOAD_VERSION_V1:
+                success = self._process_delta_upload(file_path, file_hash, file_size)
+            if success is None:
+                if file_size > self.chunk_size_bytes:
+                    success = self._process_chunk_upload(file_path, item_id, file_hash)
+                else:
+                    success = self._process_single_upload(file_path, item_id)
+                    if success:
+                        self.dedup_store.record(file_hash, file_size)
             
             if success:
                 if item_id:
@@ -1009,54 +1177,166 @@ class OptimizedClipboardUploader:
             pass
     
     def _process_single_upload(self, file_path, item_id=None):
-        """处理单文件上传"""
+        """处理单文件上传 - v2格式从磁盘边读边加密边上传，内存占用与文件大小无关"""
         try:
-            with open(file_path, 'rb') as f:
-                data_bytes = f.read()
+            config = self.config_manager.get_config() if self.config_manager else None
+            if not config:
+                return False
             
-            encrypted_payload = self._create_and_encrypt_payload(
-                data_bytes, self.password, os.path.basename(file_path))
+            if self.payload_version == PAYLOAD_VERSION_V1:
+                with open(file_path, 'rb') as f:
+                    data_bytes = f.read()
+                encrypted_payload = self._create_and_encrypt_payload(
+                    data_bytes, self.password, os.path.basename(file_path))
+                return upload_data(encrypted_payload, config, self.status_queue, transport=self.transport)
             
-            config = self.config_manager.get_config() if self.config_manager else None
-            if config:
-                return upload_data(encrypted_payload, config, self.status_queue)
+            with EncryptedFileStream(file_path, self.password, segment_size=self.segment_size,
+                                     compression=self.compression_policy) as stream:
+                return upload_data(stream, config, self.status_queue, transport=self.transport)
             
         except Exception as e:
             self._log_message(f"单文件上传失败: {e}", 'error')
         return False
     
-    def _process_chunk_upload(self, file_path, item_id=None):
-        """处理分片上传"""
+    def _process_delta_upload(self, file_path, file_hash, file_size):
+        """增量上传：返回上传结果；没有可用签名或变化过大时返回 None"""
+        base_name = os.path.basename(file_path)
+        config = self.config_manager.get_config() if self.config_manager else None
+        if not config or self.signature_store is None:
+            return None
+        try:
+            fetched = fetch_signatures(self.signature_store, config, self.password, self.status_queue, self.transport)
+            if fetched:
+                self._log_message(f"已取回 {fetched} 份下载端文件签名", 'info')
+        except Exception as e:
+            self._log_message(f"取回文件签名失败，使用已保存的签名: {e}", 'warning')
+        
+        patch = build_delta_patch(self.signature_store, self.delta_settings, file_path, file_hash,
+                                  max_patch_bytes=self.chunk_size_bytes)
+        if patch is None:
+            return None
+        
+        self._log_message(f"增量上传: {base_name} 只需发送 {len(patch) / 1024:.1f}KB / {file_size / 1024 ** 2:.1f}MB", 'upload')
+        encrypted_payload = encrypt_payload_bytes(
+            patch, self.password, base_name, version=self.payload_version,
+            compression=self.compression_policy, is_delta=True)
+        success = upload_data(encrypted_payload, config, self.status_queue, transport=self.transport)
+        if success:
+            # 下载端应用补丁后文件版本改变，等待其发布新签名。
+            # 不记录去重：补丁可能在下载端重建失败，此时须允许再次发送该版本
+            self.signature_store.discard(base_name)
+        return success
+    
+    def _process_chunk_upload(self, file_path, item_id=None, file_hash=None):
+        """处理分片上传 - 读取/加密/上传流水线并行，支持按清单断点续传"""
+        # 变长分片使用带字节偏移的分片名，旧下载端无法识别；v1 兼容模式固定使用编号分片
+        if self.chunk_sizing.enabled and self.payload_version != PAYLOAD_VERSION_V1:
+            return self._process_range_chunk_upload(file_path, item_id, file_hash)
         try:
             file_size = os.path.getsize(file_path)
-            total_chunks = math.ceil(file_size / self.chunk_size_bytes)
-            upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
+            base_name = os.path.basename(file_path)
+            encoded_name = urllib.parse.quote(base_name)
             
             config = self.config_manager.get_config() if self.config_manager else None
             if not config:
                 return False
             
-            success = True
-            
-            with open(file_path, 'rb') as f:
-                for i in range(total_chunks):
-                    chunk_data = f.read(self.chunk_size_bytes)
-                    if not chunk_data:
-                        break
-                    
-                    chunk_index = i + 1
-                    if item_id:
-                        self._update_file_status(item_id, f'分片 {chunk_index}/{total_chunks}')
-                    
-                    encrypted_payload = self._create_and_encrypt_payload(
-                        chunk_data, self.password, os.path.basename(file_path))
-                    
-                    chunk_filename = f"chunk_{upload_id}_{chunk_index:03d}_{total_chunks:03d}_{urllib.parse.quote(os.path.basename(file_path))}.encrypted"
-                    
-                    if not upload_data(encrypted_payload, config, self.status_queue, custom_filename=chunk_filename):
-                        success = False
-                        break
+            # 查找续传清单：同一文件沿用原 upload_id，只补传未确认的分片
+            new_upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
+            manifest = self.manifest_store.load_or_create(
+                base_name, file_hash or get_default_fingerprinter().sha256(file_path), file_size, self.chunk_size_bytes, new_upload_id)
+            upload_id = manifest.upload_id
+            total_chunks = manifest.total_chunks
+            pending_chunks = manifest.pending_chunks()
+            if manifest.is_resumed:
+                self._log_message(
+                    f"断点续传: {base_name} 已确认 {total_chunks - len(pending_chunks)}/{total_chunks} 个分片，"
+                    f"从分片 {pending_chunks[0] if pending_chunks else total_chunks} 继续", 'upload')
+            
+            def encrypt_chunk(chunk_data, chunk_index):
+                return self._create_and_encrypt_payload(chunk_data, self.password, base_name)
+            
+            def upload_chunk(encrypted_payload, chunk_index):
+                chunk_filename = f"chunk_{upload_id}_{chunk_index:03d}_{total_chunks:03d}_{encoded_name}.encrypted"
+                # 每个分片取最新配置快照，上传途中同步的新Cookie立即生效
+                if not upload_data(encrypted_payload, self.config_manager.get_config(), self.status_queue,
+                                   custom_filename=chunk_filename, transport=self.transport):
+                    return False
+                self.manifest_store.mark_acked(manifest, chunk_index)
+                return True
+            
+            def on_chunk_done(chunk_index, completed, total):
+                if item_id:
+                    self._update_file_status(item_id, f'分片 {completed}/{total}')
             
+            pipeline = ChunkUploadPipeline(
+                encrypt_chunk, upload_chunk, self.pipeline_settings, on_progress=on_chunk_done,
+                scheduler=self.transfer_scheduler, group=upload_id)
+            success = pipeline.run(file_path, self.chunk_size_bytes, total_chunks=total_chunks,
+                                   chunk_indices=pending_chunks)
+            if success:
+                self.manifest_store.remove(manifest)
+                self.dedup_store.record(manifest.file_hash, file_size, upload_id)
+            else:
+                self._log_message(f"分片上传中断，已保存续传进度: {base_name}", 'warning')
+            return success
+            
+        except Exception as e:
+            self._log_message(f"分片上传失败: {e}", 'error')
+        return False
+    
+    def _process_range_chunk_upload(self, file_path, item_id=None, file_hash=None):
+        """可变大小分片上传 - 分片大小随实测吞吐调整，分片名携带字节偏移，清单按字节区间续传"""
+        try:
+            file_size = os.path.getsize(file_path)
+            base_name = os.path.basename(file_path)
+            encoded_name = urllib.parse.quote(base_name)
+            
+            config = self.config_manager.get_config() if self.config_manager else None
+            if not config:
+                return False
+            
+            new_upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
+            manifest = self.manifest_store.load_or_create(
+                base_name, file_hash or get_default_fingerprinter().sha256(file_path), file_size, 0, new_upload_id)
+            upload_id = manifest.upload_id
+            pending_ranges = manifest.pending_ranges()
+            if manifest.is_resumed:
+                self._log_message(
+                    f"断点续传: {base_name} 已确认 {manifest.acked_bytes / 1024 ** 2:.1f}/{file_size / 1024 ** 2:.1f}MB，"
+                    f"剩余 {len(pending_ranges)} 个区间", 'upload')
+            
+            controller = ChunkSizeController(
+                self.chunk_sizing, on_decision=lambda message: self._log_message(f"{base_name}: {message}", 'info'))
+            
+            def encrypt_chunk(chunk_data, offset):
+                return self._create_and_encrypt_payload(chunk_data, self.password, base_name)
+            
+            def upload_chunk(encrypted_payload, offset, length):
+                chunk_filename = range_chunk_name(upload_id, offset, file_size, encoded_name)
+                if not upload_data(encrypted_payload, self.config_manager.get_config(), self.status_queue,
+                                   custom_filename=chunk_filename, transport=self.transport):
+                    return False
+                self.manifest_store.mark_range_acked(manifest, offset, length)
+                return True
+            
+            def on_chunk_done(offset, completed_bytes, total_bytes):
+                if item_id:
+                    self._update_file_status(item_id, f'分片 {completed_bytes / total_bytes:.0%}')
+            
+            pipeline = ChunkUploadPipeline(
+                encrypt_chunk, upload_chunk, self.pipeline_settings, on_progress=on_chunk_done,
+                scheduler=self.transfer_scheduler, group=upload_id)
+            success = pipeline.run_ranges(file_path, pending_ranges, controller, total_bytes=file_size)
+            if success:
+                self.manifest_store.remove(manifest)
+                self.dedup_store.record(manifest.file_hash, file_size, upload_id)
+                if controller.samples:
+                    self._log_message(
+                        f"{base_name}: {controller.samples} 个分片, 失败 {controller.failures} 次, "
+                        f"结束时分片 {controller.next_size() / 1024 ** 2:.2f}MB", 'info')
+            else:
+                self._log_message(f"分片上传中断，已保存续传进度: {base_name}", 'warning')
             return success
             
         except Exception as e:
@@ -1064,15 +1344,10 @@ class OptimizedClipboardUploader:
         return False
     
     def _create_and_encrypt_payload(self, data_bytes, password, original_filename, is_from_text=False):
-        """创建和加密载荷"""
-        key = get_encryption_key(password)
-        fernet = Fernet(key)
-        payload = {
-            "filename": original_filename,
-            "content_base64": base64.b64encode(data_bytes).decode('utf-8'),
-            "is_from_text": is_from_text
-        }
-        return fernet.encrypt(json.dumps(payload).encode('utf-8'))
+        """创建和加密载荷（格式版本由配置 payload_version 决定，v2载荷按配置 compression 先压缩）"""
+        return encrypt_payload_bytes(
+            data_bytes, password, original_filename, is_from_text, version=self.payload_version,
+            compression=self.compression_policy)
     
     def _on_closing(self):
         """窗口关闭处理"""
@@ -1080,9 +1355,12 @@ class OptimizedClipboardUploader:
             try:
                 self.monitoring_active.clear()
                 self.cleanup_active.clear()
-                if self.executor:
-                    self.executor.shutdown(wait=False)
+                self.upload_scheduler.shutdown()
+                self.transfer_scheduler.shutdown(wait=False)
+                self.transport.close()
+                self.dedup_store.close()
                 self._log_message("程序正在关闭...", 'info')
+                self.activity_log.close()
             except:
                 pass
             finally:
@@ -1098,9 +1376,12 @@ class OptimizedClipboardUploader:
                 self.clipboard_protection['is_self_operation'] = False
                 return False
             
-            # 检查内容是否在黑名单中
-            content_hash = hashlib.sha256(new_content.encode('utf-8')).hexdigest()
-            if content_hash in self.clipboard_protection['content_blacklist']:
+            # 检查内容是否在黑名单中（文本取摘要，文件直接以路径为键）
+            if content_type == 'text':
+                content_key = self.clipboard_protection['content_hasher'].digest(new_content)
+            else:
+                content_key = ('file', new_content)
+            if content_key in self.clipboard_protection['content_blacklist']:
                 return False
             
             # 检查内容是否相同
@@ -1115,7 +1396,7 @@ class OptimizedClipboardUploader:
             idle_seconds = current_time - self.clipboard_protection['last_change_time']
             if idle_seconds > (self.clipboard_protection['idle_reset_minutes'] * 60):
                 # 长时间无活动，重置保护状态
-                self.clipboard_protection['change_timestamps'].clear()
+                self.clipboard_protection['rate_limiter'].reset()
                 self.clipboard_protection['content_blacklist'].clear()
                 self._log_message('🔄 剪切板保护状态已重置（长时间无活动）', 'info')
             
@@ -1125,41 +1406,22 @@ class OptimizedClipboardUploader:
                 self._log_message(f'⏰ 剪切板操作间隔过短 ({time_diff:.1f}s < {self.clipboard_protection["min_interval_seconds"]}s)', 'debug')
                 return False
             
-            # 清理超过1分钟的时间戳（在检查前先清理）
-            cutoff_time = current_time - 60
-            while (self.clipboard_protection['change_timestamps'] and 
-                   self.clipboard_protection['change_timestamps'][0] < cutoff_time):
-                self.clipboard_protection['change_timestamps'].popleft()
-            
-            # 检查每分钟变化次数（在添加新时间戳前检查）
-            changes_this_minute = len(self.clipboard_protection['change_timestamps'])
-            if changes_this_minute >= self.clipboard_protection['max_changes_per_minute']:
-                self._log_message(f'⚠️ 剪切板变化过于频繁 ({changes_this_minute}/{self.clipboard_protection["max_changes_per_minute"]} 次/分钟)，已启用防护模式', 'warning')
+            # 检查每分钟变化次数（令牌桶，无可用令牌即超出频率）
+            if not self.clipboard_protection['rate_limiter'].try_acquire():
+                self._log_message(f'⚠️ 剪切板变化过于频繁 (超过 {self.clipboard_protection["max_changes_per_minute"]} 次/分钟)，已启用防护模式', 'warning')
                 return False
             
-            # 频率检查通过后，添加时间戳
-            self.clipboard_protection['change_timestamps'].append(current_time)
-            
             # 更新状态
             if content_type == 'text':
                 self.clipboard_protection['last_text_content'] = new_content
-                self.clipboard_protection['last_text_hash'] = content_hash
+                self.clipboard_protection['last_text_hash'] = content_key
             elif content_type == 'file':
-                if new_content not in self.clipboard_protection['last_file_paths']:
-                    self.clipboard_protection['last_file_paths'].append(new_content)
-                    # 保持列表大小
-                    if len(self.clipboard_protection['last_file_paths']) > 10:
-                        self.clipboard_protection['last_file_paths'].pop(0)
+                self.clipboard_protection['last_file_paths'].add(new_content)
             
             self.clipboard_protection['last_change_time'] = current_time
             
-            # 添加到黑名单
-            self.clipboard_protection['content_blacklist'].add(content_hash)
-            if len(self.clipboard_protection['content_blacklist']) > self.clipboard_protection['blacklist_max_size']:
-                # 清理旧的黑名单项
-                old_items = list(self.clipboard_protection['content_blacklist'])[:10]
-                for item in old_items:
-                    self.clipboard_protection['content_blacklist'].discard(item)
+            # 添加到黑名单（超出容量时淘汰最早加入的项）
+            self.clipboard_protection['content_blacklist'].add(content_key)
             
             return True
     
@@ -1171,7 +1433,7 @@ class OptimizedClipboardUploader:
     def _get_clipboard_protection_status(self) -> str:
         """获取剪切板防护状态信息"""
         with self.clipboard_protection['operation_lock']:
-            changes_last_minute = len(self.clipboard_protection['change_timestamps'])
+            changes_last_minute = self.clipboard_protection['rate_limiter'].used
             last_change_ago = time.time() - self.clipboard_protection['last_change_time']
             blacklist_size = len(self.clipboard_protection['content_blacklist'])
             
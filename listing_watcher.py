@@ -0,0 +1,342 @@
+# listing_watcher.py
+"""
+文件列表变更检测 - 下载端轮询的变更识别、自适应间隔与外部提示
+
+- ListingChangeDetector: 以 ETag 或响应体摘要识别列表是否变化，未变化时跳过解析；
+  变化时只返回新出现的条目，已派发的条目不再重复处理
+- AdaptivePollSchedule: 新 upload_id 出现时立即切换到突发快速轮询，空闲时逐步退避
+- ChangeNotifier: 可插拔的"新条目"提示接口，本地服务可主动推送提示唤醒轮询线程
+- UploadBatchPlanner: 将新条目按 upload_id 分组、一次性过滤已完成的分片，按最早未完成优先排序
+"""
+
+import re
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+# 固定分片: chunk_<upload_id>_<序号>_<总数>_<文件名>.encrypted
+_CHUNK_NAME_PATTERN = re.compile(r"chunk_([^_]+)_(\d+)_(\d+)_(.+)\.encrypted")
+# 可变分片: chunk_<upload_id>_o<字节偏移>_<文件大小>_<文件名>.encrypted
+_RANGE_CHUNK_NAME_PATTERN = re.compile(r"chunk_([^_]+)_o(\d+)_(\d+)_(.+)\.encrypted")
+
+
+class ChunkRef(NamedTuple):
+    """分片文件名解析结果
+
+    key 为同一上传内分片的唯一键：固定分片取序号，可变分片取字节偏移。
+    可变分片没有总分片数（total_chunks 为 0），以 offset/file_size 判断是否到齐。
+    """
+    upload_id: str
+    key: int
+    total_chunks: int
+    encoded_filename: str
+    offset: Optional[int] = None
+    file_size: Optional[int] = None
+
+    @property
+    def is_range(self) -> bool:
+        return self.offset is not None
+
+
+def parse_chunk_name(name) -> Optional[ChunkRef]:
+    """解析分片文件名（固定分片与可变分片两种格式）；非分片返回 None"""
+    match = _CHUNK_NAME_PATTERN.match(name)
+    if match:
+        upload_id, chunk_index, total_chunks, encoded_filename = match.groups()
+        return ChunkRef(upload_id, int(chunk_index), int(total_chunks), encoded_filename)
+    match = _RANGE_CHUNK_NAME_PATTERN.match(name)
+    if match:
+        upload_id, offset, file_size, encoded_filename = match.groups()
+        return ChunkRef(upload_id, int(offset), 0, encoded_filename, int(offset), int(file_size))
+    return None
+
+
+def range_chunk_name(upload_id: str, offset: int, file_size: int, encoded_filename: str) -> str:
+    """可变分片的文件名：以字节偏移和文件总大小代替序号和总数"""
+    return f"chunk_{upload_id}_o{offset}_{file_size}_{encoded_filename}.encrypted"
+
+
+def item_upload_id(item) -> str:
+    """条目所属的上传标识：分片取文件名中的 upload_id，单文件以条目ID作为标识"""
+    parsed = parse_chunk_name(item.get('name', ''))
+    return parsed.upload_id if parsed else str(item.get('id'))
+
+
+@dataclass
+class ListingDelta:
+    """一次列表查询相对上一次的变化"""
+    changed: bool
+    new_items: List[dict] = field(default_factory=list)
+    new_upload_ids: Set[str] = field(default_factory=set)
+    listed_upload_ids: Set[str] = field(default_factory=set)
+    total_items: int = 0
+
+
+class ListingChangeDetector:
+    """列表变更检测器（线程安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._etag = None
+        self._digest = None
+        self._known_ids = set()
+        self._known_upload_ids = set()
+
+    def reset(self):
+        """清空已知状态，下一次查询视为全新列表（重新开始监控时调用）"""
+        with self.lock:
+            self._etag = None
+            self._digest = None
+            self._known_ids.clear()
+            self._known_upload_ids.clear()
+
+    def request_headers(self) -> dict:
+        """条件请求头：服务器支持 ETag 时未变化的列表返回304，省去响应体传输"""
+        with self.lock:
+            return {'If-None-Match': self._etag} if self._etag else {}
+
+    def observe(self, response, check_payload: Optional[Callable[[dict], None]] = None) -> ListingDelta:
+        """根据查询响应计算变化；响应体未变化时不做JSON解析
+
+        check_payload 在解析后、更新已知状态前调用（如登录失效检查），抛出异常时本次响应不被记录。
+        """
+        if response.status_code == 304:
+            return ListingDelta(changed=False)
+        response.raise_for_status()
+
+        body = response.content
+        digest = hashlib.sha256(body).digest()
+        with self.lock:
+            if digest == self._digest:
+                self._etag = response.headers.get('ETag')
+                return ListingDelta(changed=False, total_items=len(self._known_ids))
+
+        data = json.loads(body)
+        if check_payload is not None:
+            check_payload(data)
+        items = data.get("items", []) if data.get("success") else []
+
+        with self.lock:
+            current_ids = {item['id'] for item in items}
+            current_upload_ids = {item_upload_id(item) for item in items}
+            new_items = [item for item in items if item['id'] not in self._known_ids]
+            new_upload_ids = current_upload_ids - self._known_upload_ids
+            # 已从服务器消失的条目随之移出已知集合，内存占用与列表长度一致
+            self._known_ids = current_ids
+            self._known_upload_ids = current_upload_ids
+            # 摘要与 ETag 只记录通过检查的响应，未变化（含304）即表示与已接受的列表相同
+            self._digest = digest
+            self._etag = response.headers.get('ETag')
+        return ListingDelta(changed=True, new_items=new_items, new_upload_ids=new_upload_ids,
+                            listed_upload_ids=current_upload_ids, total_items=len(items))
+
+    def forget(self, item_id):
+        """处理失败的条目移出已知集合并使摘要失效，下一次轮询重新派发"""
+        with self.lock:
+            self._known_ids.discard(item_id)
+            self._digest = None
+            self._etag = None
+
+
+class AdaptivePollSchedule:
+    """自适应轮询间隔
+
+    - 出现新 upload_id 或收到外部提示：进入突发窗口，按 burst_interval 快速轮询
+    - 分片传输进行中：按 chunk_interval 轮询
+    - 空闲：每3次空轮询按 increase_factor 递增，上限 max_interval
+    """
+
+    def __init__(self, base_interval=5, max_interval=60, chunk_interval=1,
+                 increase_factor=1.5, burst_interval=0.5, burst_window=5):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.chunk_interval = chunk_interval
+        self.increase_factor = increase_factor
+        self.burst_interval = burst_interval
+        self.burst_window = burst_window
+        self.current_interval = base_interval
+        self.consecutive_empty_polls = 0
+        self._burst_until = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> 'AdaptivePollSchedule':
+        section = config['DEFAULT']
+        defaults = cls()
+        try:
+            return cls(
+                base_interval=int(section.get('base_poll_interval', defaults.base_interval)),
+                max_interval=int(section.get('max_poll_interval', defaults.max_interval)),
+                chunk_interval=int(section.get('chunk_poll_interval_seconds', defaults.chunk_interval)),
+                increase_factor=float(section.get('poll_increase_factor', defaults.increase_factor)),
+                burst_interval=float(section.get('burst_poll_interval_seconds', defaults.burst_interval)),
+                burst_window=float(section.get('burst_window_seconds', defaults.burst_window))
+            )
+        except (TypeError, ValueError):
+            return defaults
+
+    def reset(self):
+        self.current_interval = self.base_interval
+        self.consecutive_empty_polls = 0
+        self._burst_until = 0.0
+
+    @property
+    def in_burst(self) -> bool:
+        return time.time() < self._burst_until
+
+    def start_burst(self):
+        """进入突发窗口（新上传出现或收到外部提示）"""
+        self._burst_until = time.time() + self.burst_window
+        self.consecutive_empty_polls = 0
+        self.current_interval = self.burst_interval
+
+    def on_poll(self, delta: ListingDelta, chunked_transfer: bool) -> float:
+        """根据本次查询结果更新并返回下一次轮询间隔"""
+        if delta.new_upload_ids:
+            self.start_burst()
+        elif delta.new_items:
+            self.consecutive_empty_polls = 0
+            self.current_interval = self.chunk_interval if chunked_transfer else self.base_interval
+        elif self.in_burst:
+            self.current_interval = self.burst_interval
+        elif chunked_transfer:
+            self.current_interval = self.chunk_interval
+        else:
+            if self.current_interval < self.base_interval:
+                self.current_interval = self.base_interval
+            self.consecutive_empty_polls += 1
+            # 每3次空轮询增加一次间隔
+            if self.consecutive_empty_polls % 3 == 0:
+                self.current_interval = min(self.current_interval * self.increase_factor, self.max_interval)
+        return self.current_interval
+
+
+@dataclass
+class UploadBatch:
+    """同一 upload_id 下本轮待派发的条目（分片按序号/字节偏移升序）"""
+    upload_id: str
+    items: List[dict]
+    is_chunked: bool
+    first_seen: float
+    total_chunks: int = 1         # 可变分片为 0（总数未知）
+    received_chunks: int = 0
+
+
+class UploadBatchPlanner:
+    """批量派发计划：一轮查询只做一次分组与过滤，最早出现且未完成的上传优先派发"""
+
+    def __init__(self):
+        self._first_seen: Dict[str, float] = {}
+
+    def reset(self):
+        self._first_seen.clear()
+
+    def plan(self, delta: ListingDelta, completed_uploads, downloaded_chunks) -> List[UploadBatch]:
+        """按 upload_id 分组新条目，剔除已完成的上传和已下载的分片
+
+        completed_uploads / downloaded_chunks 由调用方在同一把锁内传入，整轮只持锁一次。
+        """
+        now = time.time()
+        batches: Dict[str, UploadBatch] = {}
+        for item in delta.new_items:
+            parsed = parse_chunk_name(item.get('name', ''))
+            if parsed:
+                upload_id, chunk_index, total_chunks = parsed.upload_id, parsed.key, parsed.total_chunks
+                if upload_id in completed_uploads or chunk_index in downloaded_chunks.get(upload_id, ()):
+                    continue
+            else:
+                upload_id, chunk_index, total_chunks = str(item.get('id')), 0, 1
+
+            batch = batches.get(upload_id)
+            if batch is None:
+                batch = batches[upload_id] = UploadBatch(
+                    upload_id=upload_id,
+                    items=[],
+                    is_chunked=parsed is not None,
+                    first_seen=self._first_seen.setdefault(upload_id, now),
+                    total_chunks=total_chunks,
+                    received_chunks=len(downloaded_chunks.get(upload_id, ()))
+                )
+            batch.items.append((chunk_index, item))
+
+        for batch in batches.values():
+            batch.items = [item for _, item in sorted(batch.items, key=lambda pair: pair[0])]
+
+        # 已从列表消失的上传不再跟踪首次出现时间
+        if delta.changed:
+            for upload_id in list(self._first_seen):
+                if upload_id not in delta.listed_upload_ids:
+                    del self._first_seen[upload_id]
+
+        return sorted(batches.values(), key=lambda batch: (batch.first_seen, batch.upload_id))
+
+
+class ChangeNotifier:
+    """变更提示接口：实现方在得知有新条目时调用 on_hint 唤醒轮询线程
+
+    默认实现不产生任何提示，轮询完全依赖自适应间隔。
+    """
+
+    def start(self, on_hint: Callable[[dict], None]):
+        pass
+
+    def stop(self):
+        pass
+
+
+class _HintRequestHandler(BaseHTTPRequestHandler):
+    on_hint = None
+
+    def do_POST(self):
+        if self.path != '/notify':
+            self.send_error(404, "Not Found")
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            hint = json.loads(self.rfile.read(content_length) or b'{}') if content_length else {}
+        except ValueError:
+            hint = {}
+        if self.on_hint:
+            self.on_hint(hint)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # 提示请求频繁，不输出访问日志
+        pass
+
+
+class LocalHintNotifier(ChangeNotifier):
+    """本地提示服务：监听 localhost:port，收到 POST /notify 即唤醒轮询
+
+    供上传端或本地代理在上传完成后推送"有新条目"提示，实现亚秒级拾取而不增加对共享服务器的请求量。
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self._server: Optional[HTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_hint):
+        handler = type('HintHandler', (_HintRequestHandler,), {'on_hint': staticmethod(on_hint)})
+        self._server = HTTPServer(('localhost', self.port), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="ChangeNotifier")
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def create_notifier(config) -> ChangeNotifier:
+    """按配置创建提示器：change_notify_port 为0时不启用本地提示服务"""
+    try:
+        port = int(config['DEFAULT'].get('change_notify_port', 0))
+    except (TypeError, ValueError):
+        port = 0
+    return LocalHintNotifier(port) if port > 0 else ChangeNotifier()
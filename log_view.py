@@ -0,0 +1,121 @@
+# log_view.py
+"""
+活动日志视图 - 界面只保留固定行数，完整历史写入滚动日志文件
+
+任意线程调用 append() 只把日志行放入环形缓冲；主线程每个界面周期调用一次 flush()，
+把积压的行合并为一次插入，超出 max_lines 的旧行从顶部删除，并只滚动一次到底部。
+界面开销与运行时长无关；完整日志由 RotatingFileHandler 按大小轮转保存。
+"""
+
+import os
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+_LEVELS = {
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+    'debug': logging.DEBUG,
+}
+
+
+class ActivityLog:
+    """环形缓冲 + 批量插入的日志视图（append 线程安全，flush 只在主线程调用）"""
+
+    def __init__(self, name: str, max_lines: int = 500, log_dir: str = './logs/',
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        self.name = name
+        self.max_lines = max(10, max_lines)
+        self.lock = threading.Lock()
+        self._pending = deque(maxlen=self.max_lines)
+        self._widget = None
+        self._line_count = 0
+        self._logger = logging.getLogger(f"activity.{name}")
+        self._logger.setLevel(logging.DEBUG)
+        self._logger.propagate = False
+        self._handler: Optional[logging.Handler] = None
+        self._open_file(log_dir, max_bytes, backup_count)
+
+    def _open_file(self, log_dir: str, max_bytes: int, backup_count: int):
+        """log_dir 为空时不写日志文件；目录不可写时只保留界面日志"""
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+        if not log_dir:
+            return
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(os.path.join(log_dir, f"{self.name}.log"), maxBytes=max_bytes,
+                                          backupCount=backup_count, encoding='utf-8')
+        except OSError as e:
+            print(f"警告: 无法写入日志文件目录 {log_dir}: {e}")
+            return
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        self._logger.addHandler(handler)
+        self._handler = handler
+
+    def configure(self, config):
+        """按配置调整界面行数与日志文件（配置加载完成后调用）"""
+        section = config['DEFAULT']
+        try:
+            max_lines = int(section.get('ui_log_max_lines', 500))
+            max_bytes = int(float(section.get('log_file_max_mb', 5)) * 1024 * 1024)
+            backup_count = int(section.get('log_file_backup_count', 3))
+        except (TypeError, ValueError):
+            max_lines, max_bytes, backup_count = 500, 5 * 1024 * 1024, 3
+        with self.lock:
+            self.max_lines = max(10, max_lines)
+            self._pending = deque(self._pending, maxlen=self.max_lines)
+        self._open_file(section.get('log_dir', './logs/'), max_bytes, backup_count)
+
+    def attach(self, widget):
+        """绑定界面文本控件（tk.Text / ScrolledText / CTkTextbox），已缓冲的行在下次 flush 时显示"""
+        self._widget = widget
+        self._line_count = 0
+
+    def append(self, line: str, msg_type: str = 'info'):
+        """记录一行日志：立即写文件，界面显示等待下一次 flush"""
+        self._logger.log(_LEVELS.get(msg_type, logging.INFO), line)
+        with self.lock:
+            self._pending.append(line)
+
+    def flush(self):
+        """把积压的日志一次性插入控件并裁剪到 max_lines（主线程）"""
+        widget = self._widget
+        if widget is None:
+            return
+        with self.lock:
+            if not self._pending:
+                return
+            lines = list(self._pending)
+            self._pending.clear()
+
+        text = '\n'.join(lines) + '\n'
+        widget.configure(state='normal')
+        widget.insert('end', text)
+        self._line_count += text.count('\n')
+        excess = self._line_count - self.max_lines
+        if excess > 0:
+            widget.delete('1.0', f'{excess + 1}.0')
+            self._line_count -= excess
+        widget.configure(state='disabled')
+        widget.see('end')
+
+    def clear(self):
+        """清空界面日志（文件历史保留）"""
+        with self.lock:
+            self._pending.clear()
+        if self._widget is not None:
+            self._widget.configure(state='normal')
+            self._widget.delete('1.0', 'end')
+            self._widget.configure(state='disabled')
+        self._line_count = 0
+
+    def close(self):
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
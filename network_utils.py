@@ -2,78 +2,729 @@
 
 import json
 import base64
+import hashlib
 import os
+import struct
+import threading
+import time
 import requests
 import io
+import tempfile
+from collections import deque, namedtuple
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from requests.adapters import HTTPAdapter
 from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
+
+from config_manager import endpoints_of
+from payload_compression import CODEC_NONE, compress_stream, iter_decompress
 
 # --- 加密/解密核心函数 ---
 
-def get_encryption_key(password, salt=b'salt_for_bmad_clipboard'):
-    """根据密码派生一个安全的加密密钥。"""
+DEFAULT_SALT = b'salt_for_bmad_clipboard'
+PBKDF2_ITERATIONS = 390000
+
+# --- 载荷格式 ---
+# v1: Fernet(JSON{filename, content_base64, is_from_text})，体积约为原文的1.78倍
+# v2: 二进制信封，头部明文(经AEAD认证) + AES-256-GCM 原始字节密文，仅多出固定开销
+#     magic(4) | version(1) | flags(1) | 文件名长度(2) | 明文长度(8) | nonce(12) | 文件名(UTF-8) | 密文+tag
+#     分段模式(flags含SEGMENTED)在文件名前多一个段大小(4)，密文为逐段 AES-GCM(段密文+tag)，
+#     段nonce = nonce前7字节 | 段序号(4) | 末段标记(1)，可检测段的重排与截断
+#     压缩模式(flags含COMPRESSED)在文件名前多一个 压缩算法(1) | 原始长度(8)，明文长度指压缩后长度
+#     打包模式(flags含BUNDLE)的明文为多个小文件的容器（格式见 file_bundle.py），仅v2支持
+#     增量模式(flags含DELTA)的明文为相对下载端已有版本的补丁（格式见 delta_sync.py），仅v2支持
+PAYLOAD_VERSION_V1 = 1
+PAYLOAD_VERSION_V2 = 2
+DEFAULT_PAYLOAD_VERSION = PAYLOAD_VERSION_V2
+PAYLOAD_MAGIC = b'UDC2'
+PAYLOAD_FLAG_FROM_TEXT = 0x01
+PAYLOAD_FLAG_SEGMENTED = 0x02
+PAYLOAD_FLAG_COMPRESSED = 0x04
+PAYLOAD_FLAG_BUNDLE = 0x08
+PAYLOAD_FLAG_DELTA = 0x10
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+GCM_TAG_SIZE = 16
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+DEFAULT_SPOOL_MEMORY = 4 * 1024 * 1024
+_V2_HEADER = struct.Struct('>4sBBHQ12s')
+_SEGMENT_INFO = struct.Struct('>I')
+_COMPRESSION_INFO = struct.Struct('>BQ')
+
+_DerivedKeys = namedtuple('_DerivedKeys', ['key', 'fernet', 'aead'])
+
+# 派生密钥缓存：{(密码指纹, salt): _DerivedKeys}
+# PBKDF2 每次派生需数百毫秒，同一进程内对同一密码+盐只派生一次。
+# 以密码的SHA-256指纹作为键，密钥变更后自然派生新条目，旧条目按容量淘汰。
+_KEY_CACHE = {}
+_KEY_CACHE_LOCK = threading.Lock()
+_KEY_CACHE_MAX_ENTRIES = 4
+
+
+def _password_fingerprint(password):
     if not isinstance(password, bytes):
         password = password.encode('utf-8')
-    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=390000, backend=default_backend())
-    return base64.urlsafe_b64encode(kdf.derive(password))
+    return password, hashlib.sha256(password).hexdigest()
+
+
+def _derive_cached(password, salt):
+    """返回缓存的派生密钥组，未命中时执行一次PBKDF2派生。"""
+    password_bytes, fingerprint = _password_fingerprint(password)
+    cache_key = (fingerprint, salt)
+    with _KEY_CACHE_LOCK:
+        entry = _KEY_CACHE.get(cache_key)
+        if entry is not None:
+            return entry
+
+    # 派生在锁外进行，避免阻塞其他密码的查询；并发首次派生结果一致，重复写入无害
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=PBKDF2_ITERATIONS, backend=default_backend())
+    master_key = kdf.derive(password_bytes)
+    key = base64.urlsafe_b64encode(master_key)
+    # v2 载荷使用 HKDF 从主密钥派生的独立子密钥，避免与 Fernet 共用同一密钥
+    aead_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'upanddown2-payload-v2',
+                    backend=default_backend()).derive(master_key)
+    entry = _DerivedKeys(key, Fernet(key), AESGCM(aead_key))
+
+    with _KEY_CACHE_LOCK:
+        if cache_key not in _KEY_CACHE and len(_KEY_CACHE) >= _KEY_CACHE_MAX_ENTRIES:
+            # 淘汰最早加入的条目（dict保持插入顺序）
+            _KEY_CACHE.pop(next(iter(_KEY_CACHE)))
+        _KEY_CACHE[cache_key] = entry
+    return entry
+
+
+def get_encryption_key(password, salt=DEFAULT_SALT):
+    """根据密码派生一个安全的加密密钥（进程内缓存）。"""
+    return _derive_cached(password, salt).key
+
+
+def get_fernet(password, salt=DEFAULT_SALT):
+    """获取与密码对应的 Fernet 实例（进程内缓存，线程安全）。"""
+    return _derive_cached(password, salt).fernet
+
+
+def clear_encryption_key_cache():
+    """清空派生密钥缓存，在系统凭据管理器中的密钥被修改后调用。"""
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE.clear()
 
-def create_and_encrypt_payload(file_path, password, is_from_text=False):
+def get_payload_version(config):
+    """从配置读取发送端使用的载荷格式版本（payload_version），缺省为v2。"""
+    try:
+        version = int(config['DEFAULT'].get('payload_version', DEFAULT_PAYLOAD_VERSION))
+    except (TypeError, ValueError, KeyError):
+        return DEFAULT_PAYLOAD_VERSION
+    return version if version in (PAYLOAD_VERSION_V1, PAYLOAD_VERSION_V2) else DEFAULT_PAYLOAD_VERSION
+
+def is_binary_payload(data):
+    """判断数据是否为v2二进制信封。"""
+    return data[:len(PAYLOAD_MAGIC)] == PAYLOAD_MAGIC
+
+def get_segment_size(config):
+    """从配置读取流式加密的段大小（stream_segment_kb），决定流式上传的内存上限。"""
+    try:
+        segment_kb = int(config['DEFAULT'].get('stream_segment_kb', DEFAULT_SEGMENT_SIZE // 1024))
+    except (TypeError, ValueError, KeyError):
+        return DEFAULT_SEGMENT_SIZE
+    return max(64, segment_kb) * 1024
+
+def _build_v2_header(flags, filename, content_len, nonce, segment_size=None, codec=CODEC_NONE, original_len=0):
+    filename_bytes = filename.encode('utf-8')
+    header = _V2_HEADER.pack(PAYLOAD_MAGIC, PAYLOAD_VERSION_V2, flags, len(filename_bytes), content_len, nonce)
+    if flags & PAYLOAD_FLAG_SEGMENTED:
+        header += _SEGMENT_INFO.pack(segment_size)
+    if flags & PAYLOAD_FLAG_COMPRESSED:
+        header += _COMPRESSION_INFO.pack(codec, original_len)
+    return header + filename_bytes
+
+def _segment_nonce(nonce_prefix, index, is_last):
+    return nonce_prefix + struct.pack('>IB', index, 1 if is_last else 0)
+
+def _segment_count(content_len, segment_size):
+    return max(1, -(-content_len // segment_size))
+
+def encrypt_payload_bytes(data_bytes, password, filename, is_from_text=False, version=DEFAULT_PAYLOAD_VERSION,
+                          compression=None, is_bundle=False, is_delta=False):
+    """
+    将内存中的数据加密为指定版本的载荷。
+    compression 为 CompressionPolicy 时，v2载荷在加密前按策略压缩；v1保持原格式不压缩。
+    is_bundle / is_delta 表示数据为小文件打包容器 / 增量补丁，只能使用v2格式。
+    """
+    if version == PAYLOAD_VERSION_V1:
+        if is_bundle or is_delta:
+            raise ValueError("打包/增量载荷需要v2格式")
+        payload = {
+            "filename": filename,
+            "content_base64": base64.b64encode(data_bytes).decode('utf-8'),
+            "is_from_text": is_from_text
+        }
+        return get_fernet(password).encrypt(json.dumps(payload).encode('utf-8'))
+
+    flags = ((PAYLOAD_FLAG_FROM_TEXT if is_from_text else 0) | (PAYLOAD_FLAG_BUNDLE if is_bundle else 0)
+             | (PAYLOAD_FLAG_DELTA if is_delta else 0))
+    original_len = len(data_bytes)
+    codec = CODEC_NONE
+    if compression is not None:
+        codec, data_bytes = compression.compress(data_bytes, filename)
+        if codec != CODEC_NONE:
+            flags |= PAYLOAD_FLAG_COMPRESSED
+    nonce = os.urandom(12)
+    header = _build_v2_header(flags, filename, len(data_bytes), nonce, codec=codec, original_len=original_len)
+    # 头部作为附加认证数据，文件名/标志被篡改时解密失败
+    return header + _derive_cached(password, DEFAULT_SALT).aead.encrypt(nonce, data_bytes, header)
+
+def create_and_encrypt_payload(file_path, password, is_from_text=False, version=DEFAULT_PAYLOAD_VERSION,
+                               compression=None):
     """创建并加密文件载荷。"""
-    key = get_encryption_key(password)
-    f = Fernet(key)
     original_filename = os.path.basename(file_path)
     with open(file_path, 'rb') as file_handle:
         file_content = file_handle.read()
-    content_base64 = base64.b64encode(file_content).decode('utf-8')
-    payload = {"filename": original_filename, "content_base64": content_base64, "is_from_text": is_from_text}
-    return f.encrypt(json.dumps(payload).encode('utf-8'))
+    return encrypt_payload_bytes(file_content, password, original_filename, is_from_text, version, compression)
+
+
+class EncryptedFileStream:
+    """
+    流式加密的只读文件对象：从磁盘按段读取并即时加密为v2分段载荷。
+    可直接作为 MultipartEncoder 的文件字段，内存占用仅为一个段的大小，与文件大小无关。
+    offset/length 可指定文件中的一个区间（用于分片上传）。
+    compression 为 CompressionPolicy 且判定值得压缩时，先将区间流式压缩到临时文件，再从临时文件分段加密，
+    Content-Length 仍可在上传前确定。
+    """
+
+    def __init__(self, file_path, password, filename=None, is_from_text=False,
+                 segment_size=DEFAULT_SEGMENT_SIZE, offset=0, length=None, compression=None):
+        self.file_path = file_path
+        self.segment_size = segment_size
+        self.offset = offset
+        file_size = os.path.getsize(file_path)
+        self.content_len = max(0, file_size - offset) if length is None else min(length, max(0, file_size - offset))
+        self.original_len = self.content_len
+        self._aead = _derive_cached(password, DEFAULT_SALT).aead
+        filename = filename or os.path.basename(file_path)
+
+        flags = PAYLOAD_FLAG_SEGMENTED | (PAYLOAD_FLAG_FROM_TEXT if is_from_text else 0)
+        self.codec = CODEC_NONE
+        self._spool = None
+        if compression is not None:
+            self.codec = compression.choose_for_file(file_path, filename, offset, self.content_len)
+        if self.codec != CODEC_NONE:
+            flags |= PAYLOAD_FLAG_COMPRESSED
+            self._spool = tempfile.TemporaryFile()
+            with open(file_path, 'rb') as src:
+                src.seek(offset)
+                self.content_len = compress_stream(src, self.original_len, self._spool, self.codec,
+                                                   compression.level)
+        nonce = os.urandom(7) + bytes(5)
+        self._nonce_prefix = nonce[:7]
+        self._header = _build_v2_header(flags, filename, self.content_len, nonce, segment_size,
+                                        self.codec, self.original_len)
+        self._total_segments = _segment_count(self.content_len, segment_size)
+        self.total_len = len(self._header) + self.content_len + self._total_segments * GCM_TAG_SIZE
+        self._fh = None
+        self.rewind()
+
+    def rewind(self):
+        """回到流的开头（上传重试时复用同一个流对象）。"""
+        if self._spool is not None:
+            self._fh = self._spool
+            self._fh.seek(0)
+        else:
+            if self._fh is None:
+                self._fh = open(self.file_path, 'rb')
+            self._fh.seek(self.offset)
+        self._buffer = self._header
+        self._next_segment = 0
+        self._consumed = 0
+
+    def seek(self, position, whence=0):
+        if position != 0 or whence != 0:
+            raise io.UnsupportedOperation("EncryptedFileStream 仅支持回到开头")
+        self.rewind()
+        return 0
+
+    def tell(self):
+        return self._consumed
+
+    @property
+    def len(self):
+        """剩余未读取的字节数（MultipartEncoder 依赖此属性计算 Content-Length）。"""
+        return self.total_len - self._consumed
+
+    def _encrypt_next_segment(self):
+        index = self._next_segment
+        remaining = self.content_len - index * self.segment_size
+        plain = self._fh.read(min(self.segment_size, remaining))
+        if len(plain) != min(self.segment_size, remaining):
+            raise IOError(f"读取文件时长度变化: {self.file_path}")
+        is_last = index == self._total_segments - 1
+        self._next_segment += 1
+        return self._aead.encrypt(_segment_nonce(self._nonce_prefix, index, is_last), plain, self._header)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len
+        parts = []
+        wanted = size
+        while wanted > 0:
+            if not self._buffer:
+                if self._next_segment >= self._total_segments:
+                    break
+                self._buffer = self._encrypt_next_segment()
+            piece = self._buffer[:wanted]
+            self._buffer = self._buffer[wanted:]
+            parts.append(piece)
+            wanted -= len(piece)
+        data = b''.join(parts)
+        self._consumed += len(data)
+        return data
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 def decrypt_and_parse_payload(encrypted_data, password):
-    """解密并解析载荷。"""
-    key = get_encryption_key(password)
-    f = Fernet(key)
-    decrypted_bytes = f.decrypt(encrypted_data)
+    """
+    解密并解析载荷，自动识别v1/v2格式。
+    返回 {'filename', 'content'(bytes), 'is_from_text', 'is_bundle', 'is_delta', 'version'}。
+    """
+    if is_binary_payload(encrypted_data):
+        return _decrypt_binary_payload(encrypted_data, password)
+
+    decrypted_bytes = get_fernet(password).decrypt(encrypted_data)
     payload = json.loads(decrypted_bytes.decode('utf-8'))
+    payload['content'] = base64.b64decode(payload.pop('content_base64'))
+    payload['is_bundle'] = False
+    payload['is_delta'] = False
+    payload['version'] = PAYLOAD_VERSION_V1
     return payload
 
+def _parse_binary_header(read_exact):
+    """从读取函数中解析v2头部，返回头部信息字典（含用于认证的原始头部字节）。"""
+    fixed = read_exact(_V2_HEADER.size)
+    if len(fixed) < _V2_HEADER.size:
+        raise ValueError("载荷头部不完整")
+    magic, version, flags, name_len, content_len, nonce = _V2_HEADER.unpack(fixed)
+    if magic != PAYLOAD_MAGIC:
+        raise ValueError("不是v2二进制载荷")
+    if version != PAYLOAD_VERSION_V2:
+        raise ValueError(f"不支持的载荷版本: {version}")
+    segment_size = None
+    codec, original_len = CODEC_NONE, content_len
+    header = fixed
+    if flags & PAYLOAD_FLAG_SEGMENTED:
+        segment_info = read_exact(_SEGMENT_INFO.size)
+        segment_size = _SEGMENT_INFO.unpack(segment_info)[0]
+        header += segment_info
+    if flags & PAYLOAD_FLAG_COMPRESSED:
+        compression_info = read_exact(_COMPRESSION_INFO.size)
+        codec, original_len = _COMPRESSION_INFO.unpack(compression_info)
+        header += compression_info
+    filename_bytes = read_exact(name_len)
+    header += filename_bytes
+    return {
+        'header': header,
+        'flags': flags,
+        'content_len': content_len,
+        'nonce': nonce,
+        'segment_size': segment_size,
+        'codec': codec,
+        'original_len': original_len,
+        'filename': filename_bytes.decode('utf-8'),
+    }
+
+def _iter_plaintext(info, aead, read_exact):
+    """按头部信息逐段解密，生成明文块；非分段载荷读取剩余全部密文一次解密。"""
+    if info['segment_size'] is None:
+        yield aead.decrypt(info['nonce'], read_exact(-1), info['header'])
+        return
+    segment_size = info['segment_size']
+    total_segments = _segment_count(info['content_len'], segment_size)
+    nonce_prefix = info['nonce'][:7]
+    for index in range(total_segments):
+        plain_len = min(segment_size, info['content_len'] - index * segment_size)
+        ciphertext = read_exact(plain_len + GCM_TAG_SIZE)
+        yield aead.decrypt(_segment_nonce(nonce_prefix, index, index == total_segments - 1), ciphertext, info['header'])
+
+def _decrypt_binary_payload(encrypted_data, password):
+    """解析v2二进制信封（含分段模式）。"""
+    view = memoryview(encrypted_data)
+    position = [0]
+
+    def read_exact(size):
+        start = position[0]
+        end = len(view) if size < 0 else start + size
+        position[0] = end
+        return bytes(view[start:end])
+
+    info = _parse_binary_header(read_exact)
+    aead = _derive_cached(password, DEFAULT_SALT).aead
+    content = b''.join(_iter_plaintext(info, aead, read_exact))
+    if len(content) != info['content_len']:
+        raise ValueError(f"载荷长度不匹配: 期望{info['content_len']}字节，实际{len(content)}字节")
+    if info['codec'] != CODEC_NONE:
+        content = b''.join(iter_decompress(info['codec'], (content,), info['original_len']))
+    return {
+        "filename": info['filename'],
+        "content": content,
+        "is_from_text": bool(info['flags'] & PAYLOAD_FLAG_FROM_TEXT),
+        "is_bundle": bool(info['flags'] & PAYLOAD_FLAG_BUNDLE),
+        "is_delta": bool(info['flags'] & PAYLOAD_FLAG_DELTA),
+        "version": PAYLOAD_VERSION_V2
+    }
+
+def iter_decrypted_payload(fileobj, password):
+    """
+    从文件对象流式解密载荷，自动识别v1/v2格式。
+    返回 (元信息, 明文块迭代器)，元信息含 filename / is_from_text / is_bundle / is_delta / version / content_len（压缩载荷为解压后的长度）。
+    v2分段载荷逐段读取和认证，内存占用与段大小相当；v1与非分段v2需整体解密。
+    迭代完成前明文尚未全部认证，调用方应先写入临时文件，迭代成功后再落地。
+    """
+    fileobj.seek(0)
+    if not is_binary_payload(fileobj.read(len(PAYLOAD_MAGIC))):
+        fileobj.seek(0)
+        payload = decrypt_and_parse_payload(fileobj.read(), password)
+        content = payload.pop('content')
+        payload['content_len'] = len(content)
+        return payload, iter((content,))
+
+    fileobj.seek(0)
+
+    def read_exact(size):
+        if size < 0:
+            return fileobj.read()
+        data = fileobj.read(size)
+        if len(data) != size:
+            raise ValueError("载荷被截断")
+        return data
+
+    info = _parse_binary_header(read_exact)
+    aead = _derive_cached(password, DEFAULT_SALT).aead
+    meta = {
+        "filename": info['filename'],
+        "is_from_text": bool(info['flags'] & PAYLOAD_FLAG_FROM_TEXT),
+        "is_bundle": bool(info['flags'] & PAYLOAD_FLAG_BUNDLE),
+        "is_delta": bool(info['flags'] & PAYLOAD_FLAG_DELTA),
+        "version": PAYLOAD_VERSION_V2,
+        "content_len": info['original_len']
+    }
+
+    def stored_blocks():
+        produced = 0
+        for block in _iter_plaintext(info, aead, read_exact):
+            produced += len(block)
+            yield block
+        if produced != info['content_len']:
+            raise ValueError(f"载荷长度不匹配: 期望{info['content_len']}字节，实际{produced}字节")
+
+    if info['codec'] == CODEC_NONE:
+        return meta, stored_blocks()
+    return meta, iter_decompress(info['codec'], stored_blocks(), info['original_len'])
+
+# --- 登录状态检测 ---
+
+DEFAULT_AUTH_WAIT_SECONDS = 600
+_AUTH_STATUS = (401, 403)
+_AUTH_URL_MARKERS = ('login', 'authserver', '/cas/')
+_AUTH_CODES = {'401', '403', 'NOT_LOGIN', 'NOLOGIN', 'SESSION_TIMEOUT'}
+_AUTH_MESSAGE_MARKERS = ('登录', '会话', 'login', 'session', 'unauthorized', '未授权')
+
+
+class AuthExpiredError(Exception):
+    """服务器返回登录失效（401/403、跳转登录页或带认证错误码的JSON）"""
+
+
+def is_auth_failure(response, expect_json=True):
+    """判断响应是否表示登录已失效；expect_json=False 时只检查状态码和跳转，不读取响应体
+
+    5xx 响应（网关/代理错误页）不做登录判断；HTML 页面只有在被重定向到登录地址时才视为失效。
+    """
+    if response.status_code >= 500:
+        return False
+    if response.status_code in _AUTH_STATUS:
+        return True
+    if response.history and any(marker in response.url.lower() for marker in _AUTH_URL_MARKERS):
+        return True
+    if not expect_json:
+        return False
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    return is_auth_error_payload(data)
+
+
+def is_auth_error_payload(data):
+    """已解析的JSON响应体是否为登录失效错误（success=false 且带认证错误码或提示）"""
+    if not isinstance(data, dict) or data.get('success', True):
+        return False
+    code = str(data.get('code', data.get('errcode', ''))).upper()
+    message = str(data.get('msg', data.get('message', ''))).lower()
+    return code in _AUTH_CODES or any(marker in message for marker in _AUTH_MESSAGE_MARKERS)
+
+
+def get_auth_wait_seconds(config):
+    """从配置读取登录失效后等待Cookie刷新的最长时间（auth_wait_timeout_seconds）"""
+    try:
+        return float(config['DEFAULT'].get('auth_wait_timeout_seconds', DEFAULT_AUTH_WAIT_SECONDS))
+    except (TypeError, ValueError, KeyError):
+        return DEFAULT_AUTH_WAIT_SECONDS
+
+
+class AuthGate:
+    """
+    登录状态闸门：检测到登录失效后进入"等待登录"状态，阻塞型调用在此等待而不是反复重试；
+    无法阻塞的操作以 replay(config) 形式挂起，Cookie刷新后用新配置自动重放。
+    """
+
+    MAX_PENDING = 256
+
+    def __init__(self):
+        self._authorized = threading.Event()
+        self._authorized.set()
+        self._lock = threading.Lock()
+        self._pending = deque(maxlen=self.MAX_PENDING)
+        self.latest_config = None
+
+    @property
+    def waiting_for_auth(self):
+        return not self._authorized.is_set()
+
+    def mark_expired(self):
+        self._authorized.clear()
+
+    def mark_ok(self):
+        """已认证的请求成功返回：登录实际有效，解除等待并重放挂起的操作"""
+        if self._authorized.is_set():
+            return
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            config = self.latest_config
+            self._authorized.set()
+        if pending:
+            self._start_replay(pending, config)
+
+    def wait(self, timeout=None):
+        """等待登录恢复，超时返回 False"""
+        return self._authorized.wait(timeout)
+
+    def park(self, replay):
+        """挂起一个待重放的操作；当前未处于等待状态时立即在后台执行"""
+        with self._lock:
+            if not self._authorized.is_set():
+                self._pending.append(replay)
+                return
+            config = self.latest_config
+        self._start_replay([replay], config)
+
+    def refresh(self, config):
+        """Cookie已刷新：记录新配置、解除等待并重放挂起的操作（可直接注册为 ConfigManager 监听器）"""
+        with self._lock:
+            self.latest_config = config
+            pending = list(self._pending)
+            self._pending.clear()
+            self._authorized.set()
+        if pending:
+            self._start_replay(pending, config)
+
+    def _start_replay(self, operations, config):
+        def run():
+            for replay in operations:
+                try:
+                    replay(config)
+                except Exception as e:
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 重放挂起请求失败: {e}")
+        threading.Thread(target=run, daemon=True, name="AuthReplay").start()
+
+
+# --- 共享HTTP传输层 ---
+
+class HttpTransport:
+    """
+    线程安全的共享HTTP传输层：一个 requests.Session + 调优的连接池。
+    - 连接池大小与工作线程数匹配，keep-alive 复用TCP连接，省去每个分片的建连开销
+    - 连接失败（请求尚未发出）对所有方法自动重试
+    - 幂等请求（查询、下载、删除）在超时/5xx时按指数退避重试；上传不做此类重试，避免重复上传
+    - check_auth=True 的请求识别登录失效，标记 auth_gate 并抛出 AuthExpiredError
+    """
+
+    RETRY_STATUS = (500, 502, 503, 504)
+
+    def __init__(self, pool_size=8, retries=3, backoff_seconds=0.5, user_agent='Mozilla/5.0'):
+        self.pool_size = max(1, pool_size)
+        self.retries = max(0, retries)
+        self.backoff_seconds = backoff_seconds
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent, 'Connection': 'keep-alive'})
+
+        connect_retry = Retry(total=None, connect=self.retries, read=0, status=0, other=0,
+                              backoff_factor=backoff_seconds, allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=connect_retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.auth_gate = AuthGate()
+
+    @classmethod
+    def from_config(cls, config, pool_size=8, user_agent='Mozilla/5.0'):
+        """按配置创建传输层（http_pool_size / http_retries / http_backoff_seconds）"""
+        section = config['DEFAULT']
+        try:
+            return cls(
+                pool_size=int(section.get('http_pool_size', pool_size)),
+                retries=int(section.get('http_retries', 3)),
+                backoff_seconds=float(section.get('http_backoff_seconds', 0.5)),
+                user_agent=user_agent
+            )
+        except (TypeError, ValueError):
+            return cls(pool_size=pool_size, user_agent=user_agent)
+
+    def request(self, method, url, idempotent=False, check_auth=False, expect_json=True, **kwargs):
+        """发送请求；idempotent=True 时对超时、连接中断和5xx响应按指数退避重试
+
+        check_auth=True 时检查登录是否失效（expect_json 表示响应应为JSON），失效则抛出 AuthExpiredError。
+        expect_json=False 时响应体尚未检查，成功响应不解除登录等待，由调用方解析后经 check_auth_payload 确认。
+        """
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            is_last = attempt == attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if is_last:
+                    raise
+            else:
+                if is_last or response.status_code not in self.RETRY_STATUS:
+                    if check_auth:
+                        if is_auth_failure(response, expect_json):
+                            response.close()
+                            self.auth_gate.mark_expired()
+                            raise AuthExpiredError(f"登录已失效: {url}")
+                        if response.ok and expect_json:
+                            self.auth_gate.mark_ok()
+                    return response
+                response.close()
+            time.sleep(self.backoff_seconds * (2 ** attempt))
+
+    def check_auth_payload(self, data, url=''):
+        """对调用方已解析的JSON响应体做登录失效检查（配合 expect_json=False 的请求，只在确需解析时调用）"""
+        if is_auth_error_payload(data):
+            self.auth_gate.mark_expired()
+            raise AuthExpiredError(f"登录已失效: {url}")
+        self.auth_gate.mark_ok()
+
+    def get(self, url, idempotent=True, **kwargs):
+        return self.request('GET', url, idempotent=idempotent, **kwargs)
+
+    def post(self, url, idempotent=False, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """获取进程级共享传输层（未显式注入传输层时使用）。"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
+
 # --- 网络操作函数 ---
 
-def upload_data(encrypted_payload_bytes, config, status_queue, custom_filename=None):
+def _await_auth(transport, config, status_queue, action):
+    """登录失效时等待Cookie刷新，返回刷新后的配置；等待超时返回 None"""
+    status_queue.put(('warning', f"登录已失效，等待Cookie刷新后自动{action}..."))
+    if not transport.auth_gate.wait(get_auth_wait_seconds(config)):
+        status_queue.put(('error', f"等待登录超时，已放弃{action}"))
+        return None
+    return transport.auth_gate.latest_config or config
+
+
+# 单个载荷的服务器文件名前缀；文本载荷另带 text_ 标记，下载端据此优先处理（旧下载端按前缀照常识别）
+PAYLOAD_UPLOAD_PREFIX = "clipboard_payload_"
+TEXT_UPLOAD_PREFIX = PAYLOAD_UPLOAD_PREFIX + "text_"
+
+
+def payload_upload_name(is_from_text=False):
+    """单个载荷在服务器上的文件名"""
+    prefix = TEXT_UPLOAD_PREFIX if is_from_text else PAYLOAD_UPLOAD_PREFIX
+    return f"{prefix}{base64.urlsafe_b64encode(os.urandom(6)).decode()}.encrypted"
+
+
+def is_text_upload_name(name):
+    return name.startswith(TEXT_UPLOAD_PREFIX)
+
+
+def upload_data(encrypted_payload_bytes, config, status_queue, custom_filename=None, transport=None):
     """
-    修改：使用 requests-toolbelt 实现流式上传，减少内存占用。
+    使用 requests-toolbelt 的 MultipartEncoder 上传载荷。
+    encrypted_payload_bytes 可以是内存中的字节，也可以是 EncryptedFileStream 等
+    带 read/len 的流对象；传入流对象时请求体边读边发，不在内存中保留完整载荷。
+    transport 为共享的 HttpTransport，未指定时使用进程级默认传输层。
+    登录失效时不计为失败：等待Cookie刷新后用新Cookie从头重传同一载荷。
     """
     try:
-        upload_filename = custom_filename if custom_filename else f"clipboard_payload_{base64.urlsafe_b64encode(os.urandom(6)).decode()}.encrypted"
-
-        # 使用 MultipartEncoder 创建一个可流式处理的请求体
-        m = MultipartEncoder(
-            fields={
-                'scope': 'fileUploadToke',
-                'fileToken': 'fileUploadToken',
-                'storeId': 'file',
-                'isSingle': '0',
-                # 将加密后的字节流包装成一个内存中的文件对象来上传
-                'bhFile': (upload_filename, io.BytesIO(encrypted_payload_bytes), 'application/octet-stream')
-            }
-        )
-
-        headers = {
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Cookie': config['DEFAULT']['COOKIE'],
-            'User-Agent': 'Mozilla/5.0',
-            # 关键：设置正确的 Content-Type，其值由 MultipartEncoder 生成
-            'Content-Type': m.content_type
-        }
+        upload_filename = custom_filename if custom_filename else payload_upload_name()
+
+        if hasattr(encrypted_payload_bytes, 'read'):
+            body = encrypted_payload_bytes
+        else:
+            body = io.BytesIO(encrypted_payload_bytes)
+
+        transport = transport or get_default_transport()
+        while True:
+            # 已处于"等待登录"状态时先等待，不再发出注定失败的请求
+            if transport.auth_gate.waiting_for_auth:
+                config = _await_auth(transport, config, status_queue, "上传")
+                if config is None:
+                    return False
 
-        status_queue.put(('info', f"正在流式上传: {os.path.basename(upload_filename)}..."))
-        upload_url = config['DEFAULT']['UPLOAD_URL']
+            # 使用 MultipartEncoder 创建一个可流式处理的请求体
+            m = MultipartEncoder(
+                fields={
+                    'scope': 'fileUploadToke',
+                    'fileToken': 'fileUploadToken',
+                    'storeId': 'file',
+                    'isSingle': '0',
+                    # 流对象直接交给编码器按需读取；字节数据包装成内存文件对象
+                    'bhFile': (upload_filename, body, 'application/octet-stream')
+                }
+            )
 
-        # 直接将 MultipartEncoder 对象作为 data 参数传入
-        response = requests.post(upload_url, data=m, headers=headers, timeout=300)
+            endpoints = endpoints_of(config)
+            # 关键：设置正确的 Content-Type，其值由 MultipartEncoder 生成（每次上传的分隔符不同）
+            headers = dict(endpoints.upload_headers, **{'Content-Type': m.content_type})
+
+            status_queue.put(('info', f"正在流式上传: {os.path.basename(upload_filename)}..."))
+
+            # 直接将 MultipartEncoder 对象作为 data 参数传入；上传非幂等，仅在连接阶段重试
+            try:
+                response = transport.post(endpoints.upload_url, data=m, headers=headers, timeout=300, check_auth=True)
+            except AuthExpiredError:
+                body.seek(0)
+                continue
+            break
         response.raise_for_status()
 
         if response.json().get("success"):
@@ -87,18 +738,51 @@ def upload_data(encrypted_payload_bytes, config, status_queue, custom_filename=N
     return False
 
 
-def delete_server_file(file_id, config, status_queue):
-    """从服务器删除文件。"""
-    delete_url = config['DEFAULT']['DELETE_URL_TEMPLATE'].format(file_id=file_id)
-    headers = {'Cookie': config['DEFAULT']['COOKIE'], 'User-Agent': 'Mozilla/5.0'}
+def download_to_spool(url, headers=None, timeout=120, transport=None,
+                      spool_dir=None, max_memory=DEFAULT_SPOOL_MEMORY):
+    """
+    流式下载响应体到临时缓冲，避免 response.content 在内存中保留完整载荷。
+    不超过 max_memory 的内容留在内存，超过后自动转存到 spool_dir 下的临时文件。
+    返回 (HTTP状态码, 缓冲文件对象)；状态码非200时缓冲为 None。调用方负责关闭缓冲。
+    """
+    transport = transport or get_default_transport()
+    response = transport.get(url, headers=headers, timeout=timeout, stream=True, check_auth=True, expect_json=False)
+    try:
+        if response.status_code != 200:
+            return response.status_code, None
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory, dir=spool_dir)
+        try:
+            for block in response.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                spool.write(block)
+        except Exception:
+            spool.close()
+            raise
+        return response.status_code, spool
+    finally:
+        response.close()
+
+
+def delete_server_file(file_id, config, status_queue, transport=None):
+    """从服务器删除文件（按ID删除是幂等操作，失败时退避重试）。"""
+    endpoints = endpoints_of(config)
+    delete_url = endpoints.delete_url(file_id)
+    headers = endpoints.request_headers
     status_queue.put(('info', f"正在删除服务器文件 (ID: {file_id})"))
+    transport = transport or get_default_transport()
     try:
-        response = requests.post(delete_url, headers=headers, timeout=30)
+        if transport.auth_gate.waiting_for_auth:
+            raise AuthExpiredError("等待登录中")
+        response = transport.post(delete_url, idempotent=True, headers=headers, timeout=30, check_auth=True)
         response.raise_for_status()
         response_json = response.json()
         if response_json.get("success") and response_json.get("count", 0) > 0:
             status_queue.put(('success', f"服务器文件 (ID: {file_id}) 删除成功。"))
         else:
             status_queue.put(('warning', f"删除请求已发送，但服务器未报告成功删除。"))
+    except AuthExpiredError:
+        # 删除在后台执行，无需阻塞等待：挂起到闸门，Cookie刷新后以新配置重放
+        status_queue.put(('warning', f"登录已失效，删除请求 (ID: {file_id}) 已挂起，Cookie刷新后自动重试"))
+        transport.auth_gate.park(
+            lambda fresh_config: delete_server_file(file_id, fresh_config or config, status_queue, transport))
     except Exception as e:
         status_queue.put(('error', f"调用删除API时出错: {e}"))
\ No newline at end of file
@@ -0,0 +1,234 @@
+# payload_compression.py
+"""
+载荷压缩 - 加密前的可选压缩阶段
+
+密文不可再压缩，压缩只能发生在加密之前。编码器编号写入v2载荷头部，接收端据此解压。
+- 已压缩类别（archive/video/image/audio，由 SmartFileAnalyzer.get_file_category 判定）直接跳过
+- 其余内容先压缩一个采样块，压缩率不理想时跳过，避免为随机数据白白消耗CPU
+- zstd 为可选依赖（zstandard），只在显式配置时使用，下载端也须安装；auto 固定为 zlib
+"""
+
+import os
+import zlib
+import lzma
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
+
+# 可选的更快压缩算法
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+CODEC_NAMES = {CODEC_ZLIB: 'zlib', CODEC_LZMA: 'lzma', CODEC_ZSTD: 'zstd'}
+
+# 内容本身已压缩的文件类别
+SKIP_CATEGORIES = frozenset(('archive', 'video', 'image', 'audio'))
+
+SAMPLE_SIZE = 64 * 1024
+MIN_COMPRESS_SIZE = 512
+DEFAULT_MIN_RATIO = 0.9
+STREAM_BLOCK_SIZE = 1024 * 1024
+# 解压时每次产出的上限，防止单个小密文段展开为巨量明文
+OUTPUT_BLOCK_SIZE = 1024 * 1024
+
+
+def _new_compressor(codec: int, level: Optional[int] = None):
+    """返回带 compress()/flush() 的增量压缩器"""
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(6 if level is None else level)
+    if codec == CODEC_LZMA:
+        return lzma.LZMACompressor(preset=1 if level is None else level)
+    if codec == CODEC_ZSTD and ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f"不支持的压缩算法: {codec}")
+
+
+def compress_bytes(data: bytes, codec: int, level: Optional[int] = None) -> bytes:
+    compressor = _new_compressor(codec, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(src: BinaryIO, length: int, dest: BinaryIO, codec: int,
+                    level: Optional[int] = None) -> int:
+    """从 src 当前位置读取 length 字节，压缩写入 dest，返回压缩后字节数"""
+    compressor = _new_compressor(codec, level)
+    written = 0
+    remaining = length
+    while remaining > 0:
+        block = src.read(min(STREAM_BLOCK_SIZE, remaining))
+        if not block:
+            raise IOError("读取文件时长度变化")
+        remaining -= len(block)
+        out = compressor.compress(block)
+        dest.write(out)
+        written += len(out)
+    out = compressor.flush()
+    dest.write(out)
+    return written + len(out)
+
+
+class _BlockStream:
+    """把块迭代器包装为 zstd stream_reader 所需的 read(size) 接口"""
+
+    def __init__(self, blocks: Iterable[bytes]):
+        self._blocks = iter(blocks)
+        self._buffer = b''
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._buffer:
+            block = next(self._blocks, None)
+            if block is None:
+                return b''
+            self._buffer = block
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def iter_decompress(codec: int, blocks: Iterable[bytes], expected_len: int) -> Iterator[bytes]:
+    """逐块解压，产出长度超过 expected_len 或最终不一致时抛出 ValueError"""
+    produced = 0
+
+    def check(out):
+        nonlocal produced
+        produced += len(out)
+        if produced > expected_len:
+            raise ValueError(f"解压长度超出声明: 期望{expected_len}字节")
+        return out
+
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+        for block in blocks:
+            data = block
+            while data:
+                out = decompressor.decompress(data, OUTPUT_BLOCK_SIZE)
+                data = decompressor.unconsumed_tail
+                if out:
+                    yield check(out)
+        tail = decompressor.flush()
+        if tail:
+            yield check(tail)
+        finished = decompressor.eof
+    elif codec == CODEC_LZMA:
+        decompressor = lzma.LZMADecompressor()
+        for block in blocks:
+            data = block
+            while not decompressor.eof:
+                out = decompressor.decompress(data, OUTPUT_BLOCK_SIZE)
+                data = b''
+                if out:
+                    yield check(out)
+                if decompressor.needs_input:
+                    break
+        finished = decompressor.eof
+    elif codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("载荷使用 zstd 压缩，但未安装 zstandard")
+        # stream_reader 按 OUTPUT_BLOCK_SIZE 限制每次输出，与 zlib/lzma 分支一致；
+        # 输入在帧结束前耗尽时读取提前结束，由末尾的长度检查报错
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(_BlockStream(blocks)) as reader:
+                while True:
+                    out = reader.read(OUTPUT_BLOCK_SIZE)
+                    if not out:
+                        break
+                    yield check(out)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"zstd 解压失败: {e}") from e
+        finished = True
+    else:
+        raise ValueError(f"不支持的压缩算法: {codec}")
+
+    if not finished or produced != expected_len:
+        raise ValueError(f"解压长度不匹配: 期望{expected_len}字节，实际{produced}字节")
+
+
+def decompress_bytes(data: bytes, codec: int, expected_len: int) -> bytes:
+    return b''.join(iter_decompress(codec, (data,), expected_len))
+
+
+def _default_categorize(filename: str) -> str:
+    """使用 SmartFileAnalyzer 的扩展名分类（延迟导入，避免与服务层循环依赖）"""
+    try:
+        from services.smart_assistant import get_default_file_analyzer
+    except ImportError:
+        return 'other'
+    return get_default_file_analyzer().get_file_category(filename)
+
+
+class CompressionPolicy:
+    """决定一段内容是否压缩以及使用的算法（无状态，可在多个线程间共享）"""
+
+    def __init__(self, codec: int = CODEC_ZLIB, level: Optional[int] = None,
+                 min_ratio: float = DEFAULT_MIN_RATIO, sample_size: int = SAMPLE_SIZE,
+                 categorize: Optional[Callable[[str], str]] = None):
+        self.codec = codec
+        self.level = level
+        self.min_ratio = min_ratio
+        self.sample_size = sample_size
+        self.categorize = categorize or _default_categorize
+
+    @classmethod
+    def from_config(cls, config, categorize=None) -> 'CompressionPolicy':
+        """配置 compression: auto(zlib) / zlib / lzma / zstd / off
+
+        auto 不选 zstd：发送端与下载端没有协商，下载端未安装 zstandard 时无法解压。
+        """
+        section = config['DEFAULT']
+        name = section.get('compression', 'auto').strip().lower()
+        try:
+            min_ratio = float(section.get('compression_min_ratio', DEFAULT_MIN_RATIO))
+        except (TypeError, ValueError):
+            min_ratio = DEFAULT_MIN_RATIO
+
+        if name in ('off', 'none', 'false', '0'):
+            codec = CODEC_NONE
+        elif name == 'zstd' and not ZSTD_AVAILABLE:
+            print("警告: 未安装 zstandard，压缩算法退化为 zlib")
+            codec = CODEC_ZLIB
+        elif name == 'auto':
+            codec = CODEC_ZLIB
+        else:
+            codec = {v: k for k, v in CODEC_NAMES.items()}.get(name, CODEC_ZLIB)
+        return cls(codec, min_ratio=min_ratio, categorize=categorize)
+
+    @property
+    def enabled(self) -> bool:
+        return self.codec != CODEC_NONE
+
+    def _worth_trying(self, filename: str, size: int) -> bool:
+        if not self.enabled or size < MIN_COMPRESS_SIZE:
+            return False
+        return self.categorize(filename or '') not in SKIP_CATEGORIES
+
+    def _sample_ok(self, sample: bytes) -> bool:
+        return len(compress_bytes(sample, self.codec, self.level)) <= len(sample) * self.min_ratio
+
+    def compress(self, data: bytes, filename: str) -> Tuple[int, bytes]:
+        """返回 (算法编号, 数据)；不值得压缩时返回 (CODEC_NONE, 原数据)"""
+        if not self._worth_trying(filename, len(data)):
+            return CODEC_NONE, data
+        if len(data) > self.sample_size and not self._sample_ok(data[:self.sample_size]):
+            return CODEC_NONE, data
+        compressed = compress_bytes(data, self.codec, self.level)
+        if len(compressed) > len(data) * self.min_ratio:
+            return CODEC_NONE, data
+        return self.codec, compressed
+
+    def choose_for_file(self, file_path: str, filename: Optional[str] = None,
+                        offset: int = 0, length: Optional[int] = None) -> int:
+        """按类别与采样块决定文件（区间）是否压缩，返回算法编号"""
+        if length is None:
+            length = max(0, os.path.getsize(file_path) - offset)
+        if not self._worth_trying(filename or os.path.basename(file_path), length):
+            return CODEC_NONE
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            sample = f.read(min(self.sample_size, length))
+        return self.codec if self._sample_ok(sample) else CODEC_NONE
@@ -9,14 +9,16 @@ import time
 import os
 from typing import Callable, List, Optional
 
-import pyperclip
-import win32clipboard
-import win32con
+from clipboard_backend import ClipboardBackend, ClipboardChangeProbe, create_clipboard_backend
 
 class ClipboardMonitor:
     """剪切板监听器"""
     
-    def __init__(self):
+    def __init__(self, backend: ClipboardBackend = None):
+        # 剪切板后端（可注入 FakeClipboardBackend 进行测试）
+        self.backend = backend or create_clipboard_backend()
+        self.probe = ClipboardChangeProbe(self.backend)
+        
         self.is_monitoring = False
         self.monitor_thread = None
         self.monitor_event = threading.Event()
@@ -63,6 +65,7 @@ class ClipboardMonitor:
         
         self.is_monitoring = True
         self.monitor_event.set()
+        self.probe.reset()
         
         self.monitor_thread = threading.Thread(target=self._monitor_worker, daemon=True)
         self.monitor_thread.start()
@@ -93,8 +96,13 @@ class ClipboardMonitor:
         """监听工作线程"""
         while self.monitor_event.is_set() and self.is_monitoring:
             try:
+                # 序列号未变化时不读取剪切板内容
+                if not self.probe.has_changed():
+                    time.sleep(1.5)
+                    continue
+                
                 # 监听文件变化
-                if self.file_monitoring:
+                if self.file_monitoring and self.backend.supports_files:
                     self._check_file_clipboard()
                 
                 # 监听文本变化
@@ -111,33 +119,29 @@ class ClipboardMonitor:
     def _check_file_clipboard(self):
         """检查文件剪切板变化"""
         try:
-            win32clipboard.OpenClipboard()
-            try:
-                if win32clipboard.IsClipboardFormatAvailable(win32con.CF_HDROP):
-                    file_paths = win32clipboard.GetClipboardData(win32con.CF_HDROP)
-                    
-                    if file_paths and file_paths != self.recent_files:
-                        self.recent_files = file_paths.copy()
-                        
-                        # 验证文件是否存在
-                        valid_files = []
-                        for file_path in file_paths:
-                            if os.path.exists(file_path) and os.path.isfile(file_path):
-                                valid_files.append(file_path)
-                        
-                        if valid_files:
-                            self._emit_event('files_changed', valid_files)
-                            
-            finally:
-                win32clipboard.CloseClipboard()
+            file_paths = self.backend.get_file_paths()
+            
+            if file_paths and file_paths != self.recent_files:
+                self.recent_files = list(file_paths)
+                
+                # 验证文件是否存在
+                valid_files = []
+                for file_path in file_paths:
+                    if os.path.exists(file_path) and os.path.isfile(file_path):
+                        valid_files.append(file_path)
+                
+                if valid_files:
+                    self._emit_event('files_changed', valid_files)
                 
         except Exception as e:
+            # 剪切板可能正被其他程序占用，下一轮重新读取
+            self.probe.reset()
             self._emit_event('error', f"检查文件剪切板出错: {e}")
     
     def _check_text_clipboard(self):
         """检查文本剪切板变化"""
         try:
-            raw_text = pyperclip.paste()
+            raw_text = self.backend.get_text()
             normalized_text = raw_text.strip()
             
             if normalized_text and normalized_text != self.recent_text:
@@ -148,34 +152,30 @@ class ClipboardMonitor:
                     self._emit_event('text_changed', normalized_text)
                     
         except Exception as e:
+            # 剪切板可能正被其他程序占用，下一轮重新读取
+            self.probe.reset()
             self._emit_event('error', f"检查文本剪切板出错: {e}")
     
     def get_current_text(self) -> Optional[str]:
         """获取当前剪切板文本"""
         try:
-            return pyperclip.paste()
+            return self.backend.get_text()
         except Exception:
             return None
     
     def get_current_files(self) -> List[str]:
         """获取当前剪切板文件列表"""
         try:
-            win32clipboard.OpenClipboard()
-            try:
-                if win32clipboard.IsClipboardFormatAvailable(win32con.CF_HDROP):
-                    return win32clipboard.GetClipboardData(win32con.CF_HDROP)
-            finally:
-                win32clipboard.CloseClipboard()
+            return self.backend.get_file_paths()
         except Exception:
-            pass
-        return []
+            return []
 
 class ClipboardService:
     """剪切板服务 - 高级封装"""
     
-    def __init__(self, file_service=None):
+    def __init__(self, file_service=None, backend: ClipboardBackend = None):
         self.file_service = file_service
-        self.monitor = ClipboardMonitor()
+        self.monitor = ClipboardMonitor(backend)
         
         # 设置监听器回调
         self.monitor.set_callback('text_changed', self._on_text_changed)
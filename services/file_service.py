@@ -9,20 +9,30 @@ import hashlib
 import threading
 import queue
 import time
-import math
 import base64
 import urllib.parse
-from collections import deque
 from typing import Callable, Optional, Dict, Any
 
 # 导入现有的核心功能
-from network_utils import get_encryption_key, upload_data, create_and_encrypt_payload
+from network_utils import (encrypt_payload_bytes, get_payload_version, get_segment_size, payload_upload_name, upload_data,
+                           create_and_encrypt_payload, EncryptedFileStream, HttpTransport, PAYLOAD_VERSION_V1)
 from config_manager import ConfigManager
+from upload_pipeline import ChunkUploadPipeline, PipelineSettings
+from transfer_scheduler import PRIORITY_INTERACTIVE, PRIORITY_SMALL, TransferScheduler
+from chunk_sizing import ChunkSizeController, ChunkSizingSettings
+from listing_watcher import range_chunk_name
+from upload_manifest import UploadManifestStore
+from upload_dedup import UploadDedupStore
+from file_fingerprint import get_default_fingerprinter
+from payload_compression import CompressionPolicy
+from file_bundle import BundleSettings, bundle_name, pack_files, plan_bundles
+from delta_sync import DeltaSettings, SignatureStore, build_delta_patch, fetch_signatures
 
 class FileUploadService:
     """文件上传服务 - 业务逻辑层"""
     
-    def __init__(self, config_manager: ConfigManager = None):
+    def __init__(self, config_manager: ConfigManager = None, transport: HttpTransport = None,
+                 transfer_scheduler: TransferScheduler = None):
         self.config_manager = config_manager or ConfigManager()
         
         # 从配置加载参数
@@ -31,9 +41,36 @@ class FileUploadService:
         self.chunk_size_mb = int(config['DEFAULT'].get('chunk_size_mb', 45))
         self.max_file_size_bytes = self.max_file_size_mb * 1024 * 1024
         self.chunk_size_bytes = self.chunk_size_mb * 1024 * 1024
+        self.payload_version = get_payload_version(config)
+        self.segment_size = get_segment_size(config)
+        # 加密前压缩：按文件类别与采样压缩率决定，已压缩格式直接跳过
+        self.compression_policy = CompressionPolicy.from_config(config)
+        # 小文件打包：多个小文件合并为一个载荷上传
+        self.bundle_settings = BundleSettings.from_config(config)
+        # 增量传输：取回下载端签名，大文件只上传变化的块
+        self.delta_settings = DeltaSettings.from_config(config)
+        self.signature_store = SignatureStore.from_config(config)
+        self.pipeline_settings = PipelineSettings.from_config(config)
+        # 自适应分片：按实测吞吐与失败率在上下限之间调整分片大小
+        self.chunk_sizing = ChunkSizingSettings.from_config(config, self.chunk_size_bytes)
         
-        # 上传缓存
-        self.upload_cache = deque(maxlen=20)
+        # 断点续传清单
+        self.manifest_store = UploadManifestStore.from_config(config)
+        
+        # 传输调度（可由调用方注入共享）：文本 > 小文件 > 大文件分片，文本不会排在分片之后
+        self.transfer_scheduler = transfer_scheduler or TransferScheduler.from_config(config, name="ServiceTransfer")
+        
+        # 共享HTTP传输层（可由调用方注入，与其他组件共用连接池），覆盖传输调度器的全部并发
+        self.transport = transport or HttpTransport.from_config(
+            config, pool_size=sum(self.transfer_scheduler.limits.values()))
+        # Cookie刷新时解除"等待登录"状态，等待中的上传自动重传
+        self.config_manager.add_listener(self.transport.auth_gate.refresh)
+        
+        # 持久化去重索引（重启后依然跳过已上传的内容）
+        self.dedup_store = UploadDedupStore.from_config(config)
+        self.dedup_store.purge_expired()
+        # 文件指纹（按路径/大小/修改时间记忆，未变化的文件不再重复读取）
+        self.fingerprinter = get_default_fingerprinter()
         
         # 事件回调
         self.callbacks = {
@@ -43,6 +80,11 @@ class FileUploadService:
             'error': None              # 错误回调
         }
     
+    @property
+    def waiting_for_auth(self) -> bool:
+        """登录已失效、正在等待浏览器同步新Cookie"""
+        return self.transport.auth_gate.waiting_for_auth
+    
     def set_callback(self, event_type: str, callback: Callable):
         """设置事件回调"""
         if event_type in self.callbacks:
@@ -58,27 +100,21 @@ class FileUploadService:
                 print(f"回调执行出错 {event_type}: {e}")
     
     def _calculate_file_hash(self, file_path: str) -> Optional[str]:
-        """计算文件哈希值 - 使用流式处理避免内存问题"""
+        """计算文件哈希值 - 流式读取，文件未变化时直接取记忆结果"""
         try:
             self._emit_event('status', {'type': 'info', 'message': f'正在计算文件哈希: {os.path.basename(file_path)}'})
-            
-            sha256_hash = hashlib.sha256()
-            with open(file_path, 'rb') as f:
-                for byte_block in iter(lambda: f.read(65536), b""):
-                    sha256_hash.update(byte_block)
-            
-            return sha256_hash.hexdigest()
+            return self.fingerprinter.sha256(file_path)
         except Exception as e:
             self._emit_event('error', {'message': f'计算文件哈希失败: {e}'})
             return None
     
     def _is_file_cached(self, file_hash: str) -> bool:
-        """检查文件是否已在缓存中"""
-        return file_hash in self.upload_cache
+        """检查内容是否已在去重索引中"""
+        return self.dedup_store.contains(file_hash)
     
-    def _add_to_cache(self, file_hash: str):
-        """添加文件哈希到缓存"""
-        self.upload_cache.append(file_hash)
+    def _add_to_cache(self, file_hash: str, size: int, upload_id: Optional[str] = None):
+        """记录已上传内容到去重索引"""
+        self.dedup_store.record(file_hash, size, upload_id)
     
     def validate_file(self, file_path: str) -> Dict[str, Any]:
         """验证文件是否符合上传要求"""
@@ -160,14 +196,18 @@ class FileUploadService:
                     })
                     return True
                 
-                # 决定上传方式
-                if file_size > self.chunk_size_bytes:
-                    success = self._upload_file_chunks(file_path, file_name, file_size, password)
-                else:
-                    success = self._upload_file_single(file_path, file_name, password)
+                # 决定上传方式：下载端已有旧版本时优先增量上传，不适用时返回 None 并完整上传
+                success = self._upload_file_delta(file_path, file_name, file_size, password, file_hash)
+                if success is None:
+                    if file_size > self.chunk_size_bytes:
+                        # 分片上传在完成时已连同 upload_id 记录到去重索引
+                        success = self._upload_file_chunks(file_path, file_name, file_size, password, file_hash)
+                    else:
+                        success = self._upload_file_single(file_path, file_name, password)
+                        if success:
+                            self._add_to_cache(file_hash, file_size)
                 
                 if success:
-                    self._add_to_cache(file_hash)
                     self._emit_event('complete', {
                         'file_path': file_path,
                         'skipped': False,
@@ -180,33 +220,98 @@ class FileUploadService:
                 self._emit_event('error', {'message': f'上传过程出错: {e}'})
                 return False
         
-        # 在后台线程执行上传
-        upload_thread = threading.Thread(target=upload_worker, daemon=True)
-        upload_thread.start()
+        # 大文件在独立线程中协调，分片交给传输调度器；其余文件按小文件类别排队
+        try:
+            is_large = os.path.getsize(file_path) > self.chunk_size_bytes
+        except OSError:
+            is_large = False
+        if is_large:
+            threading.Thread(target=upload_worker, daemon=True).start()
+        else:
+            self.transfer_scheduler.submit(upload_worker, priority=PRIORITY_SMALL)
         return True
     
+    def upload_files_async(self, file_paths, password: str) -> bool:
+        """异步上传一批文件：小文件按建议打包上传，其余文件逐个上传"""
+        file_paths = list(file_paths)
+        if self.payload_version == PAYLOAD_VERSION_V1:
+            bundles, singles = [], file_paths
+        else:
+            bundles, singles = plan_bundles(file_paths, self.bundle_settings)
+        
+        for bundle_paths in bundles:
+            self.transfer_scheduler.submit(self._upload_bundle, bundle_paths, password, priority=PRIORITY_SMALL)
+        for file_path in singles:
+            self.upload_file_async(file_path, password)
+        return True
+    
+    def _upload_bundle(self, file_paths, password: str) -> bool:
+        """把一组小文件打包为一个载荷上传，成功后逐个记录去重并通知完成"""
+        try:
+            pending = []
+            for file_path in file_paths:
+                validation = self.validate_file(file_path)
+                if not validation['valid']:
+                    self._emit_event('error', {'message': f"{os.path.basename(file_path)}: {validation['reason']}"})
+                    continue
+                file_hash = self._calculate_file_hash(file_path)
+                if not file_hash:
+                    continue
+                if self._is_file_cached(file_hash):
+                    self._emit_event('complete', {'file_path': file_path, 'skipped': True, 'reason': '内容未变'})
+                    continue
+                pending.append((file_path, file_hash, validation['file_size']))
+            
+            if not pending:
+                return True
+            
+            paths = [file_path for file_path, _, _ in pending]
+            self._emit_event('status', {'type': 'info', 'message': f'正在打包上传 {len(paths)} 个小文件'})
+            encrypted_payload = encrypt_payload_bytes(
+                pack_files(paths), password, bundle_name(len(paths)), version=self.payload_version,
+                compression=self.compression_policy, is_bundle=True)
+            
+            status_queue = queue.Queue()
+            success = upload_data(encrypted_payload, self.config_manager.get_config(), status_queue,
+                                  transport=self.transport)
+            
+            # 处理状态消息
+            while not status_queue.empty():
+                try:
+                    msg_type, message = status_queue.get_nowait()
+                    self._emit_event('status', {'type': msg_type, 'message': message})
+                except queue.Empty:
+                    break
+            
+            if not success:
+                self._emit_event('error', {'message': f'{len(paths)} 个小文件打包上传失败'})
+                return False
+            
+            for file_path, file_hash, file_size in pending:
+                self._add_to_cache(file_hash, file_size)
+                self._emit_event('complete', {'file_path': file_path, 'skipped': False, 'file_size': file_size})
+            return True
+            
+        except Exception as e:
+            self._emit_event('error', {'message': f'打包上传出错: {e}'})
+            return False
+    
     def _upload_file_single(self, file_path: str, file_name: str, password: str) -> bool:
         """单文件上传"""
         try:
             self._emit_event('status', {'type': 'info', 'message': f'正在上传: {file_name}'})
             self._emit_event('progress', {'file': file_name, 'percent': 0})
             
-            # 读取文件内容
-            with open(file_path, 'rb') as f:
-                data_bytes = f.read()
-            
-            # 创建加密载荷
-            key = get_encryption_key(password)
-            from cryptography.fernet import Fernet
-            import json
-            fernet = Fernet(key)
-            
-            payload = {
-                "filename": file_name,
-                "content_base64": base64.b64encode(data_bytes).decode('utf-8'),
-                "is_from_text": False
-            }
-            encrypted_payload = fernet.encrypt(json.dumps(payload).encode('utf-8'))
+            # 创建加密载荷：v2格式使用流式加密，上传时从磁盘边读边加密
+            if self.payload_version == PAYLOAD_VERSION_V1:
+                with open(file_path, 'rb') as f:
+                    data_bytes = f.read()
+                encrypted_payload = encrypt_payload_bytes(
+                    data_bytes, password, file_name, version=self.payload_version)
+            else:
+                encrypted_payload = EncryptedFileStream(
+                    file_path, password, filename=file_name, segment_size=self.segment_size,
+                    compression=self.compression_policy)
             
             # 使用现有的上传函数
             config = self.config_manager.get_config()
@@ -214,7 +319,11 @@ class FileUploadService:
             
             self._emit_event('progress', {'file': file_name, 'percent': 50})
             
-            success = upload_data(encrypted_payload, config, status_queue)
+            try:
+                success = upload_data(encrypted_payload, config, status_queue, transport=self.transport)
+            finally:
+                if isinstance(encrypted_payload, EncryptedFileStream):
+                    encrypted_payload.close()
             
             # 处理状态队列中的消息
             while not status_queue.empty():
@@ -236,68 +345,117 @@ class FileUploadService:
             self._emit_event('error', {'message': f'单文件上传出错: {e}'})
             return False
     
-    def _upload_file_chunks(self, file_path: str, file_name: str, file_size: int, password: str) -> bool:
-        """分片上传大文件"""
+    def _upload_file_delta(self, file_path: str, file_name: str, file_size: int, password: str,
+                           file_hash: str) -> Optional[bool]:
+        """增量上传：返回上传结果；未开启、没有可用签名或变化过大时返回 None"""
+        if not self.delta_settings.applies_to(file_size) or self.payload_version == PAYLOAD_VERSION_V1:
+            return None
+        
+        config = self.config_manager.get_config()
+        status_queue = queue.Queue()
+        try:
+            fetch_signatures(self.signature_store, config, password, status_queue, self.transport)
+        except Exception as e:
+            self._emit_event('status', {'type': 'warning', 'message': f'取回文件签名失败，使用已保存的签名: {e}'})
+        
+        patch = build_delta_patch(self.signature_store, self.delta_settings, file_path, file_hash,
+                                  max_patch_bytes=self.chunk_size_bytes)
+        if patch is None:
+            return None
+        
+        self._emit_event('status', {
+            'type': 'info',
+            'message': f'增量上传: {file_name} 只需发送 {self.format_file_size(len(patch))} / {self.format_file_size(file_size)}'
+        })
+        encrypted_payload = encrypt_payload_bytes(
+            patch, password, file_name, version=self.payload_version,
+            compression=self.compression_policy, is_delta=True)
+        success = upload_data(encrypted_payload, config, status_queue, transport=self.transport)
+        
+        # 处理状态消息
+        while not status_queue.empty():
+            try:
+                msg_type, message = status_queue.get_nowait()
+                self._emit_event('status', {'type': msg_type, 'message': message})
+            except queue.Empty:
+                break
+        
+        if success:
+            # 下载端应用补丁后文件版本改变，等待其发布新签名。
+            # 不记录去重：补丁可能在下载端重建失败，此时须允许再次发送该版本
+            self.signature_store.discard(file_name)
+        return success
+    
+    def _upload_file_chunks(self, file_path: str, file_name: str, file_size: int, password: str,
+                            file_hash: Optional[str] = None) -> bool:
+        """分片上传大文件 - 读取/加密/上传流水线并行，支持按清单断点续传"""
+        # 变长分片使用带字节偏移的分片名，旧下载端无法识别；v1 兼容模式固定使用编号分片
+        if self.chunk_sizing.enabled and self.payload_version != PAYLOAD_VERSION_V1:
+            return self._upload_file_ranges(file_path, file_name, file_size, password, file_hash)
         try:
             self._emit_event('status', {'type': 'info', 'message': f'启动分片上传: {file_name}'})
             
             encoded_filename = urllib.parse.quote(file_name)
-            upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
-            total_chunks = math.ceil(file_size / self.chunk_size_bytes)
+            new_upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
+            manifest = self.manifest_store.load_or_create(
+                file_name, file_hash or self.fingerprinter.sha256(file_path), file_size, self.chunk_size_bytes, new_upload_id)
+            upload_id = manifest.upload_id
+            total_chunks = manifest.total_chunks
+            pending_chunks = manifest.pending_chunks()
+            if manifest.is_resumed:
+                self._emit_event('status', {
+                    'type': 'info',
+                    'message': f'断点续传: {file_name} 已确认 {total_chunks - len(pending_chunks)}/{total_chunks} 个分片'
+                })
             
-            config = self.config_manager.get_config()
+            def encrypt_chunk(chunk_data, chunk_index):
+                # 创建分片的加密载荷
+                return encrypt_payload_bytes(chunk_data, password, file_name, version=self.payload_version,
+                                             compression=self.compression_policy)
             
-            with open(file_path, 'rb') as f:
-                for i in range(total_chunks):
-                    chunk_data = f.read(self.chunk_size_bytes)
-                    if not chunk_data:
+            def upload_chunk(encrypted_payload, chunk_index):
+                chunk_filename = f"chunk_{upload_id}_{chunk_index:03d}_{total_chunks:03d}_{encoded_filename}.encrypted"
+                status_queue = queue.Queue()
+                # 每个分片取最新配置快照，上传途中同步的新Cookie立即生效
+                success = upload_data(encrypted_payload, self.config_manager.get_config(), status_queue,
+                                      custom_filename=chunk_filename, transport=self.transport)
+                
+                # 处理状态消息
+                while not status_queue.empty():
+                    try:
+                        msg_type, message = status_queue.get_nowait()
+                        self._emit_event('status', {'type': msg_type, 'message': message})
+                    except queue.Empty:
                         break
-                    
-                    chunk_index = i + 1
-                    progress_percent = int((chunk_index / total_chunks) * 100)
-                    
-                    self._emit_event('progress', {
-                        'file': file_name,
-                        'percent': progress_percent,
-                        'chunk': f'{chunk_index}/{total_chunks}'
-                    })
-                    
-                    self._emit_event('status', {
-                        'type': 'info',
-                        'message': f'{file_name} - 分片 {chunk_index}/{total_chunks}'
-                    })
-                    
-                    # 创建分片的加密载荷
-                    key = get_encryption_key(password)
-                    from cryptography.fernet import Fernet
-                    import json
-                    fernet = Fernet(key)
-                    
-                    payload = {
-                        "filename": file_name,
-                        "content_base64": base64.b64encode(chunk_data).decode('utf-8'),
-                        "is_from_text": False
-                    }
-                    encrypted_payload = fernet.encrypt(json.dumps(payload).encode('utf-8'))
-                    
-                    # 分片文件名
-                    chunk_filename = f"chunk_{upload_id}_{chunk_index:03d}_{total_chunks:03d}_{encoded_filename}.encrypted"
-                    
-                    # 上传分片
-                    status_queue = queue.Queue()
-                    success = upload_data(encrypted_payload, config, status_queue, custom_filename=chunk_filename)
-                    
-                    # 处理状态消息
-                    while not status_queue.empty():
-                        try:
-                            msg_type, message = status_queue.get_nowait()
-                            self._emit_event('status', {'type': msg_type, 'message': message})
-                        except queue.Empty:
-                            break
-                    
-                    if not success:
-                        self._emit_event('error', {'message': f'分片 {chunk_index} 上传失败'})
-                        return False
+                
+                if not success:
+                    self._emit_event('error', {'message': f'分片 {chunk_index} 上传失败'})
+                    return False
+                self.manifest_store.mark_acked(manifest, chunk_index)
+                return True
+            
+            def on_chunk_done(chunk_index, completed, total):
+                # 分片按完成顺序上报，进度以已完成数计算
+                self._emit_event('progress', {
+                    'file': file_name,
+                    'percent': int((completed / total) * 100),
+                    'chunk': f'{completed}/{total}'
+                })
+                self._emit_event('status', {
+                    'type': 'info',
+                    'message': f'{file_name} - 分片 {chunk_index} 完成 ({completed}/{total})'
+                })
+            
+            pipeline = ChunkUploadPipeline(
+                encrypt_chunk, upload_chunk, self.pipeline_settings, on_progress=on_chunk_done,
+                scheduler=self.transfer_scheduler, group=upload_id)
+            if not pipeline.run(file_path, self.chunk_size_bytes, total_chunks=total_chunks,
+                                chunk_indices=pending_chunks):
+                self._emit_event('status', {'type': 'warning', 'message': f'分片上传中断，已保存续传进度: {file_name}'})
+                return False
+            
+            self.manifest_store.remove(manifest)
+            self._add_to_cache(manifest.file_hash, file_size, upload_id)
             
             self._emit_event('progress', {'file': file_name, 'percent': 100})
             self._emit_event('status', {'type': 'success', 'message': f'分片上传完成: {file_name}'})
@@ -307,12 +465,91 @@ class FileUploadService:
             self._emit_event('error', {'message': f'分片上传出错: {e}'})
             return False
     
+    def _upload_file_ranges(self, file_path: str, file_name: str, file_size: int, password: str,
+                            file_hash: Optional[str] = None) -> bool:
+        """可变大小分片上传 - 分片大小随实测吞吐调整，分片名携带字节偏移，清单按字节区间续传"""
+        try:
+            self._emit_event('status', {'type': 'info', 'message': f'启动分片上传: {file_name}'})
+            
+            encoded_filename = urllib.parse.quote(file_name)
+            new_upload_id = f"{int(time.time())}-{base64.urlsafe_b64encode(os.urandom(4)).decode()}"
+            manifest = self.manifest_store.load_or_create(
+                file_name, file_hash or self.fingerprinter.sha256(file_path), file_size, 0, new_upload_id)
+            upload_id = manifest.upload_id
+            pending_ranges = manifest.pending_ranges()
+            if manifest.is_resumed:
+                self._emit_event('status', {
+                    'type': 'info',
+                    'message': f'断点续传: {file_name} 已确认 {manifest.acked_bytes / 1024 ** 2:.1f}/{file_size / 1024 ** 2:.1f}MB'
+                })
+            
+            controller = ChunkSizeController(
+                self.chunk_sizing,
+                on_decision=lambda message: self._emit_event('status', {'type': 'info', 'message': f'{file_name}: {message}'}))
+            chunk_count = [0]
+            
+            def encrypt_chunk(chunk_data, offset):
+                return encrypt_payload_bytes(chunk_data, password, file_name, version=self.payload_version,
+                                             compression=self.compression_policy)
+            
+            def upload_chunk(encrypted_payload, offset, length):
+                chunk_filename = range_chunk_name(upload_id, offset, file_size, encoded_filename)
+                status_queue = queue.Queue()
+                # 每个分片取最新配置快照，上传途中同步的新Cookie立即生效
+                success = upload_data(encrypted_payload, self.config_manager.get_config(), status_queue,
+                                      custom_filename=chunk_filename, transport=self.transport)
+                
+                while not status_queue.empty():
+                    try:
+                        msg_type, message = status_queue.get_nowait()
+                        self._emit_event('status', {'type': msg_type, 'message': message})
+                    except queue.Empty:
+                        break
+                
+                if not success:
+                    # 流水线会按缩小后的分片大小重试该区间
+                    self._emit_event('status', {'type': 'warning', 'message': f'分片 @{offset} 上传失败，准备重试'})
+                    return False
+                self.manifest_store.mark_range_acked(manifest, offset, length)
+                return True
+            
+            def on_chunk_done(offset, completed_bytes, total_bytes):
+                chunk_count[0] += 1
+                self._emit_event('progress', {
+                    'file': file_name,
+                    'percent': int((completed_bytes / total_bytes) * 100),
+                    'chunk': f'{chunk_count[0]}'
+                })
+            
+            pipeline = ChunkUploadPipeline(
+                encrypt_chunk, upload_chunk, self.pipeline_settings, on_progress=on_chunk_done,
+                scheduler=self.transfer_scheduler, group=upload_id)
+            if not pipeline.run_ranges(file_path, pending_ranges, controller, total_bytes=file_size):
+                self._emit_event('error', {'message': f'分片上传失败: {file_name}'})
+                self._emit_event('status', {'type': 'warning', 'message': f'分片上传中断，已保存续传进度: {file_name}'})
+                return False
+            
+            self.manifest_store.remove(manifest)
+            self._add_to_cache(manifest.file_hash, file_size, upload_id)
+            
+            self._emit_event('progress', {'file': file_name, 'percent': 100})
+            self._emit_event('status', {
+                'type': 'success',
+                'message': f'分片上传完成: {file_name} ({controller.samples} 个分片, 失败 {controller.failures} 次)'
+            })
+            return True
+            
+        except Exception as e:
+            self._emit_event('error', {'message': f'分片上传出错: {e}'})
+            return False
+    
     def upload_text_async(self, text_content: str, password: str) -> bool:
         """异步上传文本内容"""
         def upload_worker():
             try:
                 # 计算文本哈希
-                content_hash = hashlib.sha256(text_content.encode('utf-8')).hexdigest()
+                data_bytes = text_content.encode('utf-8')
+                content_hash = hashlib.sha256(data_bytes).hexdigest()
                 
                 # 检查缓存
                 if self._is_file_cached(content_hash):
@@ -325,23 +562,15 @@ class FileUploadService:
                 })
                 
                 # 创建加密载荷
-                data_bytes = text_content.encode('utf-8')
-                key = get_encryption_key(password)
-                from cryptography.fernet import Fernet
-                import json
-                fernet = Fernet(key)
-                
-                payload = {
-                    "filename": "clipboard_text.txt",
-                    "content_base64": base64.b64encode(data_bytes).decode('utf-8'),
-                    "is_from_text": True
-                }
-                encrypted_payload = fernet.encrypt(json.dumps(payload).encode('utf-8'))
+                encrypted_payload = encrypt_payload_bytes(
+                    data_bytes, password, "clipboard_text.txt", is_from_text=True, version=self.payload_version,
+                    compression=self.compression_policy)
                 
                 # 上传
                 config = self.config_manager.get_config()
                 status_queue = queue.Queue()
-                success = upload_data(encrypted_payload, config, status_queue)
+                success = upload_data(encrypted_payload, config, status_queue,
+                                      custom_filename=payload_upload_name(is_from_text=True), transport=self.transport)
                 
                 # 处理状态消息
                 while not status_queue.empty():
@@ -352,7 +581,7 @@ class FileUploadService:
                         break
                 
                 if success:
-                    self._add_to_cache(content_hash)
+                    self._add_to_cache(content_hash, len(data_bytes))
                     self._emit_event('complete', {
                         'file_path': 'clipboard_text.txt',
                         'skipped': False,
@@ -365,7 +594,6 @@ class FileUploadService:
                 self._emit_event('error', {'message': f'文本上传出错: {e}'})
                 return False
         
-        # 在后台线程执行
-        upload_thread = threading.Thread(target=upload_worker, daemon=True)
-        upload_thread.start()
+        # 交互类别有独立的并发名额，不会排在大文件分片之后
+        self.transfer_scheduler.submit(upload_worker, priority=PRIORITY_INTERACTIVE)
         return True
\ No newline at end of file
@@ -5,13 +5,14 @@
 
 import os
 import json
-import hashlib
 import mimetypes
 import threading
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 
+from file_fingerprint import FileFingerprinter, get_default_fingerprinter
+
 @dataclass
 class UserPreference:
     """用户偏好数据结构"""
@@ -42,7 +43,10 @@ class FileInfo:
 class SmartFileAnalyzer:
     """智能文件分析器"""
     
-    def __init__(self):
+    def __init__(self, fingerprinter: FileFingerprinter = None):
+        # 文件指纹（快速预筛指纹，按路径/大小/修改时间记忆）
+        self.fingerprinter = fingerprinter or get_default_fingerprinter()
+        
         # 文件类型映射
         self.file_type_map = {
             'image': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp'],
@@ -101,20 +105,16 @@ class SmartFileAnalyzer:
             )
     
     def _calculate_file_hash(self, file_path: str) -> str:
-        """计算文件哈希值"""
+        """计算文件快速指纹（大小 + 首/中/尾采样），重复判定时再以完整哈希确认"""
         try:
-            sha256_hash = hashlib.sha256()
-            with open(file_path, 'rb') as f:
-                # 只读取前1MB来计算哈希，提高速度
-                for byte_block in iter(lambda: f.read(65536), b""):
-                    sha256_hash.update(byte_block)
-                    # 限制读取大小，避免大文件影响性能
-                    if f.tell() > 1024 * 1024:  # 1MB
-                        break
-            return sha256_hash.hexdigest()
+            return self.fingerprinter.quick(file_path)
         except Exception:
             return ''
     
+    def prefetch_hashes(self, file_paths: List[str]):
+        """在线程池中并行计算一批文件的指纹，随后的 analyze_file 直接命中缓存"""
+        self.fingerprinter.prefetch(file_paths)
+    
     def get_file_category(self, file_path: str) -> str:
         """获取文件类别"""
         ext = os.path.splitext(file_path)[1].lower()
@@ -160,10 +160,15 @@ class SmartFileAnalyzer:
         # 根据文件大小调整
         if size_category == 'huge':
             suggestions['quality'] = 'fast'  # 大文件使用快速模式
-        elif size_category == 'tiny':
-            suggestions['batch_size'] = 10  # 小文件可以批量处理
+        suggestions['batch_size'] = self.suggest_batch_size(file_info.size)
         
         return suggestions
+    
+    def suggest_batch_size(self, file_size: int) -> int:
+        """建议批量大小：大于1表示可与其他小文件打包为一个载荷上传"""
+        if self.get_file_size_category(file_size) == 'tiny':
+            return 10  # 小文件可以批量处理
+        return 1
 
 class DuplicateDetector:
     """重复文件检测器"""
@@ -285,8 +290,10 @@ class SmartAssistant:
         file_info = self.file_analyzer.analyze_file(file_path)
         self.stats['files_analyzed'] += 1
         
-        # 检查重复
+        # 检查重复：快速指纹相同时以完整SHA-256确认，排除采样碰撞
         is_duplicate, duplicate_file = self.duplicate_detector.check_duplicate(file_info)
+        if is_duplicate and not self._confirm_duplicate(file_info, duplicate_file):
+            is_duplicate, duplicate_file = False, None
         
         if is_duplicate:
             self.stats['duplicates_found'] += 1
@@ -316,6 +323,13 @@ class SmartAssistant:
             'recommendation': self._generate_recommendation(file_info, is_duplicate, file_category)
         }
     
+    def _confirm_duplicate(self, file_info: FileInfo, duplicate_file: FileInfo) -> bool:
+        """比较两文件的完整哈希；原文件已不可读时以快速指纹结果为准"""
+        try:
+            return self.file_analyzer.fingerprinter.same_content(file_info.path, duplicate_file.path)
+        except OSError:
+            return True
+    
     def _generate_recommendation(self, file_info: FileInfo, is_duplicate: bool, category: str) -> str:
         """生成智能建议"""
         if is_duplicate:
@@ -359,4 +373,16 @@ class SmartAssistant:
             **self.stats,
             'duplicate_rate': (self.stats['duplicates_found'] / max(self.stats['files_analyzed'], 1)) * 100,
             'space_saved_mb': self.stats['total_size_saved'] / (1024 * 1024)
-        }
\ No newline at end of file
+        }
+
+_default_analyzer = None
+_default_analyzer_lock = threading.Lock()
+
+
+def get_default_file_analyzer() -> SmartFileAnalyzer:
+    """获取进程级共享文件分析器（加密前压缩、小文件打包等按同一分类规则决策）"""
+    global _default_analyzer
+    with _default_analyzer_lock:
+        if _default_analyzer is None:
+            _default_analyzer = SmartFileAnalyzer()
+        return _default_analyzer
@@ -0,0 +1,151 @@
+# transfer_scheduler.py
+"""
+传输调度 - 按优先级类别分配并发，剪切板文本不再排在大文件分片之后
+
+三个优先级类别（数值越小越优先）：
+- PRIORITY_INTERACTIVE: 剪切板文本等交互内容
+- PRIORITY_SMALL: 单个小文件、打包载荷，以及删除/合并等短任务
+- PRIORITY_BULK: 大文件分片
+每个类别有独立的并发上限，工作线程总数等于各类别上限之和：分片再多也占不到交互类别
+的名额，新到的文本任务总能立即开始执行。同一类别内按 group（如 upload_id）轮转取任务，
+多个大文件同时传输时交替推进，不会由先到的文件独占全部分片名额。
+"""
+
+import threading
+import concurrent.futures
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SMALL = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_SMALL: 'small', PRIORITY_BULK: 'bulk'}
+
+DEFAULT_LIMITS = {PRIORITY_INTERACTIVE: 2, PRIORITY_SMALL: 2, PRIORITY_BULK: 3}
+_CONFIG_KEYS = {
+    PRIORITY_INTERACTIVE: 'transfer_interactive_workers',
+    PRIORITY_SMALL: 'transfer_small_workers',
+    PRIORITY_BULK: 'transfer_bulk_workers',
+}
+# 旧版配置项：分片并发原由 upload_concurrency 控制，未配置新键时沿用其值
+_LEGACY_CONFIG_KEYS = {PRIORITY_BULK: 'upload_concurrency'}
+
+
+class TransferScheduler:
+    """带优先级类别与组间轮转的任务执行器（线程安全），submit 返回 concurrent.futures.Future"""
+
+    def __init__(self, limits: Optional[Dict[int, int]] = None, name: str = "Transfer"):
+        self.name = name
+        self.lock = threading.Lock()
+        self.limits = self._normalize(limits)
+        # 每个类别: group -> 待执行任务队列，OrderedDict 的顺序即轮转顺序
+        self._queues: Dict[int, "OrderedDict[Hashable, deque]"] = {p: OrderedDict() for p in self.limits}
+        self._running = {p: 0 for p in self.limits}
+        self._active = set()
+        self._closed = False
+        self._executor = self._new_executor()
+
+    @staticmethod
+    def _normalize(limits: Optional[Dict[int, int]]) -> Dict[int, int]:
+        limits = limits or {}
+        return {p: max(1, int(limits.get(p, default))) for p, default in DEFAULT_LIMITS.items()}
+
+    def _new_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=sum(self.limits.values()), thread_name_prefix=self.name)
+
+    @staticmethod
+    def limits_from_config(config) -> Dict[int, int]:
+        section = config['DEFAULT']
+        try:
+            limits = {}
+            for p, key in _CONFIG_KEYS.items():
+                default = DEFAULT_LIMITS[p]
+                if p in _LEGACY_CONFIG_KEYS:
+                    default = section.get(_LEGACY_CONFIG_KEYS[p], default)
+                limits[p] = int(section.get(key, default))
+            return limits
+        except (TypeError, ValueError):
+            return dict(DEFAULT_LIMITS)
+
+    @classmethod
+    def from_config(cls, config, name: str = "Transfer") -> 'TransferScheduler':
+        return cls(cls.limits_from_config(config), name)
+
+    def configure(self, config):
+        """按配置调整各类别并发上限（可在运行中调用）；总线程数增加时换用更大的线程池"""
+        limits = self._normalize(self.limits_from_config(config))
+        with self.lock:
+            if self._closed:
+                return
+            grow = sum(limits.values()) > sum(self.limits.values())
+            self.limits = limits
+            if grow:
+                # 旧线程池中的任务照常执行完毕，新任务进入新线程池
+                old_executor, self._executor = self._executor, self._new_executor()
+                old_executor.shutdown(wait=False)
+            self._pump_locked()
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_SMALL,
+               group: Optional[Hashable] = None) -> concurrent.futures.Future:
+        """提交任务；同一类别内相同 group 的任务按提交顺序执行，不同 group 之间轮转"""
+        if priority not in self.limits:
+            raise ValueError(f"未知的优先级类别: {priority}")
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("传输调度器已关闭")
+            self._queues[priority].setdefault(group, deque()).append((future, fn, args))
+            self._pump_locked()
+        return future
+
+    def _pump_locked(self):
+        """按优先级从高到低，在各类别上限内派发排队任务"""
+        for priority in sorted(self.limits):
+            queues = self._queues[priority]
+            while queues and self._running[priority] < self.limits[priority]:
+                group, tasks = next(iter(queues.items()))
+                future, fn, args = tasks.popleft()
+                if tasks:
+                    queues.move_to_end(group)
+                else:
+                    del queues[group]
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[priority] += 1
+                self._active.add(future)
+                self._executor.submit(self._run, priority, future, fn, args)
+
+    def _run(self, priority: int, future: concurrent.futures.Future, fn: Callable, args: tuple):
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self.lock:
+                self._running[priority] -= 1
+                self._active.discard(future)
+                if not self._closed:
+                    self._pump_locked()
+
+    def state(self) -> Dict[str, Tuple[int, int]]:
+        """各类别的 (运行中, 排队中) 任务数"""
+        with self.lock:
+            return {PRIORITY_NAMES[p]: (self._running[p], sum(len(q) for q in self._queues[p].values()))
+                    for p in self.limits}
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """停止接收任务并取消排队中的任务；wait 为 True 时最多等待 timeout 秒让运行中的任务结束"""
+        with self.lock:
+            self._closed = True
+            for queues in self._queues.values():
+                for tasks in queues.values():
+                    for future, _, _ in tasks:
+                        future.cancel()
+                queues.clear()
+            active = list(self._active)
+        self._executor.shutdown(wait=False)
+        if wait and active:
+            concurrent.futures.wait(active, timeout=timeout)
@@ -130,14 +130,16 @@ class MainController:
             return
         
         try:
-            upload_count = 0
+            upload_paths = []
             for file_path, file_info in self.selected_files.items():
                 if file_info['status'] == '待上传':
                     file_info['status'] = '队列中'
-                    self.file_service.upload_file_async(file_path, self.password)
-                    upload_count += 1
+                    upload_paths.append(file_path)
+            upload_count = len(upload_paths)
             
             if upload_count > 0:
+                # 小文件由文件服务打包为一个载荷上传
+                self.file_service.upload_files_async(upload_paths, self.password)
                 self.view.add_status_message(f"开始上传 {upload_count} 个文件", "info")
             else:
                 self.view.add_status_message("没有需要上传的文件", "warning")
@@ -168,6 +170,9 @@ class MainController:
     
     def _add_files_to_list_with_analysis(self, file_paths: List[str]):
         """添加文件到列表并进行智能分析"""
+        # 先并行计算所有新文件的指纹，逐个分析时直接命中缓存
+        self.smart_assistant.file_analyzer.prefetch_hashes(
+            [path for path in file_paths if path not in self.selected_files])
         for file_path in file_paths:
             if file_path not in self.selected_files:
                 try:
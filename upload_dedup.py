@@ -0,0 +1,102 @@
+# upload_dedup.py
+"""
+上传去重索引 - 按内容哈希记录已上传的文本/文件，程序重启后依然有效
+
+索引保存在本地 SQLite 数据库（内容哈希 → 上传时间、大小、upload_id），哈希为主键，
+查询不随条目数增长。超过有效期的条目视为未上传；条目数超过上限时按最近使用时间淘汰。
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+DEDUP_DB_NAME = 'dedup.sqlite3'
+
+
+class UploadDedupStore:
+    """持久化去重索引（线程安全，LRU + TTL 淘汰）"""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 1000, ttl_hours: float = 24):
+        self.db_path = db_path or os.path.join('./upload_state/', DEDUP_DB_NAME)
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_hours * 3600
+        self.lock = threading.Lock()
+        self._conn = self._connect()
+
+    @classmethod
+    def from_config(cls, config) -> 'UploadDedupStore':
+        section = config['DEFAULT']
+        try:
+            max_entries = int(section.get('dedup_max_entries', 1000))
+            ttl_hours = float(section.get('dedup_ttl_hours', 24))
+        except (TypeError, ValueError):
+            max_entries, ttl_hours = 1000, 24
+        state_dir = section.get('upload_state_dir', './upload_state/')
+        return cls(os.path.join(state_dir, DEDUP_DB_NAME), max_entries, ttl_hours)
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开索引库；目录不可写或库文件损坏时退化为内存索引，去重仅在本次运行内有效"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._init_schema(conn)
+        except sqlite3.Error as e:
+            print(f"警告: 去重索引 {self.db_path} 不可用，改用内存索引: {e}")
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
+            self._init_schema(conn)
+        return conn
+
+    @staticmethod
+    def _init_schema(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " content_hash TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " upload_id TEXT,"
+            " uploaded_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_last_used ON uploads (last_used)")
+        conn.commit()
+
+    def contains(self, content_hash: str) -> bool:
+        """内容是否已在有效期内上传过；命中时刷新最近使用时间"""
+        now = time.time()
+        with self.lock:
+            row = self._conn.execute(
+                "SELECT uploaded_at FROM uploads WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row is None:
+                return False
+            if now - row[0] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM uploads WHERE content_hash = ?", (content_hash,))
+                self._conn.commit()
+                return False
+            self._conn.execute("UPDATE uploads SET last_used = ? WHERE content_hash = ?", (now, content_hash))
+            self._conn.commit()
+            return True
+
+    def record(self, content_hash: str, size: int, upload_id: Optional[str] = None):
+        """记录一次成功上传，超出上限时淘汰最久未使用的条目"""
+        now = time.time()
+        with self.lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (content_hash, size, upload_id, uploaded_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)", (content_hash, size, upload_id, now, now))
+            self._conn.execute(
+                "DELETE FROM uploads WHERE content_hash IN ("
+                " SELECT content_hash FROM uploads ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """清理过期条目，返回清理数量"""
+        with self.lock:
+            cursor = self._conn.execute(
+                "DELETE FROM uploads WHERE uploaded_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self._conn.close()
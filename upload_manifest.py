@@ -0,0 +1,167 @@
+# upload_manifest.py
+"""
+分片上传清单 - 断点续传
+
+每个分片上传对应一个持久化清单（upload_id、文件哈希、分片大小、已确认分片），
+保存在本地状态目录。同一文件重试或程序重启后，沿用原 upload_id 只补传未确认的分片。
+可变分片大小的上传以 chunk_size=0 建立清单，记录已确认的字节区间，续传时只补传空缺区间。
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class UploadManifest:
+    """单个分片上传的清单"""
+    upload_id: str
+    file_name: str
+    file_hash: str
+    file_size: int
+    chunk_size: int
+    total_chunks: int
+    acked_chunks: List[int] = field(default_factory=list)
+    acked_ranges: List[List[int]] = field(default_factory=list)   # 可变分片: [起始偏移, 长度]
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def pending_chunks(self) -> List[int]:
+        """未确认的分片序号（从1开始，升序）"""
+        acked = set(self.acked_chunks)
+        return [i for i in range(1, self.total_chunks + 1) if i not in acked]
+
+    def pending_ranges(self) -> List[Tuple[int, int]]:
+        """未确认的字节区间 [start, end)（升序），用于可变分片大小的上传"""
+        gaps = []
+        cursor = 0
+        for offset, length in sorted(self.acked_ranges):
+            if offset > cursor:
+                gaps.append((cursor, offset))
+            cursor = max(cursor, offset + length)
+        if cursor < self.file_size:
+            gaps.append((cursor, self.file_size))
+        return gaps
+
+    @property
+    def acked_bytes(self) -> int:
+        return self.file_size - sum(end - start for start, end in self.pending_ranges())
+
+    @property
+    def is_resumed(self) -> bool:
+        return bool(self.acked_chunks or self.acked_ranges)
+
+
+class UploadManifestStore:
+    """清单存储 - 每个上传一个JSON文件，以 (文件哈希, 分片大小) 定位"""
+
+    def __init__(self, state_dir: str = './upload_state/', ttl_hours: float = 24):
+        self.state_dir = state_dir
+        self.ttl_seconds = ttl_hours * 3600
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'UploadManifestStore':
+        section = config['DEFAULT']
+        try:
+            ttl_hours = float(section.get('resume_manifest_ttl_hours', 24))
+        except (TypeError, ValueError):
+            ttl_hours = 24
+        return cls(section.get('upload_state_dir', './upload_state/'), ttl_hours)
+
+    def _manifest_path(self, file_hash: str, chunk_size: int) -> str:
+        key = hashlib.sha256(f"{file_hash}:{chunk_size}".encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.state_dir, f"{key}.json")
+
+    def _write(self, manifest: UploadManifest):
+        """原子写入：先写临时文件再替换，避免中途崩溃留下损坏的清单"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._manifest_path(manifest.file_hash, manifest.chunk_size)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(manifest), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str) -> Optional[UploadManifest]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return UploadManifest(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def load_or_create(self, file_name: str, file_hash: str, file_size: int,
+                       chunk_size: int, new_upload_id: str) -> UploadManifest:
+        """查找可续传的清单，不存在或已过期时以 new_upload_id 创建新清单
+
+        chunk_size 为 0 表示可变分片大小，此时 total_chunks 为 0，进度以字节区间记录。
+        """
+        total_chunks = -(-file_size // chunk_size) if chunk_size else 0
+        with self.lock:
+            path = self._manifest_path(file_hash, chunk_size)
+            manifest = self._read(path) if os.path.exists(path) else None
+            if (manifest is not None
+                    and manifest.file_size == file_size
+                    and manifest.total_chunks == total_chunks
+                    and time.time() - manifest.updated_at <= self.ttl_seconds):
+                return manifest
+
+            manifest = UploadManifest(
+                upload_id=new_upload_id,
+                file_name=file_name,
+                file_hash=file_hash,
+                file_size=file_size,
+                chunk_size=chunk_size,
+                total_chunks=total_chunks
+            )
+            self._write(manifest)
+            return manifest
+
+    def mark_acked(self, manifest: UploadManifest, chunk_index: int):
+        """记录分片已被服务器确认，立即落盘"""
+        with self.lock:
+            if chunk_index not in manifest.acked_chunks:
+                manifest.acked_chunks.append(chunk_index)
+                manifest.acked_chunks.sort()
+            manifest.updated_at = time.time()
+            self._write(manifest)
+
+    def mark_range_acked(self, manifest: UploadManifest, offset: int, length: int):
+        """记录字节区间已被服务器确认，立即落盘"""
+        with self.lock:
+            if [offset, length] not in manifest.acked_ranges:
+                manifest.acked_ranges.append([offset, length])
+                manifest.acked_ranges.sort()
+            manifest.updated_at = time.time()
+            self._write(manifest)
+
+    def remove(self, manifest: UploadManifest):
+        """上传全部完成后删除清单"""
+        with self.lock:
+            try:
+                os.remove(self._manifest_path(manifest.file_hash, manifest.chunk_size))
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self) -> int:
+        """清理过期清单，返回清理数量"""
+        removed = 0
+        if not os.path.isdir(self.state_dir):
+            return removed
+        with self.lock:
+            now = time.time()
+            for name in os.listdir(self.state_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.state_dir, name)
+                manifest = self._read(path)
+                if manifest is None or now - manifest.updated_at > self.ttl_seconds:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
@@ -0,0 +1,276 @@
+# upload_pipeline.py
+"""
+分片上传流水线 - 读取、加密、上传三个阶段并行
+
+读取阶段在调用线程中顺序读盘，加密阶段在加密线程池中执行，上传阶段由 N 个并发
+HTTP 工作线程完成。在途分片数由信号量限制，内存占用约为 在途分片数 × 分片大小 × 2。
+分片完成顺序不定，进度按完成顺序逐片回调。
+
+run() 按固定分片大小和分片序号上传；run_ranges() 按字节区间上传，每片大小在读取时
+向 ChunkSizeController 询问，失败的区间按当时的分片大小重新切分后重试。
+
+传入 TransferScheduler 时上传阶段不使用自带线程池，而是以 PRIORITY_BULK 提交给共享调度器，
+多个大文件的分片按 group 轮转，且不会占用剪切板文本的并发名额。
+"""
+
+import math
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Hashable, Iterable, Optional, Sequence, Tuple
+
+from transfer_scheduler import PRIORITY_BULK
+
+
+@dataclass
+class PipelineSettings:
+    """流水线参数（来自 config.ini）"""
+    max_in_flight: int = 4        # 同时在途（已读取未上传完成）的最大分片数
+    upload_workers: int = 3       # 并发HTTP上传数（仅在未使用传输调度器时生效）
+    encrypt_workers: int = 2      # 加密线程数
+    memory_limit_mb: int = 32     # 流水线内存上限，按分片大小折算后进一步限制在途分片数
+
+    @classmethod
+    def from_config(cls, config) -> 'PipelineSettings':
+        section = config['DEFAULT']
+        defaults = cls()
+        try:
+            return cls(
+                max_in_flight=max(1, int(section.get('upload_max_in_flight_chunks', defaults.max_in_flight))),
+                upload_workers=max(1, int(section.get(
+                    'transfer_bulk_workers', section.get('upload_concurrency', defaults.upload_workers)))),
+                encrypt_workers=max(1, int(section.get('encrypt_workers', defaults.encrypt_workers))),
+                memory_limit_mb=max(1, int(section.get('upload_pipeline_memory_mb', defaults.memory_limit_mb)))
+            )
+        except (TypeError, ValueError):
+            return defaults
+
+    def effective_in_flight(self, chunk_size_bytes: int) -> int:
+        """结合内存上限计算实际在途分片数（明文与密文各占一份）"""
+        per_chunk = max(1, chunk_size_bytes * 2)
+        by_memory = (self.memory_limit_mb * 1024 * 1024) // per_chunk
+        return max(1, min(self.max_in_flight, by_memory))
+
+
+class ChunkUploadPipeline:
+    """分片上传流水线
+
+    encrypt_func(chunk_bytes, chunk_index) -> 加密后的载荷
+    upload_func(payload, chunk_index) -> bool
+    on_progress(chunk_index, completed_count, total_chunks) 每个分片上传成功后回调
+    scheduler/group: 共享的 TransferScheduler 与本文件的轮转分组（通常为 upload_id）
+    """
+
+    def __init__(self, encrypt_func: Callable, upload_func: Callable,
+                 settings: Optional[PipelineSettings] = None,
+                 on_progress: Optional[Callable] = None,
+                 scheduler=None, group: Optional[Hashable] = None):
+        self.encrypt_func = encrypt_func
+        self.upload_func = upload_func
+        self.settings = settings or PipelineSettings()
+        self.on_progress = on_progress
+        self.scheduler = scheduler
+        self.group = group
+
+    def _new_upload_pool(self):
+        if self.scheduler is not None:
+            return None
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.settings.upload_workers, thread_name_prefix="ChunkUpload")
+
+    def _submit_upload(self, upload_pool, fn: Callable, *args) -> concurrent.futures.Future:
+        if upload_pool is None:
+            return self.scheduler.submit(fn, *args, priority=PRIORITY_BULK, group=self.group)
+        return upload_pool.submit(fn, *args)
+
+    @staticmethod
+    def _wait_uploads(upload_pool, futures):
+        """等待上传阶段结束（共享调度器没有可关闭的线程池，直接等待各分片的 Future）"""
+        if upload_pool is not None:
+            upload_pool.shutdown(wait=True)
+        else:
+            concurrent.futures.wait(list(futures))
+
+    def run(self, file_path: str, chunk_size_bytes: int, total_chunks: Optional[int] = None,
+            file_size: Optional[int] = None, chunk_indices: Optional[Iterable[int]] = None) -> bool:
+        """执行分片上传，全部成功返回 True；任一分片失败时停止读取新分片并返回 False
+
+        chunk_indices 指定待上传的分片序号（从1开始），用于断点续传时跳过已确认的分片；
+        缺省为全部分片。
+        """
+        if total_chunks is None:
+            total_chunks = math.ceil(file_size / chunk_size_bytes)
+        pending = sorted(chunk_indices) if chunk_indices is not None else list(range(1, total_chunks + 1))
+
+        in_flight = threading.BoundedSemaphore(self.settings.effective_in_flight(chunk_size_bytes))
+        failed = threading.Event()
+        progress_lock = threading.Lock()
+        completed = [total_chunks - len(pending)]
+        futures = []
+
+        encrypt_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.settings.encrypt_workers, thread_name_prefix="ChunkEncrypt")
+        upload_pool = self._new_upload_pool()
+
+        def upload_stage(payload, chunk_index):
+            try:
+                if failed.is_set():
+                    return False
+                if not self.upload_func(payload, chunk_index):
+                    failed.set()
+                    return False
+                with progress_lock:
+                    completed[0] += 1
+                    done = completed[0]
+                if self.on_progress:
+                    self.on_progress(chunk_index, done, total_chunks)
+                return True
+            except Exception:
+                failed.set()
+                raise
+            finally:
+                in_flight.release()
+
+        def encrypt_stage(chunk_data, chunk_index):
+            try:
+                if failed.is_set():
+                    in_flight.release()
+                    return False
+                payload = self.encrypt_func(chunk_data, chunk_index)
+                # 共享调度器关闭时提交会抛出异常，同样需要归还在途名额
+                futures.append(self._submit_upload(upload_pool, upload_stage, payload, chunk_index))
+            except Exception:
+                failed.set()
+                in_flight.release()
+                raise
+            return True
+
+        try:
+            with open(file_path, 'rb') as f:
+                for chunk_index in pending:
+                    in_flight.acquire()
+                    if failed.is_set():
+                        in_flight.release()
+                        break
+                    f.seek((chunk_index - 1) * chunk_size_bytes)
+                    chunk_data = f.read(chunk_size_bytes)
+                    if not chunk_data:
+                        in_flight.release()
+                        break
+                    futures.append(encrypt_pool.submit(encrypt_stage, chunk_data, chunk_index))
+        finally:
+            # 先等待加密阶段全部提交完上传任务，再等待上传结束
+            encrypt_pool.shutdown(wait=True)
+            self._wait_uploads(upload_pool, futures)
+
+        for future in futures:
+            if future.exception() is not None:
+                failed.set()
+        return not failed.is_set() and completed[0] == total_chunks
+
+    def run_ranges(self, file_path: str, ranges: Sequence[Tuple[int, int]], controller,
+                   total_bytes: Optional[int] = None) -> bool:
+        """按字节区间 [start, end) 上传可变大小的分片，全部成功返回 True
+
+        每片大小取自 controller.next_size()，上传耗时与成败反馈给 controller.record()。
+        此模式下回调参数为字节偏移：
+        encrypt_func(chunk_bytes, offset)、upload_func(payload, offset, length)、
+        on_progress(offset, completed_bytes, total_bytes)。
+        失败的区间最多重试 controller.settings.max_retries 次，仍失败时停止并返回 False。
+        """
+        gaps = deque((start, end, 0) for start, end in ranges if end > start)
+        pending_bytes = sum(end - start for start, end, _ in gaps)
+        if total_bytes is None:
+            total_bytes = pending_bytes
+
+        in_flight = threading.BoundedSemaphore(
+            self.settings.effective_in_flight(controller.settings.max_bytes))
+        failed = threading.Event()
+        cond = threading.Condition()
+        state = {'outstanding': 0, 'completed': total_bytes - pending_bytes}
+        max_retries = controller.settings.max_retries
+        futures = []
+
+        encrypt_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.settings.encrypt_workers, thread_name_prefix="ChunkEncrypt")
+        upload_pool = self._new_upload_pool()
+
+        def finish(offset, length, attempts, ok):
+            """区间结束：成功计入进度，失败时放回队首重试或终止整个上传"""
+            with cond:
+                state['outstanding'] -= 1
+                if ok:
+                    state['completed'] += length
+                elif not failed.is_set():
+                    if attempts < max_retries:
+                        gaps.appendleft((offset, offset + length, attempts + 1))
+                    else:
+                        failed.set()
+                done = state['completed']
+                cond.notify_all()
+            in_flight.release()
+            if ok and self.on_progress:
+                self.on_progress(offset, done, total_bytes)
+
+        def upload_stage(payload, offset, length, attempts):
+            ok = False
+            try:
+                if failed.is_set():
+                    return False
+                started = time.monotonic()
+                try:
+                    ok = bool(self.upload_func(payload, offset, length))
+                except Exception:
+                    ok = False
+                controller.record(length, time.monotonic() - started, ok)
+                return ok
+            finally:
+                finish(offset, length, attempts, ok)
+
+        def encrypt_stage(chunk_data, offset, attempts):
+            try:
+                if failed.is_set():
+                    finish(offset, len(chunk_data), attempts, False)
+                    return False
+                payload = self.encrypt_func(chunk_data, offset)
+                futures.append(self._submit_upload(upload_pool, upload_stage, payload, offset,
+                                                   len(chunk_data), attempts))
+            except Exception:
+                failed.set()
+                finish(offset, len(chunk_data), attempts, False)
+                raise
+            return True
+
+        try:
+            with open(file_path, 'rb') as f:
+                while True:
+                    in_flight.acquire()
+                    with cond:
+                        # 区间都已发出但仍有分片在途时等待：在途分片失败会把区间放回队列
+                        while not failed.is_set() and not gaps and state['outstanding'] > 0:
+                            cond.wait()
+                        if failed.is_set() or not gaps:
+                            in_flight.release()
+                            break
+                        start, end, attempts = gaps.popleft()
+                        length = min(controller.next_size(), end - start)
+                        if start + length < end:
+                            gaps.appendleft((start + length, end, attempts))
+                        state['outstanding'] += 1
+                    f.seek(start)
+                    chunk_data = f.read(length)
+                    if len(chunk_data) != length:
+                        failed.set()
+                        finish(start, length, attempts, False)
+                        break
+                    futures.append(encrypt_pool.submit(encrypt_stage, chunk_data, start, attempts))
+        finally:
+            encrypt_pool.shutdown(wait=True)
+            self._wait_uploads(upload_pool, futures)
+
+        for future in futures:
+            if future.exception() is not None:
+                failed.set()
+        return not failed.is_set() and state['completed'] == total_bytes
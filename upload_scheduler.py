@@ -0,0 +1,189 @@
+# upload_scheduler.py
+"""
+上传任务调度 - 剪切板变化去抖合并 + 有界工作线程池
+
+- submit(): 手动选择的文件等普通任务，直接进入线程池排队
+- submit_coalesced(): 剪切板变化任务；去抖窗口内的连续变化只保留最后一次，
+  窗口结束后才派发。排队任务已达上限时继续保留最新一次变化，待队列回落后再派发
+- 监听线程只负责登记任务，加密与网络请求全部在固定数量的工作线程中执行
+- 任务可带优先级（见 transfer_scheduler）：文本与小文件交给 TransferScheduler 按类别执行，
+  剪切板文本不受排队上限约束；大文件任务只负责协调，在本调度器自己的线程中运行，
+  其分片再以 PRIORITY_BULK 提交给同一个 TransferScheduler
+"""
+
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from transfer_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SMALL, TransferScheduler
+
+# (函数, 参数) 或 (函数, 参数, 优先级)；未指定优先级时按 PRIORITY_SMALL 处理
+Task = Union[Tuple[Callable, tuple], Tuple[Callable, tuple, int]]
+
+
+def _unpack(task: Task) -> Tuple[Callable, tuple, int]:
+    if len(task) == 3:
+        return task
+    fn, args = task
+    return fn, args, PRIORITY_SMALL
+
+
+@dataclass
+class SchedulerState:
+    """调度器当前负载（用于界面显示背压状态）"""
+    running: int
+    queued: int
+    coalesced_waiting: bool
+    limit: int
+
+    @property
+    def saturated(self) -> bool:
+        return self.running + self.queued >= self.limit
+
+
+class UploadScheduler:
+    """上传任务调度器（线程安全）"""
+
+    def __init__(self, workers: int = 3, debounce_seconds: float = 0.4, queue_limit: int = 16,
+                 on_state: Optional[Callable[[SchedulerState], None]] = None,
+                 transfer: Optional[TransferScheduler] = None):
+        self.workers = max(1, workers)
+        self.debounce_seconds = debounce_seconds
+        self.queue_limit = max(self.workers, queue_limit)
+        self.on_state = on_state
+        # 可重入：已取消的任务在 add_done_callback 中可能同步回调，此时派发方仍持有锁
+        self.lock = threading.RLock()
+        # 大文件协调任务的线程池；其余任务按优先级交给 transfer 执行
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="UploadWorker")
+        self._owns_transfer = transfer is None
+        self.transfer = transfer or TransferScheduler(name="UploadTransfer")
+        self._running = 0
+        self._queued = 0
+        self._latest: Optional[List[Task]] = None
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, config, on_state=None, transfer=None) -> 'UploadScheduler':
+        section = config['DEFAULT']
+        try:
+            workers = int(section.get('upload_task_workers', 3))
+            debounce = float(section.get('clipboard_debounce_seconds', 0.4))
+            queue_limit = int(section.get('upload_task_queue_limit', 16))
+        except (TypeError, ValueError):
+            workers, debounce, queue_limit = 3, 0.4, 16
+        return cls(workers, debounce, queue_limit, on_state, transfer)
+
+    def state(self) -> SchedulerState:
+        with self.lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> SchedulerState:
+        return SchedulerState(self._running, self._queued, self._latest is not None, self.queue_limit)
+
+    def _notify(self, state: SchedulerState):
+        if self.on_state:
+            try:
+                self.on_state(state)
+            except Exception as e:
+                print(f"调度状态回调出错: {e}")
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_SMALL) -> bool:
+        """提交普通任务；调度器已关闭时返回 False"""
+        with self.lock:
+            if self._closed:
+                return False
+            self._dispatch_locked([(fn, args, priority)])
+            state = self._state_locked()
+        self._notify(state)
+        return True
+
+    def submit_coalesced(self, tasks: Sequence[Task]):
+        """提交一次剪切板变化（可含多个任务，如复制的多个文件），覆盖尚未派发的上一次变化"""
+        with self.lock:
+            if self._closed:
+                return
+            self._latest = list(tasks)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_seconds, self._on_debounce_elapsed)
+            self._timer.daemon = True
+            self._timer.start()
+            state = self._state_locked()
+        self._notify(state)
+
+    def _on_debounce_elapsed(self):
+        with self.lock:
+            self._timer = None
+            self._flush_latest_locked()
+            state = self._state_locked()
+        self._notify(state)
+
+    def _flush_latest_locked(self):
+        """去抖窗口已过且队列未满时派发最新一次变化；否则继续保留，等任务完成后再尝试
+
+        只含交互任务（剪切板文本）的变化不受排队上限约束，文件积压时文本照常立即上传。
+        """
+        if self._latest is None or self._timer is not None or self._closed:
+            return
+        interactive_only = all(_unpack(task)[2] == PRIORITY_INTERACTIVE for task in self._latest)
+        if not interactive_only and self._running + self._queued >= self.queue_limit:
+            return
+        tasks, self._latest = self._latest, None
+        self._dispatch_locked(tasks)
+
+    def _dispatch_locked(self, tasks: List[Task]):
+        for task in tasks:
+            fn, args, priority = _unpack(task)
+            # 提交成功后才计入排队数（_run 需先取得锁，不会早于此处计数）
+            try:
+                if priority == PRIORITY_BULK:
+                    future = self._executor.submit(self._run, fn, args)
+                else:
+                    future = self.transfer.submit(self._run, fn, args, priority=priority)
+            except RuntimeError as e:
+                print(f"上传任务提交失败: {e}")
+                continue
+            self._queued += 1
+            future.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, future: concurrent.futures.Future):
+        """排队中被取消的任务不会进入 _run，在此归还排队计数"""
+        if not future.cancelled():
+            return
+        with self.lock:
+            self._queued -= 1
+            self._flush_latest_locked()
+            state = self._state_locked()
+        self._notify(state)
+
+    def _run(self, fn: Callable, args: tuple):
+        with self.lock:
+            self._queued -= 1
+            self._running += 1
+            state = self._state_locked()
+        self._notify(state)
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"上传任务出错: {e}")
+        finally:
+            with self.lock:
+                self._running -= 1
+                self._flush_latest_locked()
+                state = self._state_locked()
+            self._notify(state)
+
+    def shutdown(self, wait: bool = False):
+        """停止接收任务，丢弃尚未派发的剪切板变化"""
+        with self.lock:
+            self._closed = True
+            self._latest = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self._executor.shutdown(wait=wait)
+        if self._owns_transfer:
+            self.transfer.shutdown(wait=wait)